@@ -61,6 +61,52 @@ def load(path, has_ids=True, has_header=True, has_labels=True, delimiter=","):
     dataframe = pd.read_csv(path, index_col=id_col, header=header, 
                             delimiter=delimiter)
     
+    return _to_dataset(dataframe, has_labels)
+
+def load_chunks(path, chunksize, has_ids=True, has_header=True, 
+                has_labels=True, delimiter=","):
+    """
+    Loads a data set from a delimited text file a fixed number of samples at 
+    a time, so that files larger than memory can be processed, e.g. with 
+    NaiveBayes.fit_stream.
+    
+    Args:
+      path: 
+        the path to the file containing the data set.
+      chunksize: int
+        the maximum number of samples in each chunk.
+      has_ids: boolean
+        set to False if the first column in the loaded dataset should not be 
+        interpreted as a feature instead of sample identifiers.  Defaults to 
+        True, i.e. first column are interpreted as sample identifiers.
+      has_header: boolean
+        set to False if the data being loaded does not have column headers on 
+        the first line.  Defaults to true.
+      has_labels: boolean
+        set to False if the data being loaded does not have classification 
+        labels for each sample.  Defaults to True.  The labels should be the 
+        last column in the dataset being loaded.
+      delimiter: string
+        the symbol used to separate columns in the file.  Default value is 
+        ','.  Hint: delimiter for tab-delimited files is '\t'.
+      
+    Returns:
+      A generator of DataSet objects, each holding the next chunksize 
+      samples of the file.  Only one chunk is read into memory at a time.
+    """
+    header = 0 if has_header else None
+    id_col = 0 if has_ids else None
+    
+    reader = pd.read_csv(path, index_col=id_col, header=header, 
+                         delimiter=delimiter, chunksize=chunksize)
+    for dataframe in reader:
+        yield _to_dataset(dataframe, has_labels)
+
+def _to_dataset(dataframe, has_labels):
+    """
+    Creates a DataSet from a loaded DataFrame, taking the labels from its 
+    last column if it has them.
+    """
     labels = dataframe.pop(dataframe.columns[-1]) if has_labels else None
 
     return model.DataSet(dataframe, labels=labels)
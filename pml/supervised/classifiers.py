@@ -23,11 +23,19 @@ Classification algorithms for supervised learning tasks.
 @author: drusk
 """
 
+import multiprocessing
+
+import numpy as np
 import pandas as pd
 
 from pml.data import model
 from pml.utils.errors import UnlabelledDataSetError, InconsistentFeaturesError
 
+# The classifier used by a worker process during a parallel classify_all.  
+# It is set once when the worker starts rather than being sent with every 
+# shard of data.
+_worker_classifier = None
+
 class AbstractClassifier(object):
     """
     This is the base class which classification algorithms should extend.  It 
@@ -65,20 +73,86 @@ class AbstractClassifier(object):
         """
         return self.__str__()
 
-    def classify_all(self, dataset):
+    def classify_all(self, dataset, n_jobs=1):
         """
         Predicts the classification of each sample in a dataset.
         
         Args:
           dataset: DataSet compatible object (see DataSet constructor)
             the dataset whose samples (observations) will be classified.
+          n_jobs: int
+            The number of processes to classify with.  The samples are split 
+            into that many shards by row and each process receives a copy of 
+            the classifier once, when it starts.  Use -1 for one process per 
+            CPU.  Defaults to 1, i.e. classify in the current process.
             
         Returns:
           A ClassifiedDataSet which contains the classification results for 
           each sample.  It also contains the original data.
         """
         dataset = model.as_dataset(dataset)
-        return ClassifiedDataSet(dataset, dataset.reduce_rows(self.classify))
+        
+        if n_jobs < 0:
+            n_jobs = multiprocessing.cpu_count()
+        n_jobs = min(n_jobs, dataset.num_samples())
+        
+        if n_jobs > 1:
+            classifications = self._classify_all_in_parallel(dataset, n_jobs)
+        else:
+            classifications = self._classify_all(dataset)
+            
+        return ClassifiedDataSet(dataset, classifications)
+
+    def _classify_all_in_parallel(self, dataset, n_jobs):
+        """
+        Classifies a dataset by sharding its samples across a pool of 
+        processes.
+        
+        Args:
+          dataset: model.DataSet
+            the dataset whose samples will be classified.
+          n_jobs: int
+            The number of processes, and shards, to use.
+            
+        Returns:
+          A pandas Series with each sample's classification, in the same 
+          order as the samples in the dataset.
+        """
+        data_frame = dataset.get_data_frame()
+        boundaries = np.linspace(0, dataset.num_samples(), n_jobs + 1)
+        boundaries = boundaries.astype(int)
+        shards = [data_frame.iloc[start:end] 
+                  for start, end in zip(boundaries[:-1], boundaries[1:])]
+        
+        pool = multiprocessing.Pool(n_jobs, initializer=_init_worker, 
+                                    initargs=(self, ))
+        try:
+            results = pool.map(_classify_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+        
+        # Pool.map keeps the shards in order, so concatenating restores the 
+        # original sample order.
+        return pd.concat(results)
+
+    def _classify_all(self, dataset):
+        """
+        Predicts the classification of each sample in a dataset.
+        
+        By default each sample is classified individually.  Classifiers which 
+        can process a whole dataset more efficiently should override this 
+        method.
+        
+        Args:
+          dataset: model.DataSet
+            the dataset whose samples will be classified.
+            
+        Returns:
+          A pandas Series with each sample's classification, indexed by 
+          sample id.
+        """
+        return dataset.reduce_rows(self.classify)
         
     def classify(self, sample):
         """
@@ -112,14 +186,34 @@ class AbstractClassifier(object):
         Raises an InconsistentFeaturesError if the sample does not have 
         the same features as the training data.
         """
+        self._check_features(sample.index.tolist())
+
+    def _check_features(self, actual_features):
+        """
+        Raises an InconsistentFeaturesError if the provided list of features 
+        does not match those of the training data.
+        """
         expected_features = self.training_set.feature_list()
-        actual_features = sample.index.tolist()
         
         if set(expected_features) != set(actual_features):
             raise InconsistentFeaturesError(expected_features, 
                                             actual_features)
         
 
+def _init_worker(classifier):
+    """
+    Initializes a worker process for a parallel classify_all.
+    """
+    global _worker_classifier
+    _worker_classifier = classifier
+
+def _classify_shard(data_frame):
+    """
+    Classifies one shard of a dataset in a worker process.
+    """
+    return _worker_classifier._classify_all(model.DataSet(data_frame))
+
+
 class ClassifiedDataSet(model.DataSet):
     """
     A collection of data which has been analysed by a classification 
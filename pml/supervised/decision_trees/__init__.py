@@ -18,9 +18,12 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
 # IN THE SOFTWARE.
 """
-Make the DecisionTree class importable from here.
+Make the DecisionTree, RandomForest and GradientBoostedTrees classes 
+importable from here.
 
 @author: drusk
 """
 
 from pml.supervised.decision_trees.interface import DecisionTree
+from pml.supervised.decision_trees.forest import RandomForest
+from pml.supervised.decision_trees.boosting import GradientBoostedTrees
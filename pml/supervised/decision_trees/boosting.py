@@ -0,0 +1,561 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Gradient boosted decision trees built from feature histograms.
+
+@author: drusk
+"""
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from pml.data import model
+from pml.supervised.classifiers import AbstractClassifier
+from pml.supervised.decision_trees.encoding import quantile_bin_edges
+
+# Missing values are put in the last bin, so they always follow the right 
+# branch of a split.
+MISSING_BIN = 255
+
+NUM_BINS = MISSING_BIN + 1
+
+class GradientBoostedTrees(AbstractClassifier):
+    """
+    Gradient boosted trees classifier.
+    
+    Builds a sequence of small regression trees.  Each tree is fitted to the 
+    gradient of the log loss of the trees before it, so it corrects their 
+    mistakes.  Two classes need one tree per iteration (logistic loss), 
+    more classes need one per class (softmax loss).
+    
+    Every numeric feature is binned into at most 255 quantile bins once, 
+    before training, and the samples are stored as a uint8 matrix of bins.  
+    Each node of a tree then sums the gradients in a histogram per feature, 
+    which takes one pass over its samples, and finds the best split in the 
+    histograms.  Only the smaller child of a split is histogrammed; the 
+    other child's histograms are its parent's minus its sibling's.
+    """
+    
+    def __init__(self, training_set, num_iterations=100, learning_rate=0.1, 
+                 max_leaf_nodes=31, max_depth=None, min_samples_leaf=20, 
+                 l2_regularization=0.0, max_bins=255, 
+                 early_stopping_rounds=None, validation_fraction=0.1, 
+                 validation_set=None):
+        """
+        Constructs a new gradient boosted trees classifier.
+        
+        Args:
+          training_set: model.DataSet
+            The training data.  All features must be numeric; missing 
+            values are allowed.
+          num_iterations: int
+            The maximum number of boosting iterations.  Default value is 
+            100.
+          learning_rate: float
+            Shrinks the contribution of each tree.  Smaller values need more 
+            iterations but usually generalize better.  Default value is 0.1.
+          max_leaf_nodes: int
+            The maximum number of leaves in each tree.  Trees are grown by 
+            splitting the leaf with the best split first.  Default value is 
+            31.
+          max_depth: int
+            The maximum depth of each tree.  Defaults to None, i.e. trees are 
+            limited by max_leaf_nodes only.
+          min_samples_leaf: int
+            The minimum number of training samples in a leaf.  Default value 
+            is 20.
+          l2_regularization: float
+            Penalizes large leaf values.  Default value is 0.
+          max_bins: int
+            The maximum number of bins for each feature's non-missing values, 
+            between 2 and 255.  Default value is 255.
+          early_stopping_rounds: int
+            If set, training stops once the log loss on a validation set 
+            hasn't improved for this many iterations, and only the trees up 
+            to the best iteration are kept.  Defaults to None, i.e. no early 
+            stopping.
+          validation_fraction: float
+            The fraction of the training set split off, with 
+            DataSet.split, as the validation set for early stopping.  Each 
+            label is split in the same proportion.  Default value is 0.1.
+          validation_set: model.DataSet
+            A labelled validation set to use for early stopping instead of 
+            splitting the training set.  Defaults to None.
+            
+        Raises:
+          UnlabelledDataSetError if the training set is not labelled.
+          
+          ValueError if a feature isn't numeric or max_bins is out of range, 
+          or if early_stopping_rounds is set and validation_fraction isn't 
+          between 0 and 1 or the validation set is empty.
+        """
+        super(GradientBoostedTrees, self).__init__(training_set)
+        if not 2 <= max_bins <= MISSING_BIN:
+            raise ValueError("max_bins must be between 2 and %d." % 
+                             MISSING_BIN)
+        
+        self.learning_rate = learning_rate
+        self.max_leaf_nodes = max_leaf_nodes
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.l2_regularization = l2_regularization
+        
+        if early_stopping_rounds is not None:
+            if validation_set is None:
+                if not 0 < validation_fraction < 1:
+                    raise ValueError("validation_fraction must be between 0 "
+                                     "and 1.")
+                training_set, validation_set = training_set.split(
+                                1 - validation_fraction, using_labels=True)
+            if validation_set.num_samples() == 0:
+                raise ValueError("Early stopping requires a non-empty "
+                                 "validation set.")
+        
+        features = training_set.feature_list()
+        matrix = _as_matrix(training_set.get_data_frame())
+        self._bin_edges = [quantile_bin_edges(column[~np.isnan(column)], 
+                                              max_bins) 
+                           for column in matrix.T]
+        bins = self._bin(matrix)
+        
+        label_codes, self._classes = pd.factorize(
+                                        training_set.get_labels().values)
+        num_classes = len(self._classes)
+        targets = _one_hot(label_codes, num_classes)
+        if num_classes == 2:
+            # One tree per iteration, predicting the log odds of the second 
+            # class
+            targets = targets[:, 1:]
+        
+        prior = np.clip(targets.mean(axis=0), 1e-15, 1 - 1e-15)
+        if num_classes == 2:
+            self._baseline = np.log(prior / (1 - prior))
+        else:
+            self._baseline = np.log(prior)
+        raw_predictions = np.tile(self._baseline, (len(bins), 1))
+        
+        if validation_set is not None:
+            validation_bins = self._bin(_as_matrix(
+                            validation_set.get_data_frame()[features]))
+            validation_targets = self._encode_targets(
+                                    validation_set.get_labels().values)
+            validation_predictions = np.tile(self._baseline, 
+                                             (len(validation_bins), 1))
+        
+        self._trees = []
+        self.validation_losses = []
+        best_loss = np.inf
+        best_iteration = 0
+        for iteration in range(num_iterations):
+            probabilities = self._to_probabilities(raw_predictions)
+            gradients = probabilities - targets
+            hessians = np.maximum(probabilities * (1 - probabilities), 1e-16)
+            
+            trees = []
+            for output in range(targets.shape[1]):
+                tree, leaf_rows = self._grow_tree(bins, gradients[:, output], 
+                                                  hessians[:, output])
+                for leaf, rows in leaf_rows:
+                    raw_predictions[rows, output] += tree.value[leaf]
+                trees.append(tree)
+            self._trees.append(trees)
+            
+            if early_stopping_rounds is None:
+                continue
+            
+            for output, tree in enumerate(trees):
+                validation_predictions[:, output] += tree.predict(
+                                                        validation_bins)
+            loss = _log_loss(self._to_probabilities(validation_predictions), 
+                             validation_targets)
+            self.validation_losses.append(loss)
+            if loss < best_loss:
+                best_loss = loss
+                best_iteration = iteration
+            elif iteration - best_iteration >= early_stopping_rounds:
+                break
+        
+        if early_stopping_rounds is not None:
+            self._trees = self._trees[:best_iteration + 1]
+    
+    def __str__(self):
+        return ("GradientBoostedTrees with %d iterations" % 
+                self.num_iterations())
+    
+    def num_iterations(self):
+        """
+        Returns:
+          The number of boosting iterations kept after training.
+        """
+        return len(self._trees)
+    
+    def get_classification_probabilities(self, dataset):
+        """
+        Calculates the probability of each class for each sample in a 
+        dataset.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            The samples to classify.
+            
+        Returns:
+          A pandas DataFrame indexed by sample id with a column for each 
+          class.  Each row sums to 1.
+        """
+        dataset = model.as_dataset(dataset)
+        self._check_features(dataset.feature_list())
+        probabilities = self._predict_probabilities(dataset)
+        return pd.DataFrame(probabilities, 
+                            index=dataset.get_data_frame().index, 
+                            columns=self._classes)
+    
+    def _classify(self, sample):
+        """
+        Predicts a sample's classification.
+        
+        Args:
+          sample: 
+            The sample or observation to be classified.
+          
+        Returns:
+          The sample's classification.
+        """
+        dataset = model.DataSet(pd.DataFrame([sample]))
+        return self._classes[np.argmax(self._predict_probabilities(dataset))]
+    
+    def _classify_all(self, dataset):
+        """
+        Predicts the classification of every sample in a dataset at once.
+        
+        Args:
+          dataset: model.DataSet
+            the dataset whose samples will be classified.
+            
+        Returns:
+          A pandas Series with each sample's classification, indexed by 
+          sample id.
+          
+        Raises:
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        self._check_features(dataset.feature_list())
+        probabilities = self._predict_probabilities(dataset)
+        return pd.Series(self._classes[np.argmax(probabilities, axis=1)], 
+                         index=dataset.get_data_frame().index)
+    
+    def _predict_probabilities(self, dataset):
+        """
+        Returns:
+          A 2d numpy array with a row for each sample and a column for each 
+          class.
+        """
+        data_frame = dataset.get_data_frame()
+        features = self.training_set.feature_list()
+        bins = self._bin(_as_matrix(data_frame[features]))
+        raw_predictions = np.tile(self._baseline, (len(bins), 1))
+        for trees in self._trees:
+            for output, tree in enumerate(trees):
+                raw_predictions[:, output] += tree.predict(bins)
+        
+        probabilities = self._to_probabilities(raw_predictions)
+        if len(self._classes) == 2:
+            probabilities = np.hstack((1 - probabilities, probabilities))
+        return probabilities
+    
+    def _encode_targets(self, labels):
+        """
+        Encodes labels in the same way as the training labels.
+        """
+        codes = pd.Index(self._classes).get_indexer(labels)
+        targets = _one_hot(codes, len(self._classes))
+        return targets[:, 1:] if len(self._classes) == 2 else targets
+    
+    def _to_probabilities(self, raw_predictions):
+        """
+        Converts raw predictions to probabilities with the logistic function 
+        for two classes or softmax for more.
+        """
+        if len(self._classes) == 2:
+            return 1 / (1 + np.exp(-raw_predictions))
+        
+        exponentials = np.exp(raw_predictions - 
+                              raw_predictions.max(axis=1)[:, np.newaxis])
+        return exponentials / exponentials.sum(axis=1)[:, np.newaxis]
+    
+    def _bin(self, matrix):
+        """
+        Returns:
+          A uint8 matrix with the bin of each value in a float matrix.
+        """
+        bins = np.empty(matrix.shape, dtype=np.uint8)
+        for feature, edges in enumerate(self._bin_edges):
+            column = matrix[:, feature]
+            bins[:, feature] = np.searchsorted(edges, column)
+            bins[np.isnan(column), feature] = MISSING_BIN
+        return bins
+    
+    def _grow_tree(self, bins, gradients, hessians):
+        """
+        Grows a regression tree, splitting the leaf with the largest gain 
+        first.
+        
+        Returns:
+          tree: _HistogramTree
+            The tree, with leaf values already shrunk by the learning rate.
+          leaf_rows: list
+            A (leaf, rows) tuple for each leaf, with the rows of the training 
+            samples which reach it.
+        """
+        tree = _HistogramTree()
+        rows = np.arange(len(bins))
+        root = tree.add_node()
+        histograms = _build_histograms(bins, gradients, hessians, rows)
+        
+        # Leaves which might still be split, ordered by gain.  The node 
+        # number breaks ties so that the order doesn't depend on the heap.
+        splittable = []
+        leaf_rows = []
+        self._push_split(splittable, leaf_rows, root, rows, histograms, 0)
+        num_leaves = 1
+        
+        while splittable and num_leaves < self.max_leaf_nodes:
+            _, node, rows, histograms, depth, (feature, bin_) = \
+                heapq.heappop(splittable)
+            
+            goes_left = bins[rows, feature] <= bin_
+            left_rows = rows[goes_left]
+            right_rows = rows[~goes_left]
+            
+            # Histogram the smaller child and subtract to get the larger
+            if len(left_rows) < len(right_rows):
+                left_histograms = _build_histograms(bins, gradients, 
+                                                    hessians, left_rows)
+                right_histograms = histograms - left_histograms
+            else:
+                right_histograms = _build_histograms(bins, gradients, 
+                                                     hessians, right_rows)
+                left_histograms = histograms - right_histograms
+            
+            left, right = tree.split(node, feature, bin_)
+            num_leaves += 1
+            self._push_split(splittable, leaf_rows, left, left_rows, 
+                             left_histograms, depth + 1)
+            self._push_split(splittable, leaf_rows, right, right_rows, 
+                             right_histograms, depth + 1)
+        
+        # Leaves which were never split
+        leaf_rows.extend((node, rows) 
+                         for _, node, rows, _, _, _ in splittable)
+        
+        for node, rows in leaf_rows:
+            gradient_sum = gradients[rows].sum()
+            hessian_sum = hessians[rows].sum()
+            tree.value[node] = (-self.learning_rate * gradient_sum / 
+                                (hessian_sum + self.l2_regularization))
+        
+        return tree, leaf_rows
+    
+    def _push_split(self, splittable, leaf_rows, node, rows, histograms, 
+                    depth):
+        """
+        Finds a leaf's best split and queues it, or records the leaf as 
+        final if it can't be split.
+        """
+        split = None
+        if ((self.max_depth is None or depth < self.max_depth) and 
+            len(rows) >= 2 * self.min_samples_leaf):
+            split = self._find_split(histograms)
+        
+        if split is None:
+            leaf_rows.append((node, rows))
+        else:
+            gain, feature, bin_ = split
+            heapq.heappush(splittable, (-gain, node, rows, histograms, depth, 
+                                        (feature, bin_)))
+    
+    def _find_split(self, histograms):
+        """
+        Finds the best split in a node's histograms.  Samples in bins up to 
+        and including the split bin go left.
+        
+        Args:
+          histograms: numpy array
+            The gradient, hessian and count histograms, with shape 
+            (3, features, NUM_BINS).
+            
+        Returns:
+          A (gain, feature, bin) tuple, or None if no split has a positive 
+          gain and enough samples on both sides.
+        """
+        left = np.cumsum(histograms, axis=2)[:, :, :-1]
+        totals = histograms[:, 0, :].sum(axis=1)
+        right = totals[:, np.newaxis, np.newaxis] - left
+        
+        gradient, hessian, count = totals
+        l2 = self.l2_regularization
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gains = (left[0] ** 2 / (left[1] + l2) + 
+                     right[0] ** 2 / (right[1] + l2) - 
+                     gradient ** 2 / (hessian + l2))
+        
+        min_samples = max(self.min_samples_leaf, 1)
+        valid = (left[2] >= min_samples) & (right[2] >= min_samples)
+        gains = np.where(valid, gains, -np.inf)
+        
+        # Ties go to the first feature, then the first bin
+        feature, bin_ = np.unravel_index(np.argmax(gains), gains.shape)
+        if not gains[feature, bin_] > 0:
+            return None
+        return gains[feature, bin_], feature, bin_
+
+
+class _HistogramTree(object):
+    """
+    A binary regression tree which splits on bins, stored in parallel 
+    arrays with one entry per node like a CompiledTree.
+    """
+    
+    def __init__(self):
+        self.feature = []
+        self.bin = []
+        self.left = []
+        self.right = []
+        self.value = []
+    
+    def add_node(self):
+        """
+        Returns:
+          The number of a new leaf.
+        """
+        for array in (self.feature, self.bin, self.left, self.right):
+            array.append(-1)
+        self.value.append(0.0)
+        return len(self.value) - 1
+    
+    def split(self, node, feature, bin_):
+        """
+        Splits a leaf.
+        
+        Returns:
+          The numbers of the new left and right leaves.
+        """
+        left = self.add_node()
+        right = self.add_node()
+        self.feature[node] = feature
+        self.bin[node] = bin_
+        self.left[node] = left
+        self.right[node] = right
+        return left, right
+    
+    def predict(self, bins):
+        """
+        Routes all samples down the tree one level per iteration.
+        
+        Args:
+          bins: numpy array
+            The uint8 bin matrix of the samples.
+            
+        Returns:
+          A numpy array with the value of the leaf each sample reaches.
+        """
+        feature = np.asarray(self.feature)
+        bin_ = np.asarray(self.bin)
+        left = np.asarray(self.left)
+        right = np.asarray(self.right)
+        
+        nodes = np.zeros(len(bins), dtype=int)
+        active = np.arange(len(bins))
+        while len(active) > 0:
+            current = nodes[active]
+            internal = feature[current] >= 0
+            active = active[internal]
+            current = current[internal]
+            
+            goes_left = bins[active, feature[current]] <= bin_[current]
+            nodes[active] = np.where(goes_left, left[current], 
+                                     right[current])
+        
+        return np.asarray(self.value)[nodes]
+
+
+def _as_matrix(data_frame):
+    """
+    Returns:
+      The features of a pandas DataFrame as a float matrix, with NaN for 
+      missing values.
+      
+    Raises:
+      ValueError if a feature isn't numeric.
+    """
+    for feature in data_frame.columns:
+        if data_frame[feature].dtype.kind not in "biuf":
+            raise ValueError("Feature '%s' is not numeric." % feature)
+    return data_frame.values.astype(float)
+
+def _build_histograms(bins, gradients, hessians, rows):
+    """
+    Sums the gradients, hessians and samples in each bin of each feature.
+    
+    Returns:
+      A numpy array with shape (3, features, NUM_BINS).
+    """
+    num_features = bins.shape[1]
+    flat_bins = (bins[rows].astype(int) + 
+                 np.arange(num_features) * NUM_BINS).ravel()
+    size = num_features * NUM_BINS
+    histograms = np.empty((3, size))
+    histograms[0] = np.bincount(flat_bins, 
+                                weights=np.repeat(gradients[rows], 
+                                                  num_features), 
+                                minlength=size)
+    histograms[1] = np.bincount(flat_bins, 
+                                weights=np.repeat(hessians[rows], 
+                                                  num_features), 
+                                minlength=size)
+    histograms[2] = np.bincount(flat_bins, minlength=size)
+    return histograms.reshape(3, num_features, NUM_BINS)
+
+def _one_hot(codes, num_codes):
+    """
+    Returns:
+      A 2d float array with a row for each code which is 1 in the code's 
+      column and 0 elsewhere.  Codes of -1 give rows of zeros.
+    """
+    one_hot = np.zeros((len(codes), num_codes))
+    known = codes >= 0
+    one_hot[np.nonzero(known)[0], codes[known]] = 1
+    return one_hot
+
+def _log_loss(probabilities, targets):
+    """
+    Calculates the mean log loss of probabilities against one-hot targets.  
+    For two classes there is one column, the probability of the second 
+    class.
+    """
+    probabilities = np.clip(probabilities, 1e-15, 1 - 1e-15)
+    if targets.shape[1] == 1:
+        losses = (targets * np.log(probabilities) + 
+                  (1 - targets) * np.log(1 - probabilities))
+    else:
+        losses = targets * np.log(probabilities)
+    return -losses.sum() / len(targets)
@@ -0,0 +1,422 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Builds decision trees node by node, in the current process or in parallel.
+
+@author: drusk
+"""
+
+import heapq
+import multiprocessing
+
+import numpy as np
+
+from pml.supervised.decision_trees.encoding import EncodedDataSet
+from pml.supervised.decision_trees.trees import Node, Tree
+
+# Seeds for the random state of each node are drawn below this.
+_MAX_SEED = 2 ** 31 - 1
+
+_worker_builder = None
+
+class AbstractTreeBuilder(object):
+    """
+    Base class for decision tree building algorithms.
+    
+    A tree is grown from tasks, each holding the samples which reach one 
+    node.  A task is a tuple whose first element is the array of rows of 
+    those samples.  Expanding a task looks for the best split, then creates 
+    either a leaf or a node with a task for each of its children.  
+    Subclasses decide what else a task holds and how splits are found and 
+    made.
+    
+    The training data is encoded once, so one builder can build many trees, 
+    each from a different sample of its rows.
+    """
+    
+    def __init__(self, dataset, max_features=None, max_depth=None, 
+                 min_samples_split=2, min_gain=None, max_leaf_nodes=None):
+        """
+        Constructs a new builder.
+        
+        Args:
+          dataset: model.DataSet
+            The data for which decision trees will be built.
+          max_features: int
+            If set, each node only considers splitting on this many of its 
+            candidate features, chosen at random.  Defaults to None, i.e. 
+            all candidate features are considered.
+          max_depth: int
+            If set, nodes at this depth become leaves.  The root is at depth 
+            0.  Defaults to None.
+          min_samples_split: int
+            Nodes with fewer samples than this become leaves.  Default value 
+            is 2.
+          min_gain: float
+            If set, nodes whose best split has a smaller gain than this 
+            become leaves.  Defaults to None.
+          max_leaf_nodes: int
+            If set, the tree is grown best first, always splitting the node 
+            whose split has the largest gain, until no split fits within 
+            this many leaves.  Defaults to None, i.e. the tree is grown 
+            depth first without a limit on its leaves.
+        """
+        self.encoded = EncodedDataSet(dataset)
+        self.max_features = max_features
+        self.max_depth = max_depth
+        self.min_samples_split = min_samples_split
+        self.min_gain = min_gain
+        self.max_leaf_nodes = max_leaf_nodes
+    
+    def build(self, n_jobs=1, rows=None, random_state=None):
+        """
+        Builds a tree.
+        
+        Args:
+          n_jobs: int
+            The number of processes to build with.  Near the root the 
+            candidate splits of each node are scored in parallel.  Once 
+            there are at least n_jobs nodes still to expand, their subtrees 
+            are built in parallel.  Trees grown best first are only scored 
+            in parallel.  Each process receives a copy of the builder once, 
+            when it starts.  The tree is the same as one built in the 
+            current process.  Use -1 for one process per CPU.  Defaults to 
+            1, i.e. build in the current process.
+          rows: numpy array
+            The rows of the samples to build the tree from.  Rows may be 
+            repeated, e.g. for a bootstrap sample.  Defaults to None, i.e. 
+            every sample once.
+          random_state: int
+            Seeds the choice of features when max_features is set.  
+            Defaults to None.
+            
+        Returns:
+          tree: Tree
+            The decision tree that was built.
+        """
+        if n_jobs < 0:
+            n_jobs = multiprocessing.cpu_count()
+        
+        if rows is None:
+            rows = np.arange(self.encoded.num_samples())
+        
+        if self.max_features is None:
+            random_state = None
+        else:
+            random_state = np.random.RandomState(random_state)
+        
+        root_task = (self._get_root_task(rows), random_state, 0)
+        if n_jobs <= 1:
+            if self.max_leaf_nodes is None:
+                return Tree(self._build_subtree(root_task))
+            return Tree(self._build_best_first(root_task, self._score_all))
+        
+        pool = multiprocessing.Pool(n_jobs, initializer=_init_worker, 
+                                    initargs=(self, ))
+        try:
+            if self.max_leaf_nodes is None:
+                root = self._build_in_parallel(root_task, pool, n_jobs)
+            else:
+                root = self._build_best_first(
+                                root_task, _pool_scorer(pool, n_jobs))
+        finally:
+            pool.close()
+            pool.join()
+        
+        return Tree(root)
+    
+    def _build_in_parallel(self, root_task, pool, n_jobs):
+        """
+        Expands nodes level by level, scoring their splits in the pool, until 
+        the tree is wide enough to build the remaining subtrees in the pool.
+        
+        Returns:
+          The root node of the tree.
+        """
+        score_all = _pool_scorer(pool, n_jobs)
+        root, children = self._expand_task(root_task, score_all)
+        frontier = [(root, branch, task) for branch, task in children]
+        while 0 < len(frontier) < n_jobs:
+            next_frontier = []
+            for parent, branch, task in frontier:
+                node, children = self._expand_task(task, score_all)
+                parent.add_child(branch, node)
+                next_frontier.extend((node, child_branch, child_task) 
+                                     for child_branch, child_task in children)
+            frontier = next_frontier
+        
+        # Pool.map keeps the subtrees in the same order as their tasks.
+        subtrees = pool.map(_build_subtree_in_worker, 
+                            [task for _, _, task in frontier])
+        for (parent, branch, _), subtree in zip(frontier, subtrees):
+            parent.add_child(branch, subtree.get_root_node())
+        
+        return root
+    
+    def _build_subtree(self, task):
+        """
+        Builds the subtree for a task depth first in the current process.  
+        The nodes still to be expanded are kept on an explicit stack, so 
+        the depth of the tree isn't limited by Python's recursion limit.
+        
+        Returns:
+          The root node of the subtree.
+        """
+        root, children = self._expand_task(task, self._score_all)
+        stack = [(root, branch, child_task) 
+                 for branch, child_task in reversed(children)]
+        while stack:
+            parent, branch, task = stack.pop()
+            node, children = self._expand_task(task, self._score_all)
+            parent.add_child(branch, node)
+            stack.extend((node, child_branch, child_task) 
+                         for child_branch, child_task in reversed(children))
+        return root
+    
+    def _build_best_first(self, root_task, score_all):
+        """
+        Builds a tree by always making the split with the largest gain next, 
+        as long as the tree stays within max_leaf_nodes leaves.
+        
+        Returns:
+          The root node of the tree.
+        """
+        # Splits waiting to be made, ordered by gain.  A counter breaks ties 
+        # in the order the splits were found.
+        queue = []
+        counter = [0]
+        root = [None]
+        
+        def add(parent, branch, task):
+            split = self._find_allowed_split(task, score_all)
+            if split is None:
+                attach(parent, branch, self._make_leaf(task[0]))
+            else:
+                heapq.heappush(queue, (-split[0], counter[0], parent, branch, 
+                                       task, split))
+                counter[0] += 1
+        
+        def attach(parent, branch, node):
+            if parent is None:
+                root[0] = node
+            else:
+                parent.add_child(branch, node)
+        
+        add(None, None, root_task)
+        num_leaves = 1
+        while queue:
+            _, _, parent, branch, task, split = heapq.heappop(queue)
+            node, children = self._apply_split(task, split)
+            if not children:
+                # The split made a leaf, e.g. when every sample was missing 
+                # the feature, so the number of leaves is unchanged.
+                attach(parent, branch, node)
+                continue
+            if num_leaves + len(children) - 1 > self.max_leaf_nodes:
+                attach(parent, branch, self._make_leaf(task[0]))
+                continue
+            
+            attach(parent, branch, node)
+            num_leaves += len(children) - 1
+            for child_branch, child_task in children:
+                add(node, child_branch, child_task)
+        
+        return root[0]
+    
+    def _expand_task(self, task, score_all):
+        """
+        Expands a task, which is paired with the random state and depth of 
+        its node.
+        
+        Returns:
+          node: Node
+            The new node, without children.
+          children: list
+            A (branch, task) tuple for each of the node's children.
+        """
+        split = self._find_allowed_split(task, score_all)
+        if split is None:
+            return self._make_leaf(task[0]), []
+        return self._apply_split(task, split)
+    
+    def _find_allowed_split(self, task, score_all):
+        """
+        Finds the best split for a task, if the node is allowed to be split.
+        
+        Returns:
+          A (gain, split) tuple, or None if the node must be a leaf.
+        """
+        task, random_state, depth = task
+        if self.max_depth is not None and depth >= self.max_depth:
+            return None
+        if len(task[0]) < self.min_samples_split:
+            return None
+        
+        split = self._find_split(task, score_all, random_state)
+        if split is None:
+            return None
+        if self.min_gain is not None and split[0] < self.min_gain:
+            return None
+        return split
+    
+    def _apply_split(self, task, split):
+        """
+        Splits the node for a task.  Each child gets its own random state, 
+        seeded from its parent's, so that the tree doesn't depend on the 
+        order in which nodes are expanded.
+        """
+        task, random_state, depth = task
+        node, children = self._split(task, split[1])
+        
+        if random_state is None:
+            child_states = [None] * len(children)
+        else:
+            seeds = random_state.randint(_MAX_SEED, size=len(children))
+            child_states = [np.random.RandomState(seed) for seed in seeds]
+        
+        return node, [(branch, (child_task, child_state, depth + 1)) 
+                      for (branch, child_task), child_state 
+                      in zip(children, child_states)]
+    
+    def _score_all(self, context, jobs):
+        """
+        Scores candidate splits in the current process.
+        """
+        return [self._score(context, job) for job in jobs]
+    
+    def _sample_features(self, features, random_state):
+        """
+        Chooses the features a node considers splitting on.
+        
+        Args:
+          features: list(int)
+            The node's candidate features.
+          random_state: numpy.random.RandomState
+            The node's random state, or None if features aren't sampled.
+            
+        Returns:
+          A list of at most max_features of the features, in their original 
+          order.
+        """
+        if random_state is None or len(features) <= self.max_features:
+            return features
+        
+        chosen = random_state.choice(len(features), self.max_features, 
+                                     replace=False)
+        return [features[i] for i in np.sort(chosen)]
+    
+    def _make_leaf(self, task):
+        """
+        Creates a leaf with the most common label of a task's samples.  Ties 
+        go to the label which comes first in the training set.
+        """
+        label_counts = self.encoded.label_counts(task[0])
+        return Node(self.encoded.labels[np.argmax(label_counts)])
+    
+    def _get_root_task(self, rows):
+        """
+        Subclasses must implement this method to create the task for the 
+        root node, which the samples in the given rows reach.
+        """
+        raise NotImplementedError(("Tree builders must implement the "
+                                   "'_get_root_task' method."))
+    
+    def _find_split(self, task, score_all, random_state):
+        """
+        Subclasses must implement this method to find the best split for a 
+        task.
+        
+        Args:
+          task:
+            The task for the node.
+          score_all: callable
+            Takes the context shared by a node's candidate splits, e.g. the 
+            rows of its samples, and a list of jobs, and returns the result 
+            of _score for each job, in order.  Candidate splits must be 
+            scored through it so that they can be scored in parallel.
+          random_state: numpy.random.RandomState
+            The node's random state for _sample_features, or None.
+            
+        Returns:
+          A (gain, split) tuple, where split is whatever _split needs to 
+          make the split, or None if the node should be a leaf.
+        """
+        raise NotImplementedError(("Tree builders must implement the "
+                                   "'_find_split' method."))
+    
+    def _split(self, task, split):
+        """
+        Subclasses must implement this method to split the node for a task.
+        
+        Returns:
+          node: Node
+            The new node, without children.
+          children: list
+            A (branch, task) tuple for each of the node's children.
+        """
+        raise NotImplementedError(("Tree builders must implement the "
+                                   "'_split' method."))
+    
+    def _score(self, context, job):
+        """
+        Subclasses must implement this method to score one candidate split.
+        Jobs are sent to other processes, so they should be small, e.g. a 
+        feature's column.  The context is only sent once to each process 
+        scoring a node's splits, so large data such as the node's rows 
+        belong there.  The encoded data set is already in every process.
+        """
+        raise NotImplementedError(("Tree builders must implement the "
+                                   "'_score' method."))
+
+
+def _init_worker(builder):
+    """
+    Initializes a worker process for a parallel build.
+    """
+    global _worker_builder
+    _worker_builder = builder
+
+def _pool_scorer(pool, n_jobs):
+    """
+    Creates a score_all function which scores candidate splits in a pool.  
+    The jobs are divided into one batch per process, so that each process 
+    is only sent the context once rather than with every job.
+    """
+    def score_all(context, jobs):
+        batch_size = max(1, -(-len(jobs) // n_jobs))
+        batches = [(context, jobs[start:start + batch_size]) 
+                   for start in range(0, len(jobs), batch_size)]
+        return [result for batch in pool.map(_score_batch_in_worker, batches) 
+                for result in batch]
+    return score_all
+
+def _score_batch_in_worker(batch):
+    """
+    Scores a batch of candidate splits in a worker process.
+    """
+    context, jobs = batch
+    return _worker_builder._score_all(context, jobs)
+
+def _build_subtree_in_worker(task):
+    """
+    Builds one subtree in a worker process.  It is returned as a Tree, 
+    which pickles without recursing through the levels of the subtree.
+    """
+    return Tree(_worker_builder._build_subtree(task))
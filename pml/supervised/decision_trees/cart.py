@@ -0,0 +1,405 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Implements a CART style decision tree builder.
+
+Numeric features are split in two on a threshold and may be split on again 
+further down the tree.  Other features get one branch per value, as in ID3.
+
+@author: drusk
+"""
+
+import numpy as np
+
+from pml.supervised.decision_trees.builder import AbstractTreeBuilder
+from pml.supervised.decision_trees.encoding import (midpoints, 
+                                                    quantile_bin_edges)
+from pml.supervised.decision_trees.trees import Node, ThresholdNode
+from pml.tools.info_theory import entropy_of_counts
+
+def gini_of_counts(counts):
+    """
+    Calculates Gini impurities from the number of samples with each label.
+    
+    Args:
+      counts: array-like
+        The number of samples with each label, along the last dimension.
+        
+    Returns:
+      The Gini impurity of each set of counts, as a float for 1d counts or a 
+      numpy array otherwise.  Sets with no samples have impurity 0.
+    """
+    counts = np.asarray(counts, dtype=float)
+    totals = counts.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportions = counts / totals[..., np.newaxis]
+        impurities = 1 - (proportions ** 2).sum(axis=-1)
+    return np.where(totals > 0, impurities, 0)
+
+# The functions which can measure the impurity of a node's labels.
+IMPURITY_MEASURES = {
+    "gini": gini_of_counts,
+    "entropy": entropy_of_counts
+}
+
+def build_tree(dataset, criterion="gini", max_bins=None, n_jobs=1, 
+               **limits):
+    """
+    Builds the decision tree for a data set with binary threshold splits on 
+    its numeric features.
+    
+    At each node the best threshold for a numeric feature is found in one 
+    pass over its candidate split points, using running totals of the label 
+    counts.  The candidates are either every value of the feature, from 
+    indices which are sorted once at the root and then partitioned along 
+    with the samples, or the edges of quantile bins which the values are 
+    assigned to once at the root.
+    
+    Samples missing a value for the feature a node splits on don't reach 
+    its children.
+    
+    Args:
+      dataset: model.DataSet
+        The data for which the decision tree will be built.
+      criterion: string
+        How the impurity of a node's labels is measured; "gini" or 
+        "entropy".  Defaults to "gini".
+      max_bins: int
+        If set, numeric features are split only at the edges of at most 
+        this many quantile bins, e.g. 256.  This is faster for large data 
+        sets.  Defaults to None, in which case every value is considered.
+      n_jobs: int
+        The number of processes to build with.  See 
+        builder.AbstractTreeBuilder.build.  Defaults to 1.
+      limits:
+        Keyword arguments limiting the size of the tree, e.g. max_depth.  
+        See builder.AbstractTreeBuilder.
+        
+    Returns:
+      tree: Tree
+        The decision tree that was built.
+        
+    Raises:
+      ValueError if the criterion is not recognized or max_bins is less 
+      than 2.
+    """
+    builder = CartBuilder(dataset, criterion=criterion, max_bins=max_bins, 
+                          **limits)
+    return builder.build(n_jobs=n_jobs)
+
+
+class CartBuilder(AbstractTreeBuilder):
+    """
+    Builds trees with binary threshold splits on numeric features.
+    
+    A task is a tuple of the rows of the samples which reach a node, the 
+    rows sorted by each numeric feature (or None when the features are 
+    binned) and the categorical features which haven't been split on by its 
+    ancestors.
+    """
+    
+    def __init__(self, dataset, criterion="gini", max_bins=None, 
+                 **limits):
+        """
+        Constructs a new builder.  See build_tree for the criterion and 
+        max_bins, and AbstractTreeBuilder for the limits on the tree, such 
+        as max_depth.
+        
+        Raises:
+          ValueError if the criterion is not recognized or max_bins is less 
+          than 2.
+        """
+        if criterion not in IMPURITY_MEASURES:
+            supported = ", ".join(sorted(IMPURITY_MEASURES))
+            raise ValueError("Unknown criterion '%s'.  Supported criteria "
+                             "are: %s" % (criterion, supported))
+        if max_bins is not None and max_bins < 2:
+            raise ValueError("max_bins must be at least 2.")
+        
+        super(CartBuilder, self).__init__(dataset, **limits)
+        self.impurity = IMPURITY_MEASURES[criterion]
+        
+        num_samples = self.encoded.num_samples()
+        num_features = len(self.encoded.features)
+        
+        self.numeric = []
+        self.categorical = []
+        self.values = np.empty((num_samples, num_features))
+        self.values.fill(np.nan)
+        for i, feature in enumerate(self.encoded.features):
+            column = dataset.get_column(feature)
+            if column.dtype.kind in "iuf":
+                self.numeric.append(i)
+                self.values[:, i] = column.values
+            else:
+                self.categorical.append(i)
+        
+        if max_bins is None:
+            self.bins = None
+        else:
+            # The bin of each numeric value, or -1 if it is missing.  Values 
+            # in bin b are less than or equal to bin_edges[feature][b].
+            self.bins = np.empty((num_samples, num_features), dtype=int)
+            self.bins.fill(-1)
+            self.bin_edges = {}
+            for feature in self.numeric:
+                values = self.values[:, feature]
+                known = ~np.isnan(values)
+                edges = quantile_bin_edges(values[known], max_bins)
+                self.bins[known, feature] = np.searchsorted(edges, 
+                                                            values[known])
+                self.bin_edges[feature] = edges
+        
+        # Scratch space which marks the child each row is sent to.
+        self._side = np.zeros(num_samples, dtype=int)
+    
+    def _get_root_task(self, rows):
+        if self.bins is None:
+            sorted_rows = dict((feature, _presort(rows, 
+                                                  self.values[:, feature])) 
+                               for feature in self.numeric)
+        else:
+            sorted_rows = None
+        
+        return rows, sorted_rows, self.categorical
+    
+    def _find_split(self, task, score_all, random_state):
+        rows, sorted_rows, categorical = task
+        
+        label_counts = self.encoded.label_counts(rows)
+        if np.count_nonzero(label_counts) == 1:
+            # All remaining samples have the same label
+            return None
+        
+        base_impurity = self.impurity(label_counts)
+        features = sorted(self.numeric + categorical)
+        candidates = self._sample_features(features, random_state)
+        split = self._choose_split(rows, sorted_rows, candidates, 
+                                   base_impurity, score_all)
+        if split is None and len(candidates) < len(features):
+            # None of the sampled features can split the samples, so fall 
+            # back to the others
+            others = [feature for feature in features 
+                      if feature not in candidates]
+            split = self._choose_split(rows, sorted_rows, others, 
+                                       base_impurity, score_all)
+        
+        if split is None:
+            # No feature can separate the remaining samples
+            return None
+        
+        gain, split_feature, split_threshold = split
+        return gain, (split_feature, split_threshold)
+    
+    def _split(self, task, split):
+        rows, sorted_rows, categorical = task
+        split_feature, split_threshold = split
+        
+        feature_name = self.encoded.features[split_feature]
+        if split_feature in categorical:
+            node = Node(feature_name)
+            groups = self.encoded.group_rows(rows, split_feature)
+            branches = [self.encoded.feature_values[split_feature][code] 
+                        for code, _ in groups]
+            subsets = [subset for _, subset in groups]
+            categorical = [feature for feature in categorical 
+                           if feature != split_feature]
+        else:
+            node = ThresholdNode(feature_name, split_threshold)
+            values = self.values[rows, split_feature]
+            branches = [node.get_left_branch(), node.get_right_branch()]
+            subsets = [rows[values <= split_threshold], 
+                       rows[values > split_threshold]]
+        
+        children = []
+        for branch, subset, child_sorted_rows in zip(
+                branches, subsets, self._partition(rows, subsets, 
+                                                   sorted_rows)):
+            children.append((branch, 
+                             (subset, child_sorted_rows, categorical)))
+        return node, children
+    
+    def _choose_split(self, rows, sorted_rows, features, base_impurity, 
+                      score_all):
+        """
+        Finds the feature, and threshold for numeric features, which 
+        decreases the impurity the most.  Ties go to the feature which comes 
+        first.
+        
+        Returns:
+          A (gain, feature, threshold) tuple, where the threshold is None for 
+          categorical features, or None if none of the features can split 
+          the rows.
+        """
+        # Only the presorted rows of each numeric feature differ between 
+        # the jobs.
+        jobs = []
+        for feature in features:
+            order = None if sorted_rows is None else sorted_rows.get(feature)
+            jobs.append((feature, order))
+        
+        scores = score_all((rows, base_impurity), jobs)
+        best = None
+        for feature, (gain, threshold) in zip(features, scores):
+            if gain is not None and (best is None or gain > best[0]):
+                best = (gain, feature, threshold)
+        
+        return best
+    
+    def _score(self, context, job):
+        """
+        Scores splitting the rows on a feature.
+        
+        Returns:
+          gain: float
+            The decrease in impurity from the split, or None if the feature 
+            can't split the rows.
+          threshold: float
+            The threshold for a numeric feature, or None for a categorical 
+            feature.
+        """
+        rows, base_impurity = context
+        feature, order = job
+        if feature in self.numeric:
+            return self._find_threshold(rows, order, feature, base_impurity)
+        else:
+            return (self._calc_categorical_gain(rows, feature, base_impurity), 
+                    None)
+    
+    def _calc_categorical_gain(self, rows, feature, base_impurity):
+        """
+        Calculates the decrease in impurity from splitting on every value of 
+        a categorical feature.
+        
+        Returns:
+          The gain, or None if fewer than two of the feature's values occur 
+          in the rows.
+        """
+        counts = self.encoded.value_label_counts(rows, feature)
+        sizes = counts.sum(axis=1)
+        if np.count_nonzero(sizes) < 2:
+            return None
+        
+        return base_impurity - (np.dot(sizes, self.impurity(counts)) / 
+                                float(len(rows)))
+    
+    def _find_threshold(self, rows, order, feature, base_impurity):
+        """
+        Finds the best threshold to split a numeric feature on.
+        
+        Args:
+          rows: numpy array
+            The rows of the samples at the node.
+          order: numpy array
+            The rows which have a value for the feature, sorted by it, or 
+            None when the features are binned.
+          feature: int
+            The feature's column.
+          base_impurity: float
+            The impurity of the node's labels.
+        
+        Returns:
+          gain: float
+            The decrease in impurity from the split, or None if the feature 
+            has no candidate thresholds.
+          threshold: float
+            The threshold.
+        """
+        num_labels = self.encoded.num_labels()
+        
+        if order is None:
+            bins = self.bins[rows, feature]
+            known = bins >= 0
+            edges = self.bin_edges[feature]
+            num_bins = len(edges) + 1
+            labels = self.encoded.label_codes[rows][known]
+            counts = np.bincount(bins[known] * num_labels + labels, 
+                                 minlength=num_bins * num_labels)
+            cumulative = np.cumsum(counts.reshape(num_bins, num_labels), 
+                                   axis=0)
+            
+            # Splitting after any bin which leaves samples on both sides
+            sizes = cumulative.sum(axis=1)
+            candidates = np.nonzero((sizes > 0) & 
+                                    (sizes < sizes[-1]))[0]
+            thresholds = edges[candidates]
+        else:
+            values = self.values[order, feature]
+            labels = self.encoded.label_codes[order]
+            cumulative = np.cumsum(_one_hot(labels, num_labels), axis=0)
+            
+            # Splitting between any two different consecutive values
+            candidates = np.nonzero(values[:-1] < values[1:])[0]
+            thresholds = midpoints(values[candidates], 
+                                    values[candidates + 1])
+        
+        if len(candidates) == 0:
+            return None, None
+        
+        left = cumulative[candidates]
+        right = cumulative[-1] - left
+        child_impurities = (left.sum(axis=1) * self.impurity(left) + 
+                            right.sum(axis=1) * self.impurity(right))
+        gains = base_impurity - child_impurities / float(len(rows))
+        
+        best = np.argmax(gains)
+        return gains[best], thresholds[best]
+    
+    def _partition(self, rows, subsets, sorted_rows):
+        """
+        Splits each numeric feature's sorted rows between a node's children, 
+        keeping them sorted.
+        
+        Returns:
+          A list with the sorted rows for each child, or Nones when the 
+          features are binned.
+        """
+        if sorted_rows is None:
+            return [None] * len(subsets)
+        
+        side = self._side
+        side[rows] = -1
+        for i, subset in enumerate(subsets):
+            side[subset] = i
+        
+        children = []
+        for i in range(len(subsets)):
+            children.append(dict((feature, order[side[order] == i]) 
+                                 for feature, order in sorted_rows.items()))
+        return children
+
+
+def _presort(rows, values):
+    """
+    Returns:
+      The rows whose values aren't missing, sorted by value.
+    """
+    rows = rows[~np.isnan(values[rows])]
+    return rows[np.argsort(values[rows], kind="mergesort")]
+
+def _one_hot(codes, num_codes):
+    """
+    Returns:
+      A 2d numpy array with a row for each code which is 1 in the code's 
+      column and 0 elsewhere.
+    """
+    one_hot = np.zeros((len(codes), num_codes), dtype=int)
+    one_hot[np.arange(len(codes)), codes] = 1
+    return one_hot
@@ -0,0 +1,223 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Compiles decision trees into flat arrays for fast batch classification.
+
+@author: drusk
+"""
+
+import numpy as np
+import pandas as pd
+
+from pml.supervised.decision_trees.trees import ThresholdNode
+
+class CompiledTree(object):
+    """
+    A decision tree flattened into parallel arrays, with one entry per node.
+    
+    Node 0 is the root.  For each node the arrays hold:
+      column: the column of the encoded samples it splits on, or -1 for 
+        leaves.
+      threshold: the threshold of threshold nodes, NaN otherwise.
+      left, right: the children of threshold nodes, -1 otherwise.
+      branch_offset: where the children of other internal nodes start in 
+        branch_table, -1 otherwise.  branch_table[offset + code] is the 
+        child for the value with that code, or -1 if the node has no branch 
+        for it.
+      value: the code of a leaf's label in labels, -1 for internal nodes.
+    
+    The last node is an extra leaf with the default label.  Samples reach it 
+    if they are missing a value a node splits on, or have a value which has 
+    no branch.
+    """
+    
+    def __init__(self, tree, default_label):
+        """
+        Compiles a tree.
+        
+        Args:
+          tree: Tree
+            The decision tree.
+          default_label:
+            The label for samples which can't be routed to one of the tree's 
+            leaves.
+        """
+        nodes = tree.get_nodes_breadth_first()
+        
+        # Each feature a node splits on gets a column of the encoded 
+        # samples: the values for threshold nodes, value codes otherwise.
+        self.columns = []
+        self.codebooks = {}
+        column_numbers = {}
+        for node in nodes:
+            if node.is_leaf():
+                continue
+            key = (node.get_value(), isinstance(node, ThresholdNode))
+            if key not in column_numbers:
+                column_numbers[key] = len(self.columns)
+                self.columns.append(key)
+            if not key[1]:
+                codebook = self.codebooks.setdefault(column_numbers[key], {})
+                for branch in node.get_branches():
+                    codebook.setdefault(branch, len(codebook))
+        
+        num_nodes = len(nodes) + 1
+        node_numbers = dict((id(node), i) for i, node in enumerate(nodes))
+        self.column = np.empty(num_nodes, dtype=int)
+        self.column.fill(-1)
+        self.threshold = np.empty(num_nodes)
+        self.threshold.fill(np.nan)
+        self.left = self.column.copy()
+        self.right = self.column.copy()
+        self.branch_offset = self.column.copy()
+        self.value = self.column.copy()
+        
+        label_codes = {}
+        branch_table = []
+        for i, node in enumerate(nodes):
+            if node.is_leaf():
+                self.value[i] = label_codes.setdefault(node.get_value(), 
+                                                       len(label_codes))
+                continue
+            
+            is_threshold = isinstance(node, ThresholdNode)
+            column = column_numbers[(node.get_value(), is_threshold)]
+            self.column[i] = column
+            if is_threshold:
+                self.threshold[i] = node.get_threshold()
+                self.left[i] = node_numbers[
+                                id(node.get_child(node.get_left_branch()))]
+                self.right[i] = node_numbers[
+                                id(node.get_child(node.get_right_branch()))]
+            else:
+                codebook = self.codebooks[column]
+                self.branch_offset[i] = len(branch_table)
+                children = [-1] * len(codebook)
+                for branch in node.get_branches():
+                    children[codebook[branch]] = node_numbers[
+                                                id(node.get_child(branch))]
+                branch_table.extend(children)
+        
+        self.value[-1] = label_codes.setdefault(default_label, 
+                                                len(label_codes))
+        self.branch_table = np.array(branch_table, dtype=int)
+        
+        self.labels = np.empty(len(label_codes), dtype=object)
+        for label, code in label_codes.items():
+            self.labels[code] = label
+    
+    def num_nodes(self):
+        """
+        Returns:
+          The number of nodes, including the extra default leaf.
+        """
+        return len(self.value)
+    
+    def classify_all(self, data_frame):
+        """
+        Classifies many samples at once.
+        
+        Args:
+          data_frame: pandas.DataFrame
+            The samples, with a column for each feature the tree splits on.
+            
+        Returns:
+          A numpy array with each sample's label.
+        """
+        return self.labels[self.value[self.find_leaves(data_frame)]]
+    
+    def find_leaves(self, data_frame):
+        """
+        Finds the leaf each of many samples reaches.
+        
+        Args:
+          data_frame: pandas.DataFrame
+            The samples, with a column for each feature the tree splits on.
+            
+        Returns:
+          A numpy array with each sample's leaf node number.  The label of 
+          the leaf is labels[value[leaf]].
+        """
+        nodes = self.find_stops(data_frame)
+        nodes[self.column[nodes] >= 0] = self.num_nodes() - 1
+        return nodes
+    
+    def find_stops(self, data_frame):
+        """
+        Finds the node each of many samples stops at.  That is a leaf, 
+        unless the sample is missing the value an internal node splits on 
+        or has a value with no branch.
+        
+        All samples start at the root and move down one level of the tree 
+        per iteration, so the number of iterations is the depth of the tree 
+        rather than the number of samples.
+        
+        Args:
+          data_frame: pandas.DataFrame
+            The samples, with a column for each feature the tree splits on.
+            
+        Returns:
+          A numpy array with each sample's node number.  The nodes are 
+          numbered in the order of Tree.get_nodes_breadth_first.
+        """
+        matrix = self._encode(data_frame)
+        
+        nodes = np.zeros(len(data_frame), dtype=int)
+        active = np.arange(len(data_frame))
+        while True:
+            active = active[self.column[nodes[active]] >= 0]
+            if len(active) == 0:
+                break
+            current = nodes[active]
+            
+            values = matrix[active, self.column[current]]
+            missing = np.isnan(values)
+            with np.errstate(invalid="ignore"):
+                go_left = values <= self.threshold[current]
+            next_nodes = np.where(go_left, self.left[current], 
+                                  self.right[current])
+            
+            has_branches = self.branch_offset[current] >= 0
+            codes = np.where(missing, -1, values).astype(int)
+            coded = has_branches & (codes >= 0)
+            next_nodes[coded] = self.branch_table[
+                        self.branch_offset[current[coded]] + codes[coded]]
+            next_nodes[has_branches & (codes < 0)] = -1
+            
+            moved = ~missing & (next_nodes >= 0)
+            active = active[moved]
+            nodes[active] = next_nodes[moved]
+        
+        return nodes
+    
+    def _encode(self, data_frame):
+        """
+        Encodes samples as a float matrix with a column for each entry in 
+        self.columns.  Values with no code, and missing values, are NaN.
+        """
+        matrix = np.empty((len(data_frame), len(self.columns)))
+        for i, (feature, is_threshold) in enumerate(self.columns):
+            column = data_frame[feature]
+            if is_threshold:
+                matrix[:, i] = column.astype(float).values
+            else:
+                matrix[:, i] = column.map(self.codebooks[i]).astype(float)
+        return matrix
+
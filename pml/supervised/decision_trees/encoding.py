@@ -0,0 +1,187 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Integer encoding and binning of datasets for building decision trees.
+
+@author: drusk
+"""
+
+import numpy as np
+import pandas as pd
+
+class EncodedDataSet(object):
+    """
+    A labelled dataset whose feature values and labels have been replaced 
+    by integer codes.
+    
+    The data is encoded once, after which tree building algorithms can work 
+    with arrays of row indices into the code matrix instead of creating 
+    filtered copies of the dataset.
+    """
+    
+    def __init__(self, dataset):
+        """
+        Encodes a dataset.
+        
+        Args:
+          dataset: model.DataSet
+            A labelled dataset.
+        """
+        self.features = dataset.feature_list()
+        
+        self.label_codes, self.labels = _factorize(dataset.get_labels())
+        
+        # The codes of each feature's values, one column per feature.  
+        # Missing values have code -1.
+        self.feature_values = []
+        self.matrix = np.empty((dataset.num_samples(), len(self.features)), 
+                               dtype=int)
+        for i, feature in enumerate(self.features):
+            codes, values = _factorize(dataset.get_column(feature))
+            self.matrix[:, i] = codes
+            self.feature_values.append(values)
+    
+    def num_samples(self):
+        """
+        Returns:
+          The number of samples in the dataset.
+        """
+        return self.matrix.shape[0]
+    
+    def num_labels(self):
+        """
+        Returns:
+          The number of distinct labels.
+        """
+        return len(self.labels)
+    
+    def label_counts(self, rows):
+        """
+        Counts the samples with each label.
+        
+        Args:
+          rows: numpy array
+            The rows of the samples to count.
+            
+        Returns:
+          A numpy array with the number of samples with each label code.
+        """
+        return np.bincount(self.label_codes[rows], minlength=self.num_labels())
+    
+    def value_label_counts(self, rows, feature):
+        """
+        Counts the samples with each combination of a feature's value and 
+        label.  Samples missing a value for the feature are not counted.
+        
+        Args:
+          rows: numpy array
+            The rows of the samples to count.
+          feature: int
+            The feature's column in the code matrix.
+            
+        Returns:
+          A 2d numpy array with a row for each value code of the feature and 
+          a column for each label code.
+        """
+        values = self.matrix[rows, feature]
+        labels = self.label_codes[rows]
+        known = values >= 0
+        
+        num_values = len(self.feature_values[feature])
+        num_labels = self.num_labels()
+        counts = np.bincount(values[known] * num_labels + labels[known], 
+                             minlength=num_values * num_labels)
+        return counts.reshape(num_values, num_labels)
+    
+    def group_rows(self, rows, feature):
+        """
+        Groups rows by their value of a feature.  Rows missing a value for 
+        the feature are left out.
+        
+        Args:
+          rows: numpy array
+            The rows to group.
+          feature: int
+            The feature's column in the code matrix.
+            
+        Returns:
+          A list of (value code, rows) tuples, ordered by value code.  The 
+          rows in each group keep their original order.
+        """
+        values = self.matrix[rows, feature]
+        order = np.argsort(values, kind="mergesort")
+        sorted_values = values[order]
+        
+        boundaries = np.nonzero(np.diff(sorted_values))[0] + 1
+        starts = np.concatenate(([0], boundaries))
+        groups = np.split(rows[order], boundaries)
+        
+        return [(sorted_values[start], group) 
+                for start, group in zip(starts, groups) 
+                if len(group) > 0 and sorted_values[start] >= 0]
+
+
+def midpoints(lower, upper):
+    """
+    Finds thresholds between pairs of values.
+    
+    Returns:
+      A numpy array of thresholds which are at least the lower value and 
+      less than the upper value.  Usually these are the midpoints, but if 
+      the values are so close together that the midpoint rounds to the upper 
+      value then the lower value is used.
+    """
+    middle = lower + (upper - lower) / 2.0
+    return np.where(middle < upper, middle, lower)
+
+def quantile_bin_edges(values, max_bins):
+    """
+    Chooses the edges of the bins for a numeric feature.
+    
+    Args:
+      values: numpy array
+        The feature's values, without missing values.
+      max_bins: int
+        The maximum number of bins.
+    
+    Returns:
+      A sorted numpy array with the largest value in each bin but the last.  
+      If there are few enough distinct values each gets its own bin, 
+      otherwise the edges are quantiles of the values.
+    """
+    distinct = np.unique(values)
+    if len(distinct) <= max_bins:
+        return midpoints(distinct[:-1], distinct[1:])
+    
+    quantiles = np.linspace(0, 100, max_bins + 1)[1:-1]
+    return np.unique(np.percentile(values, quantiles))
+
+def _factorize(series):
+    """
+    Encodes the values of a pandas Series as integers.
+    
+    Returns:
+      codes: numpy array
+        The code of each value, or -1 for missing values.
+      values: numpy array
+        The distinct values, indexed by code.
+    """
+    codes, values = pd.factorize(series.values)
+    return np.asarray(codes, dtype=int), np.asarray(values, dtype=object)
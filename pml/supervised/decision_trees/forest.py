@@ -0,0 +1,275 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Random forests of decision trees.
+
+@author: drusk
+"""
+
+import math
+import multiprocessing
+import numbers
+
+import numpy as np
+import pandas as pd
+
+from pml.data import model
+from pml.supervised.classifiers import AbstractClassifier
+from pml.supervised.decision_trees.compiled import CompiledTree
+from pml.supervised.decision_trees.interface import create_builder
+from pml.utils import collection_utils
+
+# Seeds for the random state of each tree are drawn below this.
+_MAX_SEED = 2 ** 31 - 1
+
+_worker_builder = None
+_worker_default_label = None
+
+class RandomForest(AbstractClassifier):
+    """
+    Random forest classifier.
+    
+    Builds many decision trees, each from a bootstrap sample of the training 
+    set, with each node choosing the best split among a random subset of 
+    the features.  The individual trees overfit in different ways, so a 
+    majority vote of the trees generalizes better than a single decision 
+    tree.
+    
+    The training set is encoded once and each bootstrap sample is just an 
+    array of row numbers.  The trees are compiled to flat arrays, so a 
+    dataset is classified by routing all of its samples through one tree at 
+    a time and adding up the votes.
+    """
+    
+    def __init__(self, training_set, num_trees=10, algorithm="id3", 
+                 max_features="sqrt", criterion=None, max_bins=None, 
+                 max_depth=None, min_samples_split=2, min_gain=None, 
+                 max_leaf_nodes=None, n_jobs=1, random_state=None):
+        """
+        Constructs a new random forest.
+        
+        Args:
+          training_set: model.DataSet
+            The training data to use when building the trees.
+          num_trees: int
+            The number of trees in the forest.  Default value is 10.
+          algorithm: string
+            How each tree is built, "id3" or "cart".  See DecisionTree.  
+            Default value is "id3".
+          max_features: int, float or string
+            The number of features each node chooses at random to consider 
+            splitting on.  Either a number, a fraction of the features, 
+            "sqrt" or "log2" of the number of features, or None for all of 
+            them.  At least one feature is always considered.  Default 
+            value is "sqrt".
+          criterion: string
+            The impurity criterion for "cart".  See DecisionTree.  Defaults 
+            to None, i.e. "gini".
+          max_bins: int
+            The maximum number of bins for "cart".  See DecisionTree.  
+            Defaults to None.
+          max_depth, min_samples_split, min_gain, max_leaf_nodes:
+            Limits on the size of each tree.  See DecisionTree.  By default 
+            the trees are unlimited.
+          n_jobs: int
+            The number of processes to build the trees with.  Each process 
+            receives a copy of the encoded training set once, when it 
+            starts, then builds whole trees.  Use -1 for one process per 
+            CPU.  Defaults to 1, i.e. build in the current process.
+          random_state: int
+            Seeds the bootstrap samples and feature choices, making the 
+            forest reproducible.  The forest doesn't depend on n_jobs.  
+            Defaults to None.
+            
+        Raises:
+          UnlabelledDataSetError if the training set is not labelled.
+          
+          ValueError if the algorithm, criterion or max_features is not 
+          recognized, or if criterion or max_bins is given for "id3".
+        """
+        super(RandomForest, self).__init__(training_set)
+        self.num_trees = num_trees
+        
+        max_features = _resolve_max_features(max_features, 
+                                             training_set.num_features())
+        builder = create_builder(training_set, algorithm=algorithm, 
+                                 criterion=criterion, max_bins=max_bins, 
+                                 max_features=max_features, 
+                                 max_depth=max_depth, 
+                                 min_samples_split=min_samples_split, 
+                                 min_gain=min_gain, 
+                                 max_leaf_nodes=max_leaf_nodes)
+        default_label = collection_utils.get_most_common(
+                                            training_set.get_labels())
+        
+        seeds = np.random.RandomState(random_state).randint(_MAX_SEED, 
+                                                            size=num_trees)
+        
+        if n_jobs < 0:
+            n_jobs = multiprocessing.cpu_count()
+        n_jobs = min(n_jobs, num_trees)
+        
+        if n_jobs > 1:
+            pool = multiprocessing.Pool(n_jobs, initializer=_init_worker, 
+                                        initargs=(builder, default_label))
+            try:
+                self._trees = pool.map(_build_tree_in_worker, seeds)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            self._trees = [_build_tree(builder, seed, default_label) 
+                           for seed in seeds]
+        
+        # Translate each tree's label codes to the forest's.
+        self._labels = builder.encoded.labels
+        label_codes = dict((label, code) 
+                           for code, label in enumerate(self._labels))
+        self._tree_label_codes = [
+                np.array([label_codes[label] for label in tree.labels], 
+                         dtype=int) 
+                for tree in self._trees]
+    
+    def __str__(self):
+        return "RandomForest with %d trees" % self.num_trees
+    
+    def get_vote_proportions(self, dataset):
+        """
+        Calculates the proportion of the trees which vote for each label, 
+        for each sample in a dataset.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            The samples to classify.
+            
+        Returns:
+          A pandas DataFrame indexed by sample id with a column for each 
+          label.  Each row sums to 1.
+        """
+        dataset = model.as_dataset(dataset)
+        self._check_features(dataset.feature_list())
+        data_frame = dataset.get_data_frame()
+        votes = self._count_votes(data_frame)
+        return pd.DataFrame(votes / float(self.num_trees), 
+                            index=data_frame.index, columns=self._labels)
+    
+    def _classify(self, sample):
+        """
+        Predicts a sample's classification by a majority vote of the trees.
+        
+        Args:
+          sample: 
+            The sample or observation to be classified.
+          
+        Returns:
+          The sample's classification.
+        """
+        votes = self._count_votes(pd.DataFrame([sample]))
+        return self._labels[np.argmax(votes[0])]
+    
+    def _classify_all(self, dataset):
+        """
+        Predicts the classification of every sample in a dataset at once, 
+        by a majority vote of the trees.  Ties go to the label which comes 
+        first in the training set.
+        
+        Args:
+          dataset: model.DataSet
+            the dataset whose samples will be classified.
+            
+        Returns:
+          A pandas Series with each sample's classification, indexed by 
+          sample id.
+          
+        Raises:
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        self._check_features(dataset.feature_list())
+        data_frame = dataset.get_data_frame()
+        votes = self._count_votes(data_frame)
+        return pd.Series(self._labels[np.argmax(votes, axis=1)], 
+                         index=data_frame.index)
+    
+    def _count_votes(self, data_frame):
+        """
+        Counts the votes of the trees.
+        
+        Returns:
+          A 2d numpy array with a row for each sample and a column for each 
+          label.
+        """
+        num_samples = len(data_frame)
+        votes = np.zeros((num_samples, len(self._labels)), dtype=int)
+        samples = np.arange(num_samples)
+        for tree, label_codes in zip(self._trees, self._tree_label_codes):
+            leaves = tree.find_leaves(data_frame)
+            votes[samples, label_codes[tree.value[leaves]]] += 1
+        return votes
+
+
+def _resolve_max_features(max_features, num_features):
+    """
+    Converts the max_features argument of RandomForest into a number of 
+    features.
+    
+    Raises:
+      ValueError if max_features is not recognized.
+    """
+    if max_features is None:
+        return None
+    elif max_features == "sqrt":
+        number = int(math.sqrt(num_features))
+    elif max_features == "log2":
+        number = int(math.log(num_features, 2))
+    elif isinstance(max_features, float):
+        number = int(max_features * num_features)
+    elif isinstance(max_features, numbers.Integral):
+        number = max_features
+    else:
+        raise ValueError("Unknown max_features '%s'.  Use a number, a "
+                         "fraction, 'sqrt', 'log2' or None." % max_features)
+    
+    return max(1, number)
+
+def _build_tree(builder, seed, default_label):
+    """
+    Builds and compiles one tree of a forest from a bootstrap sample.
+    """
+    random_state = np.random.RandomState(seed)
+    num_samples = builder.encoded.num_samples()
+    rows = random_state.randint(num_samples, size=num_samples)
+    tree = builder.build(rows=rows, 
+                         random_state=random_state.randint(_MAX_SEED))
+    return CompiledTree(tree, default_label)
+
+def _init_worker(builder, default_label):
+    """
+    Initializes a worker process for building a forest in parallel.
+    """
+    global _worker_builder, _worker_default_label
+    _worker_builder = builder
+    _worker_default_label = default_label
+
+def _build_tree_in_worker(seed):
+    """
+    Builds one tree of a forest in a worker process.
+    """
+    return _build_tree(_worker_builder, seed, _worker_default_label)
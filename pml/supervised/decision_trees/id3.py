@@ -23,66 +23,121 @@ Implements the ID3 decision tree algorithm.
 @author: drusk
 """
 
-from pml.supervised.decision_trees.trees import Node, Tree
-from pml.tools.info_theory import info_gain
-from pml.utils.collection_utils import (get_key_with_highest_value, 
-                                        get_most_common)
+import numpy as np
 
-def build_tree(dataset):
+from pml.supervised.decision_trees.builder import AbstractTreeBuilder
+from pml.supervised.decision_trees.encoding import EncodedDataSet
+from pml.supervised.decision_trees.trees import Node
+from pml.tools.info_theory import entropy_of_counts
+
+def build_tree(dataset, n_jobs=1, **limits):
     """
     Builds the decision tree for a data set using the ID3 algorithm.
     
+    The data set is integer encoded once.  Each node then works with the 
+    rows of the samples which reach it, and the information gain of every 
+    feature is calculated from tables of label counts.
+    
     Args:
       dataset: model.DataSet
         The data for which the decision tree will be built.
+      n_jobs: int
+        The number of processes to build with.  See 
+        builder.AbstractTreeBuilder.build.  Defaults to 1.
+      limits:
+        Keyword arguments limiting the size of the tree, e.g. max_depth.  
+        See builder.AbstractTreeBuilder.
     
     Return:
       tree: Tree
         The decision tree that was built.
     """
-    return Tree(_build_tree_recursively(dataset))
+    return Id3Builder(dataset, **limits).build(n_jobs=n_jobs)
+
 
-def _build_tree_recursively(dataset):
+class Id3Builder(AbstractTreeBuilder):
     """
-    Private function used to build the decision tree in a recursive fashion.
-    
-    Args:
-      dataset: model.DataSet
-        The data at the current level of the tree.  Lower levels of the tree 
-        have filtered subsets of the original data set.
+    Builds trees with the ID3 algorithm.
     
-    Returns:
-      current_root: Node
-        The node which is the root of the level being processed.  For 
-        example, on the first/outermost call to this function the root 
-        node will be returned.  Subsequent calls will return the various 
-        child nodes.
+    A task is a tuple of the rows of the samples which reach a node and the 
+    features which haven't been split on by its ancestors.
     """
-    label_set = set(dataset.get_labels())
-    if len(label_set) == 1:
-        # All remaining samples have the same label, no need to split further
-        return Node(label_set.pop())
     
-    if len(dataset.feature_list()) == 0:
-        # No more features to split on
-        return Node(get_most_common(dataset.get_labels()))
+    def _get_root_task(self, rows):
+        return rows, list(range(len(self.encoded.features)))
+    
+    def _find_split(self, task, score_all, random_state):
+        rows, features = task
+        
+        label_counts = self.encoded.label_counts(rows)
+        if np.count_nonzero(label_counts) == 1:
+            # All remaining samples have the same label, no need to split 
+            # further
+            return None
+        
+        if len(features) == 0:
+            # No more features to split on
+            return None
+        
+        # We can still split further.  Ties go to the first feature.
+        candidates = self._sample_features(features, random_state)
+        gains = score_all(rows, candidates)
+        best = np.argmax(gains)
+        return gains[best], candidates[best]
+    
+    def _split(self, task, split_feature):
+        rows, features = task
+        
+        remaining_features = [feature for feature in features 
+                              if feature != split_feature]
+        children = []
+        for value_code, subset in self.encoded.group_rows(rows, 
+                                                          split_feature):
+            value = self.encoded.feature_values[split_feature][value_code]
+            children.append((value, (subset, remaining_features)))
+        
+        if len(children) == 0:
+            # Every sample is missing a value for the feature
+            return self._make_leaf(task), []
+        
+        return Node(self.encoded.features[split_feature]), children
+    
+    def _score(self, rows, feature):
+        return calc_info_gains(self.encoded, rows, [feature])[0]
+    
 
-    # We can still split further
-    split_feature = choose_feature_to_split(dataset)
+def calc_info_gains(encoded, rows, features):
+    """
+    Calculates the information gain of several features for a subset of an 
+    encoded data set.
     
-    node = Node(split_feature)
+    Args:
+      encoded: EncodedDataSet
+        The data set.
+      rows: numpy array
+        The rows of the samples in the subset.
+      features: list(int)
+        The columns of the features in the encoded data set.
+        
+    Returns:
+      gains: numpy array
+        The information gain of each feature.
+    """
+    base_entropy = entropy_of_counts(encoded.label_counts(rows))
     
-    for value in dataset.get_feature_values(split_feature):
-        subset = dataset.value_filter(
-                            split_feature, value).drop_column(split_feature)
-        node.add_child(value, _build_tree_recursively(subset))
+    gains = np.empty(len(features))
+    for i, feature in enumerate(features):
+        counts = encoded.value_label_counts(rows, feature)
+        value_entropies = np.dot(counts.sum(axis=1), 
+                                 entropy_of_counts(counts)) / len(rows)
+        gains[i] = base_entropy - value_entropies
     
-    return node
+    return gains
 
 def choose_feature_to_split(dataset):
     """
     Choose the root to be the feature which has the highest information 
-    gain.
+    gain.  Ties go to the feature which comes first in the data set.
     
     Args:
       dataset: model.DataSet
@@ -92,9 +147,7 @@ def choose_feature_to_split(dataset):
       feature: string
         The feature which should be the root.
     """
-    gains = {}
-    for feature in dataset.feature_list():
-        gains[feature] = info_gain(feature, dataset)
-    
-    return get_key_with_highest_value(gains)
-
+    encoded = EncodedDataSet(dataset)
+    rows = np.arange(encoded.num_samples())
+    gains = calc_info_gains(encoded, rows, list(range(len(encoded.features))))
+    return encoded.features[np.argmax(gains)]
@@ -23,11 +23,62 @@ Decision trees classification algorithm.
 @author: drusk
 """
 
+import pandas as pd
+
 from pml.supervised.classifiers import AbstractClassifier
-from pml.supervised.decision_trees import id3
+from pml.supervised.decision_trees import cart, id3, pruning
+from pml.supervised.decision_trees.compiled import CompiledTree
 from pml.supervised.decision_trees.tree_plotting import MatplotlibAnnotationTreePlotter
 from pml.utils import collection_utils
 
+def create_builder(training_set, algorithm="id3", criterion=None, 
+                   max_bins=None, max_features=None, max_depth=None, 
+                   min_samples_split=2, min_gain=None, max_leaf_nodes=None):
+    """
+    Creates the builder for a decision tree algorithm.
+    
+    Args:
+      training_set: model.DataSet
+        The training data.
+      algorithm: string
+        "id3" or "cart".  See DecisionTree.
+      criterion: string
+        The impurity criterion for "cart".  See DecisionTree.  Defaults to 
+        None, i.e. "gini".
+      max_bins: int
+        The maximum number of bins for "cart".  See DecisionTree.  Defaults 
+        to None.
+      max_features: int
+        The number of features each node chooses at random to consider 
+        splitting on.  Defaults to None, i.e. all features.
+      max_depth, min_samples_split, min_gain, max_leaf_nodes:
+        Limits on the size of the tree.  See DecisionTree.
+        
+    Returns:
+      builder: builder.AbstractTreeBuilder
+      
+    Raises:
+      ValueError if the algorithm or criterion is not recognized, or if 
+      criterion or max_bins is given for "id3".
+    """
+    limits = dict(max_features=max_features, max_depth=max_depth, 
+                  min_samples_split=min_samples_split, min_gain=min_gain, 
+                  max_leaf_nodes=max_leaf_nodes)
+    if algorithm == "id3":
+        # ID3 always splits on information gain, for every value
+        if criterion is not None or max_bins is not None:
+            raise ValueError("criterion and max_bins only apply to the "
+                             "'cart' algorithm.")
+        return id3.Id3Builder(training_set, **limits)
+    elif algorithm == "cart":
+        if criterion is None:
+            criterion = "gini"
+        return cart.CartBuilder(training_set, criterion=criterion, 
+                                max_bins=max_bins, **limits)
+    else:
+        raise ValueError("Unknown algorithm '%s'.  Supported algorithms "
+                         "are: id3, cart" % algorithm)
+
 class DecisionTree(AbstractClassifier):
     """
     Decision tree classifier.
@@ -40,18 +91,103 @@ class DecisionTree(AbstractClassifier):
     decision tree can lend insight into the data. 
     """
     
-    def __init__(self, training_set):
+    def __init__(self, training_set, algorithm="id3", criterion=None, 
+                 max_bins=None, max_depth=None, min_samples_split=2, 
+                 min_gain=None, max_leaf_nodes=None, n_jobs=1):
         """
         Constructs a new decision tree.
         
         Args:
           training_set: model.DataSet
             The training data to use when building the decision tree.
+          algorithm: string
+            How the tree is built.  "id3" gives every feature one branch per 
+            value.  "cart" splits numeric features in two on a threshold, 
+            so they don't need to be binned first.  Default value is "id3".
+          criterion: string
+            How "cart" measures the impurity of a node's labels; "gini" or 
+            "entropy".  Not allowed for "id3", which always uses 
+            information gain.  Defaults to None, i.e. "gini" for "cart".
+          max_bins: int
+            If set, "cart" only considers thresholds at the edges of at most 
+            this many quantile bins of each numeric feature.  Not allowed 
+            for "id3".  Defaults to None, i.e. every value is considered.
+          max_depth: int
+            If set, nodes at this depth become leaves, limiting the tree to 
+            max_depth + 1 levels.  Defaults to None.
+          min_samples_split: int
+            Nodes with fewer training samples than this become leaves.  
+            Default value is 2.
+          min_gain: float
+            If set, nodes whose best split gains less than this (information 
+            gain for "id3", decrease in impurity for "cart") become leaves.  
+            Defaults to None.
+          max_leaf_nodes: int
+            If set, the tree is grown by always making the split with the 
+            largest gain next, until no split fits within this many leaves.  
+            Defaults to None.
+          n_jobs: int
+            The number of processes to build the tree with.  The candidate 
+            splits near the root are scored in parallel, then independent 
+            subtrees are built in parallel.  The tree is the same as one 
+            built in a single process.  Use -1 for one process per CPU.  
+            Defaults to 1, i.e. build in the current process.
+            
+        Raises:
+          ValueError if the algorithm or criterion is not recognized, or if 
+          criterion or max_bins is given for "id3".
         """
+        builder = create_builder(training_set, algorithm=algorithm, 
+                                 criterion=criterion, max_bins=max_bins, 
+                                 max_depth=max_depth, 
+                                 min_samples_split=min_samples_split, 
+                                 min_gain=min_gain, 
+                                 max_leaf_nodes=max_leaf_nodes)
+        tree = builder.build(n_jobs=n_jobs)
+        
         self.training_set = training_set
-        self._tree = id3.build_tree(training_set)
+        self._default_label = collection_utils.get_most_common(
+                                            training_set.get_labels())
+        self._set_tree(tree)
+    
+    def _set_tree(self, tree):
+        self._tree = tree
+        self._compiled = CompiledTree(tree, self._default_label)
         self._plotter = MatplotlibAnnotationTreePlotter(self._tree)
     
+    def prune(self, validation_set, method="reduced_error"):
+        """
+        Prunes the decision tree, replacing subtrees with leaves where that 
+        doesn't increase the number of misclassified validation samples.
+        
+        Args:
+          validation_set: model.DataSet
+            Labelled samples which were not used to build the tree.
+          method: string
+            "reduced_error" prunes any subtree which makes at least as many 
+            validation errors as a leaf would.  "cost_complexity" prunes 
+            the subtrees which reduce the training error the least for 
+            their size, then picks the amount of pruning with the fewest 
+            validation errors.  Default value is "reduced_error".
+            
+        Returns:
+          void
+          
+        Raises:
+          ValueError if the method is not recognized.
+        """
+        if method == "reduced_error":
+            prune = pruning.reduced_error_prune
+        elif method == "cost_complexity":
+            prune = pruning.cost_complexity_prune
+        else:
+            raise ValueError("Unknown pruning method '%s'.  Supported "
+                             "methods are: reduced_error, cost_complexity" 
+                             % method)
+        
+        self._set_tree(prune(self._tree, self.training_set, validation_set, 
+                             self._default_label))
+    
     def _classify(self, sample):
         """
         Predicts a sample's classification based on the decision tree that 
@@ -67,7 +203,7 @@ class DecisionTree(AbstractClassifier):
         node = self._tree.get_root_node()
         while not node.is_leaf():
             feature = node.get_value()
-            branch = sample[feature]
+            branch = node.get_branch(sample[feature])
             try:
                 node = node.get_child(branch)
             except KeyError:
@@ -75,6 +211,28 @@ class DecisionTree(AbstractClassifier):
         
         return node.get_value()
 
+    def _classify_all(self, dataset):
+        """
+        Predicts the classification of every sample in a dataset at once, 
+        using the compiled form of the tree.
+        
+        Args:
+          dataset: model.DataSet
+            the dataset whose samples will be classified.
+            
+        Returns:
+          A pandas Series with each sample's classification, indexed by 
+          sample id.
+          
+        Raises:
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        self._check_features(dataset.feature_list())
+        data_frame = dataset.get_data_frame()
+        return pd.Series(self._compiled.classify_all(data_frame), 
+                         index=data_frame.index)
+
     def _handle_value_not_trained_for(self):
         """
         Handles the case where a sample has a value for a feature which was 
@@ -90,8 +248,7 @@ class DecisionTree(AbstractClassifier):
           label:
             The best guess at the label.
         """
-        return collection_utils.get_most_common(
-                                    self.training_set.get_labels())
+        return self._default_label
 
     def plot(self):
         """
@@ -0,0 +1,285 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Post-pruning of decision trees using a validation set.
+
+A fully grown tree fits the noise in its training set.  Post-pruning 
+replaces subtrees with leaves when doing so doesn't increase the error on 
+samples which weren't used to build the tree.
+
+@author: drusk
+"""
+
+import numpy as np
+import pandas as pd
+
+from pml.supervised.decision_trees.compiled import CompiledTree
+from pml.supervised.decision_trees.trees import Node, ThresholdNode, Tree
+
+def reduced_error_prune(tree, training_set, validation_set, default_label):
+    """
+    Prunes a decision tree bottom-up, replacing each subtree with a leaf 
+    when the leaf makes no more errors on the validation set than the 
+    subtree does.
+    
+    Args:
+      tree: Tree
+        The decision tree to prune.  It is not modified.
+      training_set: model.DataSet
+        The labelled samples the tree was built from.  The leaf replacing a 
+        subtree predicts the most common training label at its root.
+      validation_set: model.DataSet
+        Labelled samples which were not used to build the tree.
+      default_label:
+        The label predicted for samples which can't be routed to a leaf.
+        
+    Returns:
+      The pruned Tree.
+    """
+    stats = _PruningStatistics(tree, training_set, validation_set, 
+                               default_label)
+    
+    pruned = np.zeros(stats.num_nodes, dtype=bool)
+    subtree_errors = np.zeros(stats.num_nodes)
+    for node in reversed(range(stats.num_nodes)):
+        leaf_errors = stats.validation_leaf_errors[node]
+        if stats.is_leaf[node]:
+            subtree_errors[node] = leaf_errors
+            continue
+        
+        errors = (stats.validation_stop_errors[node] + 
+                  subtree_errors[stats.children[node]].sum())
+        if leaf_errors <= errors:
+            pruned[node] = True
+            errors = leaf_errors
+        subtree_errors[node] = errors
+    
+    return stats.copy_pruned(pruned)
+
+def cost_complexity_prune(tree, training_set, validation_set, default_label):
+    """
+    Prunes a decision tree by weakest-link (minimal cost-complexity) 
+    pruning.
+    
+    The training error of each subtree is traded off against its number of 
+    leaves.  Repeatedly pruning the internal nodes whose subtrees reduce the 
+    training error the least per extra leaf gives a nested sequence of 
+    smaller and smaller trees, ending with the root alone.  The tree in the 
+    sequence with the fewest errors on the validation set is returned, 
+    preferring the smaller tree on ties.
+    
+    Args:
+      tree: Tree
+        The decision tree to prune.  It is not modified.
+      training_set: model.DataSet
+        The labelled samples the tree was built from.
+      validation_set: model.DataSet
+        Labelled samples which were not used to build the tree.
+      default_label:
+        The label predicted for samples which can't be routed to a leaf.
+        
+    Returns:
+      The pruned Tree.
+    """
+    stats = _PruningStatistics(tree, training_set, validation_set, 
+                               default_label)
+    
+    pruned = np.zeros(stats.num_nodes, dtype=bool)
+    best_pruned = pruned.copy()
+    best_errors = None
+    while True:
+        train_errors, num_leaves, validation_errors = stats.sum_subtrees(
+                                                                pruned)
+        if best_errors is None or validation_errors[0] <= best_errors:
+            best_errors = validation_errors[0]
+            best_pruned = pruned.copy()
+        
+        candidates = stats.find_internal_nodes(pruned)
+        if len(candidates) == 0:
+            break
+        
+        # The increase in training error per leaf removed by pruning.
+        error_increase = (stats.train_leaf_errors[candidates] - 
+                          train_errors[candidates])
+        leaves_removed = num_leaves[candidates] - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weakness = np.where(leaves_removed > 0, 
+                                error_increase / leaves_removed,
+                                np.where(error_increase <= 0, 0, np.inf))
+        pruned[candidates[weakness <= weakness.min() + 1e-12]] = True
+    
+    return stats.copy_pruned(best_pruned)
+
+
+class _PruningStatistics(object):
+    """
+    The label counts of the training and validation samples reaching each 
+    node of a tree.
+    
+    The nodes are numbered breadth-first, so every node's parent has a 
+    lower number than it does.
+    """
+    
+    def __init__(self, tree, training_set, validation_set, default_label):
+        self.nodes = tree.get_nodes_breadth_first()
+        self.num_nodes = len(self.nodes)
+        self.is_leaf = np.array([node.is_leaf() for node in self.nodes])
+        
+        numbers = dict((id(node), i) for i, node in enumerate(self.nodes))
+        self.parent = np.zeros(self.num_nodes, dtype=int)
+        self.parent[0] = -1
+        self.branch = [None] * self.num_nodes
+        self.children = []
+        for number, node in enumerate(self.nodes):
+            children = []
+            for branch in node.get_branches():
+                child = numbers[id(node.get_child(branch))]
+                self.parent[child] = number
+                self.branch[child] = branch
+                children.append(child)
+            self.children.append(np.array(children, dtype=int))
+        
+        # The last column counts labels the training set doesn't have.
+        self.labels = pd.Index(pd.unique(training_set.get_labels()))
+        default_code = self._encode_labels([default_label])[0]
+        
+        compiled = CompiledTree(tree, default_label)
+        train_stops, train_reaching = self._count_labels(compiled, 
+                                                         training_set)
+        validation_stops, validation_reaching = self._count_labels(
+                                                    compiled, validation_set)
+        
+        # Leaves keep their label, pruned internal nodes take the most 
+        # common training label.
+        self.leaf_codes = np.argmax(train_reaching[:, :-1], axis=1)
+        leaves = np.flatnonzero(self.is_leaf)
+        self.leaf_codes[leaves] = self._encode_labels(
+                            [self.nodes[leaf].get_value() for leaf in leaves])
+        
+        self.train_leaf_errors = _count_errors(train_reaching, 
+                                               self.leaf_codes)
+        self.validation_leaf_errors = _count_errors(validation_reaching, 
+                                                    self.leaf_codes)
+        
+        # Samples which stop at an internal node get the default label.
+        default_codes = np.repeat(default_code, self.num_nodes)
+        self.train_stop_errors = np.where(
+                self.is_leaf, 0, _count_errors(train_stops, default_codes))
+        self.validation_stop_errors = np.where(
+                self.is_leaf, 0, 
+                _count_errors(validation_stops, default_codes))
+    
+    def _encode_labels(self, labels):
+        codes = self.labels.get_indexer(labels)
+        codes[codes < 0] = len(self.labels)
+        return codes
+    
+    def _count_labels(self, compiled, dataset):
+        """
+        Returns:
+          stops: numpy array
+            The label counts of the samples stopping at each node.
+          reaching: numpy array
+            The label counts of the samples reaching each node.
+        """
+        stops = np.zeros((self.num_nodes, len(self.labels) + 1))
+        np.add.at(stops, (compiled.find_stops(dataset.get_data_frame()), 
+                          self._encode_labels(dataset.get_labels())), 1)
+        
+        reaching = stops.copy()
+        for node in range(self.num_nodes - 1, 0, -1):
+            reaching[self.parent[node]] += reaching[node]
+        return stops, reaching
+    
+    def find_internal_nodes(self, pruned):
+        """
+        Returns:
+          The numbers of the internal nodes remaining after the nodes 
+          marked in pruned have been replaced by leaves.
+        """
+        remaining = np.zeros(self.num_nodes, dtype=bool)
+        remaining[0] = True
+        for node in range(1, self.num_nodes):
+            parent = self.parent[node]
+            remaining[node] = remaining[parent] and not pruned[parent]
+        return np.flatnonzero(remaining & ~self.is_leaf & ~pruned)
+    
+    def sum_subtrees(self, pruned):
+        """
+        Returns:
+          The number of training errors, number of leaves and number of 
+          validation errors of the subtree rooted at each node, after the 
+          nodes marked in pruned have been replaced by leaves.
+        """
+        train_errors = np.zeros(self.num_nodes)
+        num_leaves = np.zeros(self.num_nodes, dtype=int)
+        validation_errors = np.zeros(self.num_nodes)
+        for node in reversed(range(self.num_nodes)):
+            if self.is_leaf[node] or pruned[node]:
+                train_errors[node] = self.train_leaf_errors[node]
+                num_leaves[node] = 1
+                validation_errors[node] = self.validation_leaf_errors[node]
+            else:
+                children = self.children[node]
+                train_errors[node] = (self.train_stop_errors[node] + 
+                                      train_errors[children].sum())
+                num_leaves[node] = num_leaves[children].sum()
+                validation_errors[node] = (
+                            self.validation_stop_errors[node] + 
+                            validation_errors[children].sum())
+        return train_errors, num_leaves, validation_errors
+    
+    def copy_pruned(self, pruned):
+        """
+        Copies the tree, replacing the nodes marked in pruned with leaves.
+        
+        Returns:
+          A new Tree.
+        """
+        copies = [None] * self.num_nodes
+        for number, node in enumerate(self.nodes):
+            parent = self.parent[number]
+            if parent >= 0 and (copies[parent] is None or pruned[parent]):
+                continue
+            
+            if self.is_leaf[number]:
+                copy = Node(node.get_value())
+            elif pruned[number]:
+                copy = Node(self.labels[self.leaf_codes[number]])
+            elif isinstance(node, ThresholdNode):
+                copy = ThresholdNode(node.get_value(), node.get_threshold())
+            else:
+                copy = Node(node.get_value())
+            copies[number] = copy
+            
+            if parent >= 0:
+                copies[parent].add_child(self.branch[number], copy)
+        
+        return Tree(copies[0])
+
+
+def _count_errors(label_counts, predicted_codes):
+    """
+    Returns:
+      The number of samples at each node not labelled with the node's 
+      predicted label.
+    """
+    return (label_counts.sum(axis=1) - 
+            label_counts[np.arange(len(label_counts)), predicted_codes])
@@ -25,8 +25,6 @@ Plots decision trees.
 
 import matplotlib.pyplot as plt
 
-from pml.supervised.decision_trees.trees import Tree
-
 class MatplotlibAnnotationTreePlotter(object):
     """
     Plots a decision tree with matplotlib by using annotations.
@@ -68,38 +66,48 @@ class MatplotlibAnnotationTreePlotter(object):
         y_mid = (parent_point[1] - center_point[1]) / 2.0 + center_point[1]
         self.axis.text(x_mid, y_mid, text)
     
-    def _plot_tree_recursively(self, tree, parent_point, node_text):
+    def _plot_tree(self, tree):
         """
-        Plots the provided tree.  This function works by recursively plotting
-        subtrees.
+        Plots the provided tree.  Subtrees are plotted depth first, using an 
+        explicit stack of the nodes still to be plotted rather than 
+        recursion, so deep trees don't exceed Python's recursion limit.
         """
-        current_root = tree.get_root_node()
-        center_point = (
-            self.x_offset + 
-            (1.0 + tree.get_num_leaves()) / (2.0 * self.nodes_across), 
-            self.y_offset)
-        
-        self._plot_mid_text(center_point, parent_point, node_text)
-        self._plot_node(current_root, center_point, parent_point, 
-                        self.decision_node_type)
-        
-        self.y_offset -= 1.0 / self.nodes_high
+        num_leaves = _count_leaves_below(tree)
         
-        for branch in current_root.get_branches():
-            child_node = current_root.get_child(branch)
+        # Each entry is a (node, parent point, branch text, is subtree) 
+        # tuple, or None to move back up a level once a subtree is done.
+        stack = [(tree.get_root_node(), (0.5, 1.0), "", True)]
+        while stack:
+            entry = stack.pop()
+            if entry is None:
+                self.y_offset += 1.0 / self.nodes_high
+                continue
             
-            if child_node.is_leaf():
+            node, parent_point, node_text, is_subtree = entry
+            if not is_subtree:
                 self.x_offset += 1.0 / self.nodes_across
-                self._plot_node(child_node, (self.x_offset, self.y_offset), 
-                                center_point, self.leaf_node_type)
+                self._plot_node(node, (self.x_offset, self.y_offset), 
+                                parent_point, self.leaf_node_type)
                 self._plot_mid_text((self.x_offset, self.y_offset), 
-                                    center_point, branch)
-                
-            else:
-                self._plot_tree_recursively(Tree(child_node), 
-                                            center_point, branch)
-                
-        self.y_offset += 1.0 / self.nodes_high
+                                    parent_point, node_text)
+                continue
+            
+            center_point = (
+                self.x_offset + 
+                (1.0 + num_leaves[id(node)]) / (2.0 * self.nodes_across), 
+                self.y_offset)
+            
+            self._plot_mid_text(center_point, parent_point, node_text)
+            self._plot_node(node, center_point, parent_point, 
+                            self.decision_node_type)
+            
+            self.y_offset -= 1.0 / self.nodes_high
+            
+            stack.append(None)
+            for branch in reversed(list(node.get_branches())):
+                child_node = node.get_child(branch)
+                stack.append((child_node, center_point, branch, 
+                              not child_node.is_leaf()))
     
     def plot(self):
         """
@@ -116,6 +124,25 @@ class MatplotlibAnnotationTreePlotter(object):
         self.nodes_high = float(self.tree.get_depth())
         self.x_offset = -0.5 / self.nodes_across
         self.y_offset = 1.0
-        self._plot_tree_recursively(self.tree, (0.5, 1.0), "")
+        self._plot_tree(self.tree)
         plt.show()
         
+
+
+def _count_leaves_below(tree):
+    """
+    Counts the leaves below each node of a tree, visiting the nodes 
+    bottom-up.
+    
+    Returns:
+      A dictionary from the id of each node to its number of leaves.
+    """
+    num_leaves = {}
+    for node in reversed(tree.get_nodes_breadth_first()):
+        if node.is_leaf():
+            num_leaves[id(node)] = 1
+        else:
+            num_leaves[id(node)] = sum(
+                    num_leaves[id(node.get_child(branch))] 
+                    for branch in node.get_branches())
+    return num_leaves
@@ -23,6 +23,9 @@ Data structures for representing trees.
 @author: drusk
 """
 
+import bisect
+import sys
+
 class Tree(object):
     """
     A tree containing nodes which are connected to each other by directed 
@@ -39,8 +42,28 @@ class Tree(object):
         """
         self._root_node = root_node
         
-        self._all_nodes = root_node.get_all_descendants()
-        self._all_nodes.append(root_node)
+        # Nodes built separately may have their own codebooks, which are 
+        # merged into the root's.
+        self._codebook = root_node._codebook
+        if self._codebook is None:
+            self._codebook = root_node._codebook = BranchCodebook()
+        
+        # The nodes are finalized and the statistics gathered in one depth 
+        # first pass, so the tree's nodes shouldn't be changed afterwards.
+        self._all_nodes = []
+        self._num_leaves = 0
+        self._depth = 0
+        stack = [(root_node, 1)]
+        while stack:
+            node, level = stack.pop()
+            node._finalize(self._codebook)
+            self._all_nodes.append(node)
+            if node.is_leaf():
+                self._num_leaves += 1
+                self._depth = max(self._depth, level)
+            else:
+                stack.extend((child, level + 1) 
+                             for child in reversed(node._children))
         
     def get_root_node(self):
         """
@@ -53,6 +76,15 @@ class Tree(object):
         """
         return self._root_node
     
+    def get_nodes_breadth_first(self):
+        """
+        Lists the nodes of the tree level by level, starting with the root.
+        
+        Returns:
+          nodes: list(Node)
+        """
+        return _list_breadth_first(self._root_node)
+    
     def get_leaves(self):
         """
         Retrieves all leaf nodes from the tree.
@@ -69,7 +101,17 @@ class Tree(object):
         Returns:
           num_leaves: int
         """
-        return len(self.get_leaves())
+        return self._num_leaves
+    
+    def get_num_nodes(self):
+        """
+        Counts the number of nodes in the tree, including the root and the 
+        leaves.
+        
+        Returns:
+          num_nodes: int
+        """
+        return len(self._all_nodes)
     
     def get_depth(self):
         """
@@ -78,18 +120,159 @@ class Tree(object):
         Returns:
           depth: int
         """
-        return self._root_node.get_height() + 1
+        return self._depth
+
+    def get_codebook(self):
+        """
+        Retrieves the codebook of the branches of the tree's nodes.
+        
+        Returns:
+          codebook: BranchCodebook
+        """
+        return self._codebook
+    
+    def get_memory_usage(self):
+        """
+        Measures the memory used by the structure of the tree: its nodes, 
+        the containers linking them to their children, their values and 
+        other attributes, and the branch codebook.  Objects shared by 
+        several nodes, e.g. a feature name, are counted once.
+        
+        Returns:
+          num_bytes: int
+            The number of bytes.  Divide by get_num_nodes() for the 
+            average number of bytes per node.
+        """
+        seen = set(id(node) for node in self._all_nodes)
+        seen.add(id(self._codebook))
+        objects = self._all_nodes + [self._codebook]
+        
+        num_bytes = 0
+        while objects:
+            obj = objects.pop()
+            num_bytes += sys.getsizeof(obj)
+            for referent in _get_referents(obj):
+                if id(referent) not in seen:
+                    seen.add(id(referent))
+                    objects.append(referent)
+        
+        return num_bytes
+
+    def __getstate__(self):
+        # Pickling the nodes themselves would recurse once per level of the 
+        # tree, so they are pickled as a flat list instead.
+        nodes = self.get_nodes_breadth_first()
+        numbers = dict((id(node), i) for i, node in enumerate(nodes))
+        flattened = []
+        for node in nodes:
+            flattened.append((type(node), _get_attributes(node), 
+                              node._branch_codes, 
+                              [numbers[id(child)] 
+                               for child in node._children]))
+        return self._codebook, flattened
+    
+    def __setstate__(self, state):
+        codebook, flattened = state
+        nodes = [node_type.__new__(node_type) 
+                 for node_type, _, _, _ in flattened]
+        for node, (_, attributes, branch_codes, children) in zip(nodes, 
+                                                                  flattened):
+            for name, value in attributes.items():
+                setattr(node, name, value)
+            node._codebook = codebook
+            node._branch_codes = branch_codes
+            node._children = tuple(nodes[child] for child in children)
+        self.__init__(nodes[0])
 
     def __repr__(self):
-        return "{ '%s': %s }" % (self._root_node._value, self._root_node._children)
+        return "{ '%s': %s }" % (self._root_node._value, 
+                                 _format_children(self._root_node))
+    
+
+class BranchCodebook(object):
+    """
+    Interns the branches of a tree's nodes as integer codes.  The nodes of a 
+    tree share one codebook, so each distinct branch is stored once however 
+    many nodes have it.  Nodes with the same branch codes share one tuple 
+    of them too.
+    """
+    
+    def __init__(self):
+        """
+        Constructs a new, empty codebook.
+        """
+        self._codes = {}
+        self._branches = []
+        self._code_tuples = {}
+    
+    def encode(self, branch):
+        """
+        Retrieves the code for a branch, assigning it the next code if the 
+        branch is new.
+        
+        Args:
+          branch:
+            The branch identifier.
+            
+        Returns:
+          code: int
+        """
+        code = self._codes.get(branch)
+        if code is None:
+            code = self._codes[branch] = len(self._branches)
+            self._branches.append(branch)
+        return code
+    
+    def get_code(self, branch):
+        """
+        Returns:
+          code: int
+            The code for a branch, or None if the branch is not in the 
+            codebook.
+        """
+        return self._codes.get(branch)
+    
+    def get_branch(self, code):
+        """
+        Returns:
+          The branch identifier with the given code.
+        """
+        return self._branches[code]
+    
+    def intern(self, codes):
+        """
+        Args:
+          codes: tuple(int)
+            The branch codes of a node.
+            
+        Returns:
+          An equal tuple, shared by all nodes with these codes.
+        """
+        return self._code_tuples.setdefault(codes, codes)
+    
+    def __len__(self):
+        return len(self._branches)
     
 
 class Node(object):
     """
     A node in a tree.  Holds a value and may have branches connecting it to
     other nodes.
+    
+    The branches are stored as integer codes from a codebook shared with 
+    the node's parent and children.  While the tree is being built the 
+    children are kept in a dictionary keyed by code.  Once the node is part 
+    of a Tree they are stored as a tuple ordered by code, alongside a tuple 
+    of the codes which is shared with every other node having the same 
+    branches.  Along with __slots__ this keeps nodes small, since a large 
+    tree or forest has very many of them.
+    
+    The branches are listed in the order of their codes, i.e. the order 
+    they were first added to any node sharing the codebook.
     """
     
+    __slots__ = ("_value", "_codebook", "_branch_codes", "_children")
+    
     def __init__(self, value):
         """
         Constructs a new node.
@@ -99,7 +282,10 @@ class Node(object):
             The data value to be associated with this node.
         """
         self._value = value
-        self._children = {}
+        self._codebook = None
+        # None while the children are a dictionary being built
+        self._branch_codes = ()
+        self._children = ()
     
     def get_value(self):
         """
@@ -126,7 +312,17 @@ class Node(object):
         Returns:
           void
         """
-        self._children[branch] = child
+        if self._codebook is None:
+            self._codebook = child._codebook
+            if self._codebook is None:
+                self._codebook = BranchCodebook()
+        if child._codebook is None:
+            child._codebook = self._codebook
+        
+        if self._branch_codes is not None:
+            self._children = dict(zip(self._branch_codes, self._children))
+            self._branch_codes = None
+        self._children[self._encode_branch(branch)] = child
     
     def get_child(self, branch):
         """
@@ -144,7 +340,33 @@ class Node(object):
         Raises:
           KeyError if the specified branch does not exist.
         """
-        return self._children[branch]
+        code = self._find_code(branch)
+        if code is not None:
+            if self._branch_codes is None:
+                if code in self._children:
+                    return self._children[code]
+            else:
+                i = bisect.bisect_left(self._branch_codes, code)
+                if i < len(self._branch_codes) and \
+                        self._branch_codes[i] == code:
+                    return self._children[i]
+        raise KeyError(branch)
+    
+    def get_branch(self, value):
+        """
+        Determines which branch a sample with a given value for this node's 
+        feature should follow.
+        
+        Args:
+          value:
+            The sample's value for the feature.
+            
+        Returns:
+          branch:
+            The identifier of the branch.  For this type of node the value 
+            itself is the branch.
+        """
+        return value
     
     def get_branches(self):
         """
@@ -155,7 +377,11 @@ class Node(object):
             A list of all the branches to child nodes.  Note that this means
             branches TO this node are not included.
         """
-        return self._children.keys()
+        if self._branch_codes is None:
+            codes = sorted(self._children)
+        else:
+            codes = self._branch_codes
+        return [self._decode_branch(code) for code in codes]
     
     def is_leaf(self):
         """
@@ -177,10 +403,12 @@ class Node(object):
         """
         max_distance = 0
         
-        for branch in self.get_branches():
-            distance = self.get_child(branch).get_height() + 1
-            if distance > max_distance:
-                max_distance = distance
+        stack = [(self, 0)]
+        while stack:
+            node, distance = stack.pop()
+            max_distance = max(max_distance, distance)
+            stack.extend((node.get_child(branch), distance + 1) 
+                         for branch in node.get_branches())
         
         return max_distance
     
@@ -192,18 +420,217 @@ class Node(object):
         
         Returns:
           descendants: list(Node)
+            The descendants in depth first order, each node before its own 
+            descendants.
         """
         descendants = []
         
-        for branch in self.get_branches():
-            child_node = self.get_child(branch)
-            descendants.append(child_node)
-            descendants.extend(child_node.get_all_descendants())
+        stack = [self.get_child(branch) 
+                 for branch in reversed(list(self.get_branches()))]
+        while stack:
+            node = stack.pop()
+            descendants.append(node)
+            stack.extend(node.get_child(branch) 
+                         for branch in reversed(list(node.get_branches())))
         
         return descendants
     
+    def _encode_branch(self, branch):
+        return self._codebook.encode(branch)
+    
+    def _find_code(self, branch):
+        if self._codebook is None:
+            return None
+        return self._codebook.get_code(branch)
+    
+    def _decode_branch(self, code):
+        return self._codebook.get_branch(code)
+    
+    def _finalize(self, codebook):
+        """
+        Switches the node to its tree's codebook, re-encoding its branches, 
+        and stores its children as tuples ordered by branch code.
+        """
+        if self._codebook is not codebook:
+            branches = self.get_branches()
+            nodes = [self.get_child(branch) for branch in branches]
+            self._codebook = codebook
+            children = zip([self._encode_branch(branch) 
+                            for branch in branches], nodes)
+        elif self._branch_codes is None:
+            children = self._children.items()
+        else:
+            return
+        
+        children = sorted(children, key=lambda code_child: code_child[0])
+        self._branch_codes = codebook.intern(
+                                tuple(code for code, _ in children))
+        self._children = tuple(child for _, child in children)
+    
     def __repr__(self):
         if self.is_leaf():
             return "'%s'" % self._value
         else:
-            return "{ '%s': %s }" % (self._value, self._children)
\ No newline at end of file
+            return "{ '%s': %s }" % (self._value, _format_children(self))
+
+
+class ThresholdNode(Node):
+    """
+    A node which splits a numeric feature in two.  Samples whose value is 
+    less than or equal to the threshold follow the left branch, the rest 
+    follow the right branch.
+    """
+    
+    __slots__ = ("_threshold", )
+    
+    def __init__(self, feature, threshold):
+        """
+        Constructs a new threshold node.
+        
+        Args:
+          feature:
+            The feature which is split on.  This is the node's value.
+          threshold: float
+            The largest value which follows the left branch.
+        """
+        super(ThresholdNode, self).__init__(feature)
+        self._threshold = threshold
+        
+    def get_threshold(self):
+        """
+        Returns:
+          threshold: float
+            The largest value which follows the left branch.
+        """
+        return self._threshold
+    
+    def get_left_branch(self):
+        """
+        Returns:
+          The identifier of the branch for values less than or equal to the 
+          threshold.
+        """
+        return "<= %g" % self._threshold
+    
+    def get_right_branch(self):
+        """
+        Returns:
+          The identifier of the branch for values greater than the threshold.
+        """
+        return "> %g" % self._threshold
+    
+    def get_branch(self, value):
+        """
+        Determines which branch a sample with a given value for this node's 
+        feature should follow.
+        
+        Args:
+          value: float
+            The sample's value for the feature.
+            
+        Returns:
+          branch:
+            The identifier of the left or right branch, or None if the value 
+            is missing.
+        """
+        if value is None or value != value:
+            # Missing (None or NaN) values don't follow either branch
+            return None
+        
+        if value <= self._threshold:
+            return self.get_left_branch()
+        else:
+            return self.get_right_branch()
+    
+    def _encode_branch(self, branch):
+        code = self._find_code(branch)
+        if code is None:
+            raise ValueError("Threshold node at %g only has branches '%s' "
+                             "and '%s', not '%s'" % (self._threshold, 
+                                self.get_left_branch(), 
+                                self.get_right_branch(), branch))
+        return code
+    
+    def _find_code(self, branch):
+        # The left and right branches are always codes 0 and 1, so they 
+        # aren't added to the codebook.
+        if branch == self.get_left_branch():
+            return 0
+        elif branch == self.get_right_branch():
+            return 1
+        return None
+    
+    def _decode_branch(self, code):
+        if code == 0:
+            return self.get_left_branch()
+        return self.get_right_branch()
+
+
+def _list_breadth_first(root):
+    """
+    Returns:
+      A list of the nodes below and including root, level by level.
+    """
+    nodes = [root]
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+        nodes.extend(node.get_child(branch) for branch in node.get_branches())
+        i += 1
+    return nodes
+
+def _format_children(root):
+    """
+    Formats the children of a node like a dictionary from branches to the 
+    representations of the subtrees.  The subtrees are formatted bottom-up 
+    rather than recursively.
+    
+    Returns:
+      The formatted string.
+    """
+    formatted = {}
+    for node in reversed(_list_breadth_first(root)):
+        children = "{%s}" % ", ".join(
+                "%r: %s" % (branch, formatted[id(node.get_child(branch))]) 
+                for branch in node.get_branches())
+        if node is root:
+            return children
+        elif node.is_leaf():
+            formatted[id(node)] = "'%s'" % node._value
+        else:
+            formatted[id(node)] = "{ '%s': %s }" % (node._value, children)
+
+# The slots of a node which link it to its children.
+_LINK_SLOTS = ("_codebook", "_branch_codes", "_children")
+
+def _get_attributes(node):
+    """
+    Returns:
+      A dictionary of the node's slots, other than those linking it to its 
+      children.
+    """
+    attributes = {}
+    for node_type in type(node).__mro__:
+        for name in node_type.__dict__.get("__slots__", ()):
+            if name not in _LINK_SLOTS:
+                attributes[name] = getattr(node, name)
+    return attributes
+
+def _get_referents(obj):
+    """
+    Returns:
+      The objects held by a node, codebook or container, excluding nodes.
+    """
+    if isinstance(obj, dict):
+        referents = list(obj.keys()) + list(obj.values())
+    elif isinstance(obj, (list, tuple)):
+        referents = list(obj)
+    elif isinstance(obj, Node):
+        referents = list(_get_attributes(obj).values()) + [
+                            obj._codebook, obj._branch_codes, obj._children]
+    elif isinstance(obj, BranchCodebook):
+        referents = [obj.__dict__]
+    else:
+        referents = []
+    return [referent for referent in referents 
+            if not isinstance(referent, Node)]
@@ -24,10 +24,24 @@ K-nearest neighbours classification algorithm.
 """
 
 import collections
+import os
+import pickle
+from timeit import default_timer as timer
 
+import numpy as np
+import pandas as pd
+
+from pml.data import model
+from pml.supervised import prototype_reduction
 from pml.supervised.classifiers import AbstractClassifier
-from pml.utils import distance_utils
+from pml.tools import spatial_index
 from pml.utils import collection_utils
+from pml.utils import distance_utils
+from pml.utils.errors import UnlabelledDataSetError
+
+# Names of the files making up a saved Knn model's directory.
+_MATRIX_FILENAME = "training_matrix.npy"
+_MODEL_FILENAME = "model.pickle"
 
 class Knn(AbstractClassifier):
     """
@@ -43,9 +57,21 @@ class Knn(AbstractClassifier):
     
     This is an example of a 'lazy learning' algorithm where all computation is 
     deferred until classification.
+    
+    Training samples can be added and removed after construction.  They are 
+    held in arrays with spare capacity which grow geometrically.  Until 
+    enough samples have changed for the spatial index to be rebuilt, new 
+    samples are searched by brute force alongside the index, and removed 
+    samples are filtered out of its results.
     """
     
-    def __init__(self, training_set, k=5):
+    # The index is rebuilt once the number of samples added or removed since 
+    # it was built exceeds this fraction of the samples it contains.
+    REBUILD_FRACTION = 0.25
+    
+    def __init__(self, training_set, k=5, metric="euclidean", 
+                 metric_params=None, index="brute", approximate=False, 
+                 index_params=None, weights="uniform", radius=None):
         """
         Constructs a new Knn classifier.
         
@@ -56,12 +82,86 @@ class Knn(AbstractClassifier):
             The number of nearest neighbours to consider when voting for a 
             sample's class.  Must be a positive integer, preferably small.  
             Default value is 5.
+          metric: string or callable
+            How to measure the distance between samples.  Either the name of 
+            a metric in distance_utils.METRICS, such as "euclidean", 
+            "manhattan", "minkowski", "cosine" or "mahalanobis", or a 
+            function which takes two vectors and returns their distance.  
+            Such functions are much slower.  Default value is "euclidean".
+          metric_params: dict
+            Additional keyword arguments for the metric, e.g. {"p": 3} for 
+            "minkowski".  For "mahalanobis" the inverse covariance "VI" is 
+            estimated from the training set if not provided.  Defaults to 
+            None.
+          index: string
+            The spatial index used to find neighbours.  One of "brute" 
+            (compare against every training example), "kd_tree", 
+            "ball_tree" or "auto" (KD-tree for low dimensional data, ball 
+            tree otherwise).  The index is built once, here.  Default value 
+            is "brute".
+          approximate: boolean
+            Set to True to find neighbours with a random projection forest 
+            instead of the index selected above.  This is much faster for 
+            large, high dimensional training sets but some of the true 
+            nearest neighbours may be missed.  Use measure_recall to check 
+            the trade-off.  Defaults to False.
+          index_params: dict
+            Additional parameters for the index, e.g. leaf_size, or 
+            num_trees and random_state for the approximate index.  Set 
+            triangle_inequality to True if a metric function satisfies the 
+            triangle inequality, so that "auto" may use a ball tree.  
+            Defaults to None.
+          weights: string
+            How neighbours' votes are weighted.  "uniform" gives each 
+            neighbour one vote.  "distance" weights each vote by the inverse 
+            of the neighbour's distance, so that nearer neighbours count 
+            more; if any neighbours are at distance 0, only they vote.  
+            Default value is "uniform".
+          radius: float
+            If set, a sample is classified by all of the training examples 
+            within this distance of it instead of its k nearest.  Samples 
+            with no training examples in range fall back to their k nearest.  
+            Defaults to None.
             
         Raises:
           UnlabelledDataSetError if the training set is not labelled.
+          
+          ValueError if the metric, index type or weights are not 
+          recognized, or the index doesn't support the metric.
         """
+        if weights not in ("uniform", "distance"):
+            raise ValueError("Unknown weights '%s'.  Supported weights are: "
+                             "uniform, distance" % weights)
+        
         super(Knn, self).__init__(training_set)
         self.k = k
+        self.weights = weights
+        self.radius = radius
+        self._features = training_set.feature_list()
+        
+        # Keep the training data as plain arrays so that distances to many 
+        # samples can be computed at once.
+        training_matrix = np.ascontiguousarray(
+                            training_set.get_data_frame().values, dtype=float)
+        
+        self.metric = metric
+        self.metric_params = dict(metric_params or {})
+        if (distance_utils.get_metric_name(metric) == "mahalanobis" and 
+            "VI" not in self.metric_params):
+            self.metric_params["VI"] = distance_utils.inverse_covariance(
+                                                            training_matrix)
+        # Anything the metric derives from its parameters, e.g. the 
+        # Mahalanobis transform, is computed once rather than per query.
+        self._distance_params = distance_utils.prepare_metric_params(
+                                                metric, self.metric_params)
+        
+        self._index_kind = "rp_forest" if approximate else index
+        self._index_params = dict(index_params or {})
+        
+        self._set_training_data(training_matrix, 
+                                training_set.get_labels().values, 
+                                training_set.get_sample_ids())
+        self._build_index()
         
     def __str__(self):
         """
@@ -70,7 +170,335 @@ class Knn(AbstractClassifier):
           purposes.
         """
         return "<KNN Classifier: k=%d, trained on %d samples>" \
-            % (self.k, self.training_set.num_samples())
+            % (self.k, self._size - self._num_removed)
+
+    @property
+    def training_set(self):
+        """
+        The labelled DataSet of training samples.  If samples have been 
+        added or removed it is recreated from the current training data the 
+        first time it is requested.
+        """
+        if self._training_set is None:
+            active = self._active_positions()
+            sample_ids = self._id_buffer[active].tolist()
+            self._training_set = model.DataSet(
+                    pd.DataFrame(self._buffer[active], index=sample_ids, 
+                                 columns=self._features), 
+                    labels=pd.Series(self._label_buffer[active], 
+                                     index=sample_ids))
+        return self._training_set
+    
+    @training_set.setter
+    def training_set(self, training_set):
+        self._training_set = training_set
+
+    def add_samples(self, dataset):
+        """
+        Adds labelled samples to the training set without rebuilding the 
+        classifier.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            The labelled samples to add.  They must have the same features 
+            as the training set.
+            
+        Returns:
+          void
+          
+        Raises:
+          UnlabelledDataSetError if the dataset is not labelled.
+          
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        dataset = model.as_dataset(dataset)
+        if not dataset.is_labelled():
+            raise UnlabelledDataSetError(custom_message=("Samples added to "
+                                                         "the training set "
+                                                         "must be labelled."))
+        self._check_features(dataset.feature_list())
+        
+        start = self._size
+        end = start + dataset.num_samples()
+        self._ensure_capacity(end)
+        
+        sample_ids = dataset.get_sample_ids()
+        self._buffer[start:end] = self._as_matrix(dataset)
+        self._label_buffer[start:end] = dataset.get_labels().values
+        self._id_buffer[start:end] = sample_ids
+        self._removed[start:end] = False
+        for position, sample_id in enumerate(sample_ids, start):
+            self._positions.setdefault(sample_id, []).append(position)
+        
+        self._size = end
+        self._training_set = None
+        self._rebuild_if_needed()
+
+    def remove_samples(self, sample_ids):
+        """
+        Removes samples from the training set without rebuilding the 
+        classifier.
+        
+        Args:
+          sample_ids: list
+            The ids of the samples to remove.  If several training samples 
+            share an id they are all removed.
+            
+        Returns:
+          void
+          
+        Raises:
+          KeyError if an id is not in the training set.
+          
+          ValueError if every training sample would be removed.
+        """
+        missing = [sample_id for sample_id in sample_ids 
+                   if sample_id not in self._positions]
+        if missing:
+            raise KeyError("Sample ids not in training set: %s" % missing)
+        
+        positions = []
+        for sample_id in set(sample_ids):
+            positions.extend(self._positions[sample_id])
+        if self._num_removed + len(positions) >= self._size:
+            raise ValueError("Can't remove every training sample.")
+        
+        for sample_id in set(sample_ids):
+            del self._positions[sample_id]
+        self._removed[positions] = True
+        self._num_removed += len(positions)
+        self._training_set = None
+        self._rebuild_if_needed()
+
+    def save(self, path):
+        """
+        Saves the classifier so that it can be restored with Knn.load 
+        without reloading or reprocessing the training data.
+        
+        The training data is stored as a contiguous array of floats in its 
+        own file so that it can be memory-mapped when loaded.  The labels, 
+        parameters and spatial index are stored alongside it.
+        
+        Args:
+          path: string
+            The directory to save the model in.  It is created if it 
+            doesn't exist.
+            
+        Returns:
+          void
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        
+        # Fold in any pending changes so that only live samples are saved.
+        if self._size > self._indexed or self._num_removed > 0:
+            self._rebuild()
+        
+        np.save(os.path.join(path, _MATRIX_FILENAME), 
+                self._buffer[:self._size])
+        
+        state = dict(self.__dict__)
+        for attribute in ["_buffer", "_training_set", "_positions"]:
+            del state[attribute]
+        for attribute in ["_label_buffer", "_id_buffer", "_removed"]:
+            state[attribute] = state[attribute][:self._size]
+        
+        # The index refers to the training matrix, which is already saved.
+        index_data = self._index.data
+        self._index.data = None
+        try:
+            with open(os.path.join(path, _MODEL_FILENAME), "wb") as model_file:
+                pickle.dump(state, model_file, pickle.HIGHEST_PROTOCOL)
+        finally:
+            self._index.data = index_data
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a classifier saved with Knn.save.
+        
+        Args:
+          path: string
+            The directory the model was saved in.
+          mmap: boolean
+            Set to True to memory-map the training data instead of reading 
+            it into memory.  Loading is then nearly instant, and processes 
+            on the same host which load the same model share one copy of 
+            the data through the operating system's page cache.  The mapped 
+            file is never modified; adding samples copies the training data 
+            into memory.  Defaults to True.
+            
+        Returns:
+          classifier: Knn
+        """
+        with open(os.path.join(path, _MODEL_FILENAME), "rb") as model_file:
+            state = pickle.load(model_file)
+        
+        mmap_mode = "r" if mmap else None
+        matrix = np.load(os.path.join(path, _MATRIX_FILENAME), 
+                         mmap_mode=mmap_mode)
+        
+        classifier = cls.__new__(cls)
+        classifier.__dict__.update(state)
+        classifier._buffer = matrix
+        classifier._index.data = matrix
+        classifier._positions = _map_positions(classifier._id_buffer)
+        classifier._training_set = None
+        return classifier
+
+    def condense(self, edit=True, validation_set=None, random_state=None):
+        """
+        Creates a classifier which uses a much smaller set of prototypes 
+        selected from this classifier's training set, so that queries are 
+        faster.  See prototype_reduction.reduce_prototypes.
+        
+        The new classifier has the same metric and index settings, but 
+        classifies by the single nearest prototype: Hart's algorithm only 
+        guarantees that the prototypes classify the training set correctly 
+        under 1-NN, and a vote of k > 1 over so few prototypes can be 
+        dominated by the wrong class.
+        
+        Args:
+          edit: boolean
+            Set to True to remove noisy samples with Wilson editing before 
+            condensing with Hart's algorithm.  Defaults to True.
+          validation_set: model.DataSet
+            Labelled samples used to measure the change in accuracy.  If not 
+            provided, the training set is used, which tends to overstate 
+            this classifier's accuracy.  Defaults to None.
+          random_state: int
+            Seeds the order samples are visited in while condensing.  
+            Defaults to None.
+            
+        Returns:
+          classifier: Knn
+            The classifier using the selected prototypes.
+          report: dict
+            "num_samples" and "num_prototypes" are the sizes of the training 
+            set before and after reduction.  "accuracy" and 
+            "condensed_accuracy" are the accuracies of this classifier and 
+            the new one on the validation set.
+            
+        Raises:
+          UnlabelledDataSetError if the validation set is not labelled.
+        """
+        if validation_set is None:
+            validation_set = self.training_set
+        
+        prototypes = prototype_reduction.reduce_prototypes(
+                            self.training_set, edit=edit, k=self.k, 
+                            metric=self.metric, 
+                            metric_params=self.metric_params, 
+                            random_state=random_state)
+        
+        classifier = Knn(prototypes, k=1, metric=self.metric, 
+                         metric_params=self.metric_params, 
+                         index=self._index_kind, 
+                         index_params=self._index_params, 
+                         weights=self.weights, radius=self.radius)
+        
+        report = {
+            "num_samples": self._size - self._num_removed, 
+            "num_prototypes": prototypes.num_samples(), 
+            "accuracy": self.classify_all(
+                                    validation_set).compute_accuracy(), 
+            "condensed_accuracy": classifier.classify_all(
+                                    validation_set).compute_accuracy()
+        }
+        return classifier, report
+
+    def radius_neighbours(self, dataset, radius=None):
+        """
+        Finds the training samples within a given distance of each sample in 
+        a dataset.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            The samples to find neighbours for.
+          radius: float
+            The maximum distance of a neighbour (inclusive).  Defaults to 
+            the classifier's radius.
+            
+        Returns:
+          neighbours: list
+            A pandas Series for each sample, in the same order as the 
+            dataset.  It maps the ids of the training samples in range to 
+            their distances, ordered from nearest to furthest.
+            
+        Raises:
+          ValueError if no radius is given and the classifier doesn't have 
+          one.
+          
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        if radius is None:
+            radius = self.radius
+        if radius is None:
+            raise ValueError("A radius is required.")
+        
+        dataset = model.as_dataset(dataset)
+        self._check_features(dataset.feature_list())
+        
+        all_distances, all_positions = self._query_radius(
+                                            self._as_matrix(dataset), radius)
+        return [pd.Series(distances, index=self._id_buffer[positions])
+                for distances, positions in zip(all_distances, all_positions)]
+
+    def get_index_timings(self):
+        """
+        Reports the cost of the spatial index used to find neighbours, which 
+        can be used to choose the best index for a dataset.
+        
+        Returns:
+          timings: dict
+            The index's build time and total query time in seconds, and the 
+            number of samples it has been queried for.
+        """
+        return self._index.get_timings()
+
+    def measure_recall(self, dataset):
+        """
+        Measures how many of the true k nearest neighbours are found by this 
+        classifier's index.  This is mainly useful in approximate mode to 
+        check the accuracy being traded for speed.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            Holdout samples to use as queries.
+            
+        Returns:
+          results: dict
+            "recall" is the fraction of the exact nearest neighbours which 
+            were found, between 0 and 1.  "index_time" and "exact_time" are 
+            the seconds taken by this classifier's index and by an exact 
+            brute force search.
+        """
+        dataset = model.as_dataset(dataset)
+        self._check_features(dataset.feature_list())
+        queries = self._as_matrix(dataset)
+        
+        start = timer()
+        neighbours = self._find_neighbours(queries)
+        index_time = timer() - start
+        
+        start = timer()
+        active = self._active_positions()
+        _, exact_neighbours = distance_utils.chunked_k_nearest(
+                                    queries, self._buffer[active], self.k, 
+                                    metric=self.metric, 
+                                    metric_params=self._distance_params)
+        exact_neighbours = active[exact_neighbours]
+        exact_time = timer() - start
+        
+        found = 0
+        for approximate_row, exact_row in zip(neighbours, exact_neighbours):
+            found += len(np.intersect1d(approximate_row, exact_row))
+        
+        return {"recall": float(found) / exact_neighbours.size, 
+                "index_time": index_time, 
+                "exact_time": exact_time}
 
     def _classify(self, sample):
         """
@@ -83,36 +511,362 @@ class Knn(AbstractClassifier):
         Returns:
           The sample's classification.
         """
-        # This function is used so that we can reduce each row with respect 
-        # to the sample.
-        def calc_dist(vector):
-            return distance_utils.euclidean(vector, sample)
-
-        distances = self.training_set.reduce_rows(calc_dist)
+        query = np.asarray(sample[self._features].values, dtype=float)
+        distances, neighbours = self._find_voters(query[np.newaxis, :])
         
-        votes = self._tally_votes(self.training_set.get_labels(), distances)
+        votes = self._tally_votes(self._label_buffer, neighbours[0], 
+                                  distances[0])
         
         return collection_utils.get_key_with_highest_value(votes)
 
-    def _tally_votes(self, labels, distances):
+    def _classify_all(self, dataset):
+        """
+        Predicts the classification of every sample in a dataset at once.
+        
+        The distances between all samples and all training examples are 
+        computed as a single matrix instead of one sample at a time.
+        
+        Args:
+          dataset: model.DataSet
+            the dataset whose samples will be classified.
+            
+        Returns:
+          A pandas Series with each sample's classification, indexed by 
+          sample id.
+          
+        Raises:
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        self._check_features(dataset.feature_list())
+        
+        queries = self._as_matrix(dataset)
+        all_distances, all_neighbours = self._find_voters(queries)
+        
+        classifications = [
+            collection_utils.get_key_with_highest_value(
+                self._tally_votes(self._label_buffer, neighbours, distances))
+            for neighbours, distances in zip(all_neighbours, all_distances)]
+        
+        return pd.Series(classifications, index=dataset.get_data_frame().index)
+
+    def accuracy_by_k(self, dataset, k_max):
+        """
+        Scores the classification accuracy on a labelled dataset for every 
+        value of k from 1 to k_max, which helps with choosing k.
+        
+        The neighbours of each sample are found and sorted only once, up to 
+        k_max.  The votes are then tallied cumulatively so that the 
+        prediction for each k comes from the first k neighbours, using the 
+        same tie breaking and vote weights as classification.  The 
+        classifier's radius, if any, is ignored.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            Labelled samples to classify, e.g. a validation set.
+          k_max: int
+            The largest value of k to evaluate.
+            
+        Returns:
+          accuracies: pandas.Series
+            The percent accuracy (between 0 and 1) for each k, indexed by k.
+            
+        Raises:
+          UnlabelledDataSetError if the dataset is not labelled.
+          
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        dataset = model.as_dataset(dataset)
+        if not dataset.is_labelled():
+            raise UnlabelledDataSetError()
+        self._check_features(dataset.feature_list())
+        
+        all_distances, all_neighbours = self._query(self._as_matrix(dataset), 
+                                                    k_max)
+        
+        correct = np.zeros(k_max)
+        for neighbours, distances, label in zip(all_neighbours, all_distances, 
+                                                dataset.get_labels().values):
+            votes = collections.defaultdict(int)
+            exact_votes = collections.defaultdict(int)
+            for i in range(k_max):
+                if i < len(neighbours):
+                    neighbour_label = self._label_buffer[neighbours[i]]
+                    if self.weights == "distance" and distances[i] == 0:
+                        exact_votes[neighbour_label] += 1
+                    else:
+                        votes[neighbour_label] += self._get_vote_weight(
+                                                                distances[i])
+                    prediction = collection_utils.get_key_with_highest_value(
+                                                        exact_votes or votes)
+                # Once the neighbours run out, larger k can't change the vote
+                if prediction == label:
+                    correct[i] += 1
+        
+        return pd.Series(correct / dataset.num_samples(), 
+                         index=range(1, k_max + 1))
+
+    def _as_matrix(self, dataset):
+        """
+        Extracts a dataset's values as a float array with its columns in the 
+        same order as the training set's features.
+        """
+        return np.asarray(dataset.get_data_frame()[self._features].values, 
+                          dtype=float)
+
+    def _find_neighbours(self, queries):
+        """
+        Finds the k nearest training examples for each query.
+        
+        Args:
+          queries: numpy array
+            A 2d array with one sample per row.  The columns must be in the 
+            same order as the training set's features.
+            
+        Returns:
+          A 2d numpy array with a row for each query.  Each row holds the 
+          positions of the nearest training examples, ordered from nearest 
+          to furthest.
+        """
+        _, neighbours = self._query(queries, self.k)
+        return neighbours
+
+    def _find_voters(self, queries):
+        """
+        Finds the training examples which vote on each query's 
+        classification: those within the radius if the classifier has one, 
+        otherwise the k nearest.
+        
+        Returns:
+          distances: sequence
+            A 1d numpy array of distances for each query, ordered from 
+            nearest to furthest.
+          positions: sequence
+            The positions of the voters in the training arrays.
+        """
+        if self.radius is None:
+            return self._query(queries, self.k)
+        
+        distances, positions = self._query_radius(queries, self.radius)
+        no_voters = [i for i, voters in enumerate(positions) 
+                     if len(voters) == 0]
+        if no_voters:
+            nearest_distances, nearest_positions = self._query(
+                                                    queries[no_voters], self.k)
+            for i, query_number in enumerate(no_voters):
+                distances[query_number] = nearest_distances[i]
+                positions[query_number] = nearest_positions[i]
+        return distances, positions
+
+    def _query(self, queries, k):
+        """
+        Finds the k nearest live training samples for each query.
+        
+        The spatial index covers the samples present when it was last 
+        built.  Samples added since then are searched by brute force and 
+        removed samples are filtered out, fetching extra candidates from the 
+        index to make up for them.
+        
+        Returns:
+          distances: numpy array
+            The distance to each neighbour, one row per query, ordered from 
+            nearest to furthest.
+          positions: numpy array
+            The positions of the neighbours in the training arrays.
+        """
+        k = min(k, self._size - self._num_removed)
+        
+        removed_in_index = 0
+        removed_pending = 0
+        if self._num_removed > 0:
+            removed_in_index = np.count_nonzero(
+                                            self._removed[:self._indexed])
+            removed_pending = self._num_removed - removed_in_index
+        
+        distances, positions = self._index.query(queries, 
+                                                 k + removed_in_index)
+        if self._size == self._indexed and self._num_removed == 0:
+            return distances, positions
+        
+        if self._size > self._indexed:
+            pending_distances, pending_positions = \
+                distance_utils.chunked_k_nearest(
+                            queries, self._buffer[self._indexed:self._size], 
+                            k + removed_pending, metric=self.metric, 
+                            metric_params=self._distance_params)
+            distances = np.hstack((distances, pending_distances))
+            positions = np.hstack((positions, 
+                                   pending_positions + self._indexed))
+        
+        distances = np.where(self._removed[positions], np.inf, distances)
+        nearest = distance_utils.nearest_indices(distances, k)
+        rows = np.arange(positions.shape[0])[:, np.newaxis]
+        return distances[rows, nearest], positions[rows, nearest]
+
+    def _query_radius(self, queries, radius):
+        """
+        Finds all live training samples within a given distance of each 
+        query.  Samples added since the index was built are searched by 
+        brute force and removed samples are filtered out.
+        
+        Returns:
+          distances: list
+            A 1d numpy array of distances for each query, ordered from 
+            nearest to furthest.
+          positions: list
+            The positions of the neighbours in the training arrays.
         """
-        Counts the k nearest neighbours' votes for which classification to 
-        give the sample.
+        distances, positions = self._index.query_radius(queries, radius)
+        if self._size == self._indexed and self._num_removed == 0:
+            return distances, positions
+        
+        all_distances = [[query_distances] for query_distances in distances]
+        all_positions = [[query_positions] for query_positions in positions]
+        if self._size > self._indexed:
+            pending_distances, pending_positions = \
+                distance_utils.chunked_radius_neighbours(
+                            queries, self._buffer[self._indexed:self._size], 
+                            radius, metric=self.metric, 
+                            metric_params=self._distance_params)
+            for i in range(len(all_distances)):
+                all_distances[i].append(pending_distances[i])
+                all_positions[i].append(pending_positions[i] + self._indexed)
+        
+        distances, positions = distance_utils.sort_neighbours(all_distances, 
+                                                              all_positions)
+        for i in range(len(positions)):
+            live = ~self._removed[positions[i]]
+            distances[i] = distances[i][live]
+            positions[i] = positions[i][live]
+        return distances, positions
+
+    def _set_training_data(self, matrix, labels, sample_ids):
+        """
+        Replaces the arrays holding the training samples.  They are filled 
+        to capacity, and no samples are marked as removed.
+        """
+        self._buffer = matrix
+        self._label_buffer = np.empty(len(labels), dtype=object)
+        self._label_buffer[:] = list(labels)
+        self._id_buffer = np.empty(len(sample_ids), dtype=object)
+        self._id_buffer[:] = list(sample_ids)
+        self._removed = np.zeros(len(sample_ids), dtype=bool)
+        self._size = len(sample_ids)
+        self._num_removed = 0
+        self._positions = _map_positions(self._id_buffer)
+
+    def _build_index(self):
+        """
+        Builds the spatial index over all current training samples.
+        """
+        self._index = spatial_index.create_index(self._index_kind, 
+                                                 self._buffer[:self._size], 
+                                                 self.metric, 
+                                                 self._distance_params, 
+                                                 **self._index_params)
+        self._indexed = self._size
+
+    def _rebuild(self):
+        """
+        Discards removed samples from the training arrays and rebuilds the 
+        spatial index.
+        """
+        if self._num_removed > 0:
+            active = self._active_positions()
+            self._set_training_data(self._buffer[active], 
+                                    self._label_buffer[active], 
+                                    self._id_buffer[active])
+        self._build_index()
+
+    def _rebuild_if_needed(self):
+        """
+        Rebuilds the index once enough samples have been added or removed 
+        that searching around it costs more than rebuilding would.  This 
+        keeps the cost of each change amortized constant.
+        """
+        changed = (self._size - self._indexed) + self._num_removed
+        if changed > self.REBUILD_FRACTION * self._indexed:
+            self._rebuild()
+
+    def _ensure_capacity(self, capacity):
+        """
+        Grows the training arrays, if needed, so that they can hold at least 
+        the given number of samples.  Capacity is at least doubled so that 
+        repeated additions only copy the data a logarithmic number of times.
+        """
+        current_capacity = self._buffer.shape[0]
+        if capacity <= current_capacity:
+            return
+        
+        capacity = max(capacity, 2 * current_capacity)
+        self._buffer = _resize(self._buffer, capacity, self._size)
+        self._label_buffer = _resize(self._label_buffer, capacity, self._size)
+        self._id_buffer = _resize(self._id_buffer, capacity, self._size)
+        self._removed = _resize(self._removed, capacity, self._size)
+
+    def _active_positions(self):
+        """
+        Returns:
+          A numpy array with the positions of the training samples which 
+          have not been removed.
+        """
+        return np.nonzero(~self._removed[:self._size])[0]
+
+    def _tally_votes(self, labels, neighbours, distances):
+        """
+        Counts the neighbours' votes for which classification to give the 
+        sample.
         
         Args:
           labels: 
             the training set labels
-          distances: 
-            the distance from each entry in the training set to the sample.
+          neighbours: 
+            the positions of the sample's nearest training examples, ordered 
+            from nearest to furthest.
+          distances:
+            the distances to the neighbours.
               
         Returns: 
-          a dictionary mapping labels to their number of votes.
+          a dictionary mapping labels to their (weighted) number of votes.
         """
+        if self.weights == "distance":
+            exact = np.asarray(distances) == 0
+            if exact.any():
+                # Exact matches would have infinite weight.
+                neighbours = np.asarray(neighbours)[exact]
+                distances = np.ones(len(neighbours))
+        
         votes = collections.defaultdict(int)
-        for i, index in enumerate(distances.order(ascending=True).index):
-            if i < self.k:
-                votes[labels[index]] += 1
-            else:
-                break
+        for index, distance in zip(neighbours, distances):
+            votes[labels[index]] += self._get_vote_weight(distance)
         return votes
-    
+
+    def _get_vote_weight(self, distance):
+        """
+        Returns:
+          The weight of the vote of a neighbour at the given (non-zero) 
+          distance.
+        """
+        if self.weights == "distance":
+            return 1.0 / distance
+        return 1
+
+
+def _resize(array, capacity, size):
+    """
+    Copies the first size entries of an array into a new array with room 
+    for capacity entries.
+    """
+    resized = np.empty((capacity, ) + array.shape[1:], dtype=array.dtype)
+    resized[:size] = array[:size]
+    return resized
+
+def _map_positions(sample_ids):
+    """
+    Maps each sample id to the list of positions it occupies.
+    """
+    positions = {}
+    for position, sample_id in enumerate(sample_ids):
+        positions.setdefault(sample_id, []).append(position)
+    return positions
@@ -23,30 +23,150 @@ Naive Bayes classification algorithm.
 @author: drusk
 """
 
-from pml.supervised.classifiers import AbstractClassifier
-from pml.utils import collection_utils
+import numbers
+import zlib
 
-class NaiveBayes(AbstractClassifier):
+import numpy as np
+import pandas as pd
+
+from pml.data import model
+from pml.supervised.classifiers import AbstractClassifier, ClassifiedDataSet
+from pml.utils.errors import UnlabelledDataSetError
+
+class AbstractNaiveBayes(AbstractClassifier):
     """
-    Naive Bayes classifier.
+    Base class for naive Bayes classifiers.
     
-    This algorithm classifies samples using probabilities calculated based 
+    These algorithms classify samples using probabilities calculated based 
     on applying Bayes' theorem.
     
-    The algorithm is said to be naive because it assumes all features are 
-    independent of each other.  While not generally true, the approach is 
-    still quite effective and allows the training set to be much smaller.
+    The algorithms are said to be naive because they assume all features 
+    are independent of each other.  While not generally true, the approach 
+    is still quite effective and allows the training set to be much smaller.
+    
+    The classes are encoded as integers and only summary statistics of the 
+    training data are kept, so the classifiers can be trained incrementally 
+    on data which doesn't fit in memory, see partial_fit and fit_stream.  
+    The probabilities are calculated as logarithms so that multiplying many 
+    of them together becomes a sum which doesn't underflow.
+    
+    Subclasses model the distribution of the features given the class.
     """
     
     def __init__(self, training_set):
         """
-        Constructs a new NaiveBayes classifier.
+        Constructs the classifier.  Subclasses may have additional parameters 
+        in their constructors.
         
         Args:
           training_set: model.DataSet
-            The data used to train the classifier.
+            The data used to train the classifier.  More training data can 
+            be added later with partial_fit.
+            
+        Raises:
+          UnlabelledDataSetError if the training set is not labelled.
         """
-        super(NaiveBayes, self).__init__(training_set)
+        super(AbstractNaiveBayes, self).__init__(training_set)
+        self._features = training_set.feature_list()
+        self._num_samples = 0
+        self._classes = np.empty(0, dtype=object)
+        self._class_index = {}
+        self._class_counts = np.zeros(0, dtype=int)
+        self._init_statistics()
+        
+        self.partial_fit(training_set)
+    
+    @classmethod
+    def fit_stream(cls, datasets, **kwargs):
+        """
+        Trains a classifier on a sequence of datasets, one at a time, e.g. 
+        the chunks of a large file read with loader.load_chunks.  Only the 
+        current dataset and the summary statistics are held in memory.
+        
+        Args:
+          datasets: iterable
+            Labelled DataSets with the same features.
+          kwargs:
+            Additional arguments for the classifier's constructor.
+            
+        Returns:
+          classifier: AbstractNaiveBayes
+            A classifier of the class this method was called on.
+          
+        Raises:
+          ValueError if there are no datasets.
+          
+          UnlabelledDataSetError if a dataset is not labelled.
+          
+          InconsistentFeaturesError if the datasets don't have the same 
+          features.
+        """
+        classifier = None
+        for dataset in datasets:
+            if classifier is None:
+                classifier = cls(dataset, **kwargs)
+            else:
+                classifier.partial_fit(dataset)
+        
+        if classifier is None:
+            raise ValueError("Can't train a classifier without data.")
+        return classifier
+    
+    def partial_fit(self, dataset):
+        """
+        Updates the classifier with additional training data.
+        
+        The statistics of the new data are combined with the existing ones, 
+        including for classes which haven't been seen before, so the result 
+        is the same as training on all of the data at once.
+        
+        The classifier's training_set remains the dataset it was 
+        constructed with.
+        
+        Args:
+          dataset: model.DataSet
+            Labelled samples with the same features as the training set.
+            
+        Returns:
+          void
+          
+        Raises:
+          UnlabelledDataSetError if the dataset is not labelled.
+          
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+          
+          ValueError if the subclass rejects the dataset's values, see 
+          _validate.  The classifier is left unchanged.
+        """
+        if not dataset.is_labelled():
+            raise UnlabelledDataSetError(custom_message=("Training data must "
+                                                         "be labelled."))
+        self._check_features(dataset.feature_list())
+        self._validate(dataset)
+        
+        # Nothing is changed until the whole dataset has been checked, so a 
+        # rejected dataset doesn't leave the classifier half updated.
+        class_index = dict(self._class_index)
+        class_codes = _encode(dataset.get_labels().values, class_index)
+        num_classes = len(class_index)
+        classes = self._classes
+        if num_classes > len(classes):
+            classes = np.empty(num_classes, dtype=object)
+            for clazz, code in class_index.items():
+                classes[code] = clazz
+        
+        num_samples = self._num_samples + dataset.num_samples()
+        class_counts = (_grow(self._class_counts, (num_classes, )) + 
+                        np.bincount(class_codes, minlength=num_classes))
+        log_priors = np.log(class_counts / float(num_samples))
+        
+        self._class_index = class_index
+        self._classes = classes
+        self._num_samples = num_samples
+        self._class_counts = class_counts
+        self._log_priors = log_priors
+        self._update_statistics(dataset, class_codes)
     
     def _classify(self, sample):
         """
@@ -59,14 +179,39 @@ class NaiveBayes(AbstractClassifier):
         Returns:
           The sample's classification.
         """
-        class_probabilities = self.get_classification_probabilities(sample)
-        return collection_utils.get_key_with_highest_value(class_probabilities)
+        return self._classes[np.argmax(self._calc_log_joint(sample))]
+    
+    def _classify_all(self, dataset):
+        """
+        Predicts the classification of every sample in a dataset at once.
+        
+        Args:
+          dataset: model.DataSet
+            the dataset whose samples will be classified.
+            
+        Returns:
+          A pandas Series with each sample's classification, indexed by 
+          sample id.
+          
+        Raises:
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        self._check_features(dataset.feature_list())
+        data_frame = dataset.get_data_frame()
+        log_joint = self._calc_all_log_joints(data_frame)
+        return pd.Series(self._classes[np.argmax(log_joint, axis=1)], 
+                         index=data_frame.index)
     
     def get_classification_probabilities(self, sample):
         """
         Determines the probability that a sample belongs to each class that 
         was seen in the training set.
         
+        These are the joint probabilities of the class and the sample's 
+        feature values.  They are not normalized to sum to 1, and may 
+        underflow to 0 when there are many features; see get_log_posteriors.
+        
         Args:
           sample: dict or pandas.Series
             The sample or observation to be classified.
@@ -75,18 +220,81 @@ class NaiveBayes(AbstractClassifier):
           probabilities: dict
             A dictionary of classifications and their probabilities.
         """
-        class_probabilities = {}
-
-        for clazz in set(self.training_set.get_labels()):
-            prob_clazz = self._calc_prob_class(clazz)
+        probabilities = np.exp(self._calc_log_joint(sample))
+        return dict(zip(self._classes, probabilities))
+    
+    def get_log_posteriors(self, dataset):
+        """
+        Calculates the log of the posterior probability of each class for 
+        each sample in a dataset.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            The samples to score.
+            
+        Returns:
+          log_posteriors: pandas.DataFrame
+            A matrix with a row for each sample, indexed by sample id, and a 
+            column for each class.  The exponentials of each row sum to 1.
             
-            likelihood = 1
-            for feature in self.training_set.feature_list():
-                likelihood *= self._calc_prob_feature_given_class(clazz, feature, 
-                                                            sample[feature])
-            class_probabilities[clazz] = prob_clazz * likelihood
+        Raises:
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        dataset = model.as_dataset(dataset)
+        self._check_features(dataset.feature_list())
+        data_frame = dataset.get_data_frame()
+        
+        log_joint = self._calc_all_log_joints(data_frame)
+        log_posteriors = log_joint - _log_sum_exp(log_joint)[:, np.newaxis]
+        return pd.DataFrame(log_posteriors, index=data_frame.index, 
+                            columns=self._classes)
+    
+    def classify_all_with_log_posteriors(self, dataset):
+        """
+        Classifies each sample in a dataset and also returns the log 
+        posterior probabilities the classifications were chosen from.
+        
+        Args:
+          dataset: DataSet compatible object (see DataSet constructor)
+            the dataset whose samples (observations) will be classified.
             
-        return class_probabilities
+        Returns:
+          classified: ClassifiedDataSet
+            The classification results for each sample.
+          log_posteriors: pandas.DataFrame
+            The log posterior probabilities, see get_log_posteriors.
+            
+        Raises:
+          InconsistentFeaturesError if the dataset doesn't have the same 
+          features as the training data.
+        """
+        dataset = model.as_dataset(dataset)
+        log_posteriors = self.get_log_posteriors(dataset)
+        classifications = pd.Series(
+                    self._classes[np.argmax(log_posteriors.values, axis=1)], 
+                    index=log_posteriors.index)
+        return ClassifiedDataSet(dataset, classifications), log_posteriors
+    
+    def _calc_log_joint(self, sample):
+        """
+        Calculates the log of the joint probability of each class and a 
+        single sample's feature values.
+        
+        Returns:
+          A 1d numpy array with an entry for each class.
+        """
+        data_frame = pd.DataFrame([[sample[feature] 
+                                    for feature in self._features]], 
+                                  columns=self._features)
+        return self._calc_all_log_joints(data_frame)[0]
+    
+    def _as_matrix(self, data_frame):
+        """
+        Extracts a DataFrame's values as a float array with its columns in 
+        the same order as the training set's features.
+        """
+        return np.asarray(data_frame[self._features].values, dtype=float)
     
     def _calc_prob_class(self, clazz):
         """
@@ -101,8 +309,180 @@ class NaiveBayes(AbstractClassifier):
           probability: float
             The probability as a floating point number between 0.0 and 1.0.
         """
-        clazz_count = self.training_set.get_label_value_counts()[clazz]
-        return float(clazz_count) / self.training_set.num_samples()
+        class_count = self._class_counts[self._class_index[clazz]]
+        return float(class_count) / self._num_samples
+    
+    def _validate(self, dataset):
+        """
+        Naive Bayes classifiers which subclass AbstractNaiveBayes may 
+        override this method to check a dataset's values before any of the 
+        classifier's state is changed.  It should raise ValueError for 
+        values the classifier can't be trained on.  Accepts everything by 
+        default.
+        """
+        pass
+    
+    def _init_statistics(self):
+        """
+        Naive Bayes classifiers which subclass AbstractNaiveBayes must 
+        implement this method to initialize their statistics before any 
+        training data is seen.
+        """
+        raise NotImplementedError("Naive Bayes classifiers must implement "
+                                  "the '_init_statistics' method.")
+    
+    def _update_statistics(self, dataset, class_codes):
+        """
+        Naive Bayes classifiers which subclass AbstractNaiveBayes must 
+        implement this method to add a dataset to their statistics.  The 
+        class counts have already been updated, and the integer code of 
+        each sample's class is provided.
+        """
+        raise NotImplementedError("Naive Bayes classifiers must implement "
+                                  "the '_update_statistics' method.")
+    
+    def _calc_all_log_joints(self, data_frame):
+        """
+        Naive Bayes classifiers which subclass AbstractNaiveBayes must 
+        implement this method to calculate the log of the joint probability 
+        of each class and each sample's feature values, as a 2d numpy array 
+        with a row for each sample and a column for each class.
+        """
+        raise NotImplementedError("Naive Bayes classifiers must implement "
+                                  "the '_calc_all_log_joints' method.")
+
+
+class NaiveBayes(AbstractNaiveBayes):
+    """
+    Naive Bayes classifier for categorical features.
+    
+    The probability of each value of a feature given a class is estimated 
+    from how often the value occurs with the class in the training set.  
+    The values of each feature are encoded as integers and the counts are 
+    tabulated as the training data is seen, so classifying samples only 
+    involves table lookups, and doesn't depend on the size of the training 
+    set.
+    
+    Features with very many distinct values can be hashed into a fixed 
+    number of buckets instead, so that the model's size doesn't grow with 
+    the number of values.  Values which share a bucket are counted 
+    together.
+    
+    For numeric features see GaussianNaiveBayes and MultinomialNaiveBayes.
+    """
+    
+    def __init__(self, training_set, num_buckets=None):
+        """
+        Constructs a new NaiveBayes classifier.
+        
+        Args:
+          training_set: model.DataSet
+            The data used to train the classifier.  More training data can 
+            be added later with partial_fit.
+          num_buckets: int
+            If set, the values of each feature are hashed into this many 
+            buckets instead of being stored individually, bounding the size 
+            of the count tables.  The number of distinct values used for 
+            smoothing becomes the number of buckets in use.  Defaults to 
+            None (no hashing).
+        """
+        self.num_buckets = num_buckets
+        super(NaiveBayes, self).__init__(training_set)
+    
+    def _init_statistics(self):
+        # For each feature, the code of each of its values, and a table of 
+        # the number of examples with each value (rows) and class (columns).  
+        # The table has an extra row of zeros for values not seen in 
+        # training and missing values.
+        if self.num_buckets is None:
+            self._value_codes = dict((feature, {}) 
+                                     for feature in self._features)
+            num_rows = 1
+        else:
+            # The codes are hashes, only record which have been used.
+            self._used_buckets = dict(
+                            (feature, np.zeros(self.num_buckets, dtype=bool)) 
+                            for feature in self._features)
+            num_rows = self.num_buckets + 1
+        self._counts = dict((feature, np.zeros((num_rows, 0), dtype=int)) 
+                            for feature in self._features)
+    
+    def _update_statistics(self, dataset, class_codes):
+        # Feature values which haven't been seen before are added to the 
+        # tables, and the smoothing of every probability is adjusted to the 
+        # new number of distinct values.
+        num_classes = len(self._classes)
+        for feature in self._features:
+            values = dataset.get_column(feature).values
+            if self.num_buckets is None:
+                value_codes = _encode(values, self._value_codes[feature])
+                num_values = len(self._value_codes[feature])
+            else:
+                value_codes = _hash_encode(values, self.num_buckets)
+                num_values = self.num_buckets
+            
+            known = value_codes >= 0
+            if self.num_buckets is not None:
+                self._used_buckets[feature][value_codes[known]] = True
+            counts = np.bincount(value_codes[known] * num_classes + 
+                                 class_codes[known], 
+                                 minlength=(num_values + 1) * num_classes)
+            self._counts[feature] = _grow(self._counts[feature], 
+                                          (num_values + 1, num_classes), 
+                                          keep_last_row=True)
+            self._counts[feature] += counts.reshape(num_values + 1, 
+                                                    num_classes)
+        
+        self._log_likelihoods = dict(
+                        (feature, self._calc_log_likelihoods(feature)) 
+                        for feature in self._features)
+    
+    def _calc_log_joint(self, sample):
+        """
+        Calculates the log of the joint probability of each class and a 
+        single sample's feature values.
+        
+        Returns:
+          A 1d numpy array with an entry for each class.
+        """
+        log_joint = self._log_priors.copy()
+        for feature in self._features:
+            code = self._get_value_code(feature, sample[feature])
+            log_joint += self._log_likelihoods[feature][code]
+        return log_joint
+    
+    def _calc_all_log_joints(self, data_frame):
+        """
+        Calculates the log of the joint probability of each class and each 
+        sample's feature values.
+        
+        Returns:
+          A 2d numpy array with a row for each sample and a column for each 
+          class.
+        """
+        log_joint = np.tile(self._log_priors, (len(data_frame), 1))
+        for feature in self._features:
+            codes = self._get_value_codes(feature, data_frame[feature])
+            log_joint += self._log_likelihoods[feature][codes]
+        return log_joint
+    
+    def _calc_log_likelihoods(self, feature):
+        """
+        Calculates the table of the log of the probability of each value of 
+        a feature given each class, see _calc_prob_feature_given_class.  The 
+        last row is for values not seen in training.
+        
+        A feature with no values in training, e.g. one which was missing 
+        from every sample of the chunks fitted so far, tells nothing about 
+        the class, so all of its log likelihoods are 0.
+        """
+        num_feature_vals = self._count_feature_values(feature)
+        if num_feature_vals == 0:
+            return np.zeros(self._counts[feature].shape)
+        m = num_feature_vals
+        p = 1.0 / num_feature_vals
+        return np.log((self._counts[feature] + m * p) / 
+                      (self._class_counts + float(m)))
     
     def _calc_prob_feature_given_class(self, clazz, feature, feature_val):
         """
@@ -121,10 +501,13 @@ class NaiveBayes(AbstractClassifier):
           probability: float
             The probability as a floating point number between 0.0 and 1.0. 
         """
-        n = self.training_set.get_label_value_counts()[clazz]
+        n = self._class_counts[self._class_index[clazz]]
         n_c = self._count_examples(clazz, feature, feature_val)
         
-        num_feature_vals = len(set(self.training_set.get_column(feature)))
+        num_feature_vals = self._count_feature_values(feature)
+        if num_feature_vals == 0:
+            # No values in training, so the feature is ignored.
+            return 1.0
         p = float(1) / num_feature_vals
         m = num_feature_vals
         
@@ -155,17 +538,339 @@ class NaiveBayes(AbstractClassifier):
             The number of training examples with the specified class and same 
             value as the sample for the specified feature.
         """
-        training_classes = self.training_set.get_labels()
-        training_feature_vals = self.training_set.get_column(feature)
+        value_code = self._get_value_code(feature, feature_val)
+        return self._counts[feature][value_code, self._class_index[clazz]]
+    
+    def _count_feature_values(self, feature):
+        """
+        Returns:
+          The number of distinct values of a feature seen in training, or 
+          the number of buckets they occupy if values are hashed.
+        """
+        if self.num_buckets is None:
+            return len(self._value_codes[feature])
+        return np.count_nonzero(self._used_buckets[feature])
+    
+    def _get_value_code(self, feature, value):
+        """
+        Returns:
+          The row of a feature's tables for a single value.
+        """
+        unseen = len(self._counts[feature]) - 1
+        if self.num_buckets is None:
+            return self._value_codes[feature].get(value, unseen)
+        if pd.isnull(value):
+            return unseen
+        return _hash_value(value, self.num_buckets)
+    
+    def _get_value_codes(self, feature, values):
+        """
+        Returns:
+          A numpy array with the row of a feature's tables for each value in 
+          a pandas Series.
+        """
+        unseen = len(self._counts[feature]) - 1
+        if self.num_buckets is None:
+            codes = values.map(self._value_codes[feature])
+            return codes.fillna(unseen).values.astype(int)
+        codes = _hash_encode(values.values, self.num_buckets)
+        codes[codes < 0] = unseen
+        return codes
+
+
+class GaussianNaiveBayes(AbstractNaiveBayes):
+    """
+    Naive Bayes classifier for continuous features.
+    
+    Each feature is assumed to be normally distributed within each class.  
+    Training only needs the number of examples and the mean and variance of 
+    each feature in each class, which are computed for a whole dataset with 
+    a few matrix operations and merged with those of previous datasets.
+    
+    All features must be numeric, without missing values.
+    """
+    
+    def __init__(self, training_set, var_smoothing=1e-9):
+        """
+        Constructs a new GaussianNaiveBayes classifier.
+        
+        Args:
+          training_set: model.DataSet
+            The data used to train the classifier.  More training data can 
+            be added later with partial_fit.
+          var_smoothing: float
+            This fraction of the largest variance of any feature is added to 
+            every variance, so that features which are constant within a 
+            class don't give zero variances.  Default value is 1e-9.
+            
+        Raises:
+          ValueError if the training set has missing or infinite values.
+        """
+        self.var_smoothing = var_smoothing
+        super(GaussianNaiveBayes, self).__init__(training_set)
+    
+    def get_means(self):
+        """
+        Returns:
+          means: pandas.DataFrame
+            The mean of each feature (columns) in each class (rows).
+        """
+        return pd.DataFrame(self._means, index=self._classes, 
+                            columns=self._features)
+    
+    def get_variances(self):
+        """
+        Returns:
+          variances: pandas.DataFrame
+            The smoothed variance of each feature (columns) in each class 
+            (rows).
+        """
+        return pd.DataFrame(self._variances, index=self._classes, 
+                            columns=self._features)
+    
+    def _init_statistics(self):
+        num_features = len(self._features)
+        self._means = np.zeros((0, num_features))
+        # The sum of squared differences from the mean
+        self._squared_deviations = np.zeros((0, num_features))
+    
+    def _validate(self, dataset):
+        # A single NaN would make its class's mean and variance NaN for 
+        # good once merged.
+        if not np.isfinite(self._as_matrix(dataset.get_data_frame())).all():
+            raise ValueError("GaussianNaiveBayes requires finite feature "
+                             "values, without missing values.")
+    
+    def _update_statistics(self, dataset, class_codes):
+        matrix = self._as_matrix(dataset.get_data_frame())
+        num_classes = len(self._classes)
+        
+        indicators = _one_hot(class_codes, num_classes)
+        chunk_counts = indicators.sum(axis=0)
+        safe_counts = np.maximum(chunk_counts, 1)[:, np.newaxis]
+        chunk_means = np.dot(indicators.T, matrix) / safe_counts
+        chunk_squared_deviations = np.dot(
+                    indicators.T, (matrix - chunk_means[class_codes]) ** 2)
+        
+        # Merge with the previous statistics using the parallel algorithm of 
+        # Chan et al.
+        num_features = len(self._features)
+        old_counts = (self._class_counts - chunk_counts)[:, np.newaxis]
+        new_counts = self._class_counts[:, np.newaxis]
+        old_means = _grow(self._means, (num_classes, num_features))
+        old_squared_deviations = _grow(self._squared_deviations, 
+                                       (num_classes, num_features))
+        
+        delta = chunk_means - old_means
+        chunk_counts = chunk_counts[:, np.newaxis]
+        self._means = old_means + delta * chunk_counts / new_counts
+        self._squared_deviations = (old_squared_deviations + 
+                                    chunk_squared_deviations + 
+                                    delta ** 2 * old_counts * chunk_counts / 
+                                    new_counts)
+        
+        variances = self._squared_deviations / new_counts
+        self._variances = variances + self._calc_epsilon()
+    
+    def _calc_epsilon(self):
+        """
+        Calculates the amount added to every variance, based on the largest 
+        variance of any feature over the whole training set.
+        """
+        counts = self._class_counts[:, np.newaxis]
+        overall_means = (counts * self._means).sum(axis=0) / self._num_samples
+        overall_variances = (self._squared_deviations.sum(axis=0) + 
+                             (counts * (self._means - overall_means) ** 2
+                              ).sum(axis=0)) / self._num_samples
+        largest = overall_variances.max() if len(overall_variances) else 0
+        return self.var_smoothing * (largest if largest > 0 else 1.0)
+    
+    def _calc_all_log_joints(self, data_frame):
+        matrix = self._as_matrix(data_frame)
+        precisions = 1.0 / self._variances
         
-        match_classes = training_classes == clazz
-        match_feature_vals = training_feature_vals == feature_val
+        # The squared differences from each class's means, weighted by its 
+        # precisions and summed over the features.  Computed one class at a 
+        # time, since expanding the square into matrix products loses 
+        # precision when the variances are small relative to the values.
+        weighted_squares = np.empty((matrix.shape[0], len(self._classes)))
+        for code in range(len(self._classes)):
+            weighted_squares[:, code] = np.dot(
+                        (matrix - self._means[code]) ** 2, precisions[code])
+        log_normalizers = -0.5 * np.sum(np.log(2 * np.pi * self._variances), 
+                                        axis=1)
+        return self._log_priors + log_normalizers - 0.5 * weighted_squares
+
+
+class MultinomialNaiveBayes(AbstractNaiveBayes):
+    """
+    Naive Bayes classifier for count features, e.g. the number of times each 
+    word occurs in a document.
+    
+    Each sample is treated as a number of draws from a multinomial 
+    distribution over the features, with one distribution per class.  
+    Training only needs the total of each feature in each class, which is 
+    computed for a whole dataset with one matrix product.
+    
+    All features must be non-negative numbers, without missing values.
+    """
+    
+    def __init__(self, training_set, alpha=1.0):
+        """
+        Constructs a new MultinomialNaiveBayes classifier.
+        
+        Args:
+          training_set: model.DataSet
+            The data used to train the classifier.  More training data can 
+            be added later with partial_fit.
+          alpha: float
+            This many virtual counts are added to every feature in every 
+            class, so that features which never occur in a class don't give 
+            it zero probability.  1.0 is Laplace smoothing.  Default value 
+            is 1.0.
+            
+        Raises:
+          ValueError if the training set has negative values.
+        """
+        self.alpha = alpha
+        super(MultinomialNaiveBayes, self).__init__(training_set)
+    
+    def _init_statistics(self):
+        self._feature_counts = np.zeros((0, len(self._features)))
+    
+    def _validate(self, dataset):
+        if (self._as_matrix(dataset.get_data_frame()) < 0).any():
+            raise ValueError("MultinomialNaiveBayes requires non-negative "
+                             "feature values.")
+    
+    def _update_statistics(self, dataset, class_codes):
+        matrix = self._as_matrix(dataset.get_data_frame())
+        num_classes = len(self._classes)
+        self._feature_counts = _grow(self._feature_counts, 
+                                     (num_classes, len(self._features)))
+        self._feature_counts += np.dot(_one_hot(class_codes, num_classes).T, 
+                                       matrix)
+        
+        smoothed = self._feature_counts + self.alpha
+        self._log_probabilities = np.log(
+                        smoothed / smoothed.sum(axis=1)[:, np.newaxis])
+    
+    def _calc_all_log_joints(self, data_frame):
+        return (self._log_priors + 
+                np.dot(self._as_matrix(data_frame), 
+                       self._log_probabilities.T))
+
+
+def _log_sum_exp(values):
+    """
+    Calculates log(sum(exp(values))) along each row of a matrix without 
+    overflowing or underflowing.
+    """
+    row_max = values.max(axis=1)
+    shifted = values - row_max[:, np.newaxis]
+    return row_max + np.log(np.exp(shifted).sum(axis=1))
+
+def _one_hot(codes, num_codes):
+    """
+    Returns:
+      A matrix of floats with a row for each code, which is 1 in the code's 
+      column and 0 elsewhere.
+    """
+    indicators = np.zeros((len(codes), num_codes))
+    indicators[np.arange(len(codes)), codes] = 1
+    return indicators
+
+def _encode(values, codes):
+    """
+    Converts values to integer codes, assigning the next unused code to 
+    values which don't have one yet.  Missing values are given the code -1.
+    
+    Args:
+      values: numpy array
+        The values to encode.
+      codes: dict
+        Maps values to their codes.  New values are added to it.
         
-        match_both = match_classes & match_feature_vals
+    Returns:
+      A numpy array with the code of each value.
+    """
+    local_codes, uniques = pd.factorize(values)
+    mapping = np.empty(len(uniques), dtype=int)
+    for i, value in enumerate(uniques):
+        mapping[i] = codes.setdefault(value, len(codes))
+    
+    encoded = np.empty(len(values), dtype=int)
+    encoded.fill(-1)
+    known = local_codes >= 0
+    encoded[known] = mapping[local_codes[known]]
+    return encoded
+
+def _hash_encode(values, num_buckets):
+    """
+    Hashes values into buckets.  Each distinct value is only hashed once.  
+    Missing values are given the code -1.
+    
+    Args:
+      values: numpy array
+        The values to encode.
+      num_buckets: int
+        The number of buckets.
         
-        if not match_both.any():
-            return 0
+    Returns:
+      A numpy array with the bucket of each value.
+    """
+    local_codes, uniques = pd.factorize(values)
+    mapping = np.array([_hash_value(value, num_buckets) for value in uniques], 
+                       dtype=int)
+    
+    encoded = np.empty(len(values), dtype=int)
+    encoded.fill(-1)
+    known = local_codes >= 0
+    encoded[known] = mapping[local_codes[known]]
+    return encoded
+
+def _hash_value(value, num_buckets):
+    """
+    Hashes a value into one of num_buckets buckets.  Unlike the built in 
+    hash function, the result is the same in every process.
+    
+    Numbers which compare equal hash to the same bucket, e.g. 1 and 1.0, 
+    since a column of integers becomes floats once it has a missing value.
+    """
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if value.is_integer():
+            value = "%d" % value
+        else:
+            value = repr(value)
+    if not isinstance(value, bytes):
+        value = ("%s" % (value, )).encode("utf-8")
+    return (zlib.crc32(value) & 0xffffffff) % num_buckets
+
+def _grow(table, shape, keep_last_row=False):
+    """
+    Pads a table of statistics with zeros to a larger shape.
+    
+    Args:
+      table: numpy array
+        A 1d or 2d table.
+      shape: tuple
+        The new shape, no smaller than the table's in any dimension.
+      keep_last_row: boolean
+        Set to True to keep the last row of a 2d table last, e.g. if it 
+        holds the counts for unseen values.  Defaults to False.
         
-        return match_both.value_counts()[True]
+    Returns:
+      The padded table.
+    """
+    if table.shape == shape:
+        return table
     
-    
\ No newline at end of file
+    grown = np.zeros(shape, dtype=table.dtype)
+    if keep_last_row:
+        rows, columns = table.shape
+        grown[:rows - 1, :columns] = table[:-1]
+        grown[-1, :columns] = table[-1]
+    else:
+        grown[tuple(slice(0, size) for size in table.shape)] = table
+    return grown
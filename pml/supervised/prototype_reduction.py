@@ -0,0 +1,218 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Prototype reduction for nearest neighbour classifiers.
+
+Nearest neighbour classification compares each query against every stored 
+training sample, so its cost grows with the size of the training set.  Many 
+training samples are redundant (they lie deep inside a region of their own 
+class) or noisy (they lie among samples of another class).  The functions in 
+this module select a smaller set of prototypes which classifies about as 
+well as the full training set.
+
+@author: drusk
+"""
+
+import numpy as np
+import pandas as pd
+
+from pml.data import model
+from pml.utils import distance_utils
+from pml.utils.errors import UnlabelledDataSetError
+
+
+def edited_nearest_neighbours(dataset, k=3, metric="euclidean", 
+                              metric_params=None):
+    """
+    Removes noisy samples using Wilson's editing rule: each sample is 
+    classified by its k nearest neighbours among the other samples, and 
+    samples whose label doesn't get the most votes are removed.  Samples 
+    whose label ties for the most votes are kept.
+    
+    This smooths the boundaries between classes and removes outliers, which 
+    usually improves accuracy but doesn't remove many samples on its own.
+    
+    Args:
+      dataset: model.DataSet
+        The labelled samples to edit.
+      k: int
+        The number of neighbours voting on each sample.  Defaults to 3.
+      metric: string or callable
+        How to measure the distance between samples.  See 
+        distance_utils.pairwise_distances.  Defaults to "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric.  Defaults to None.
+        
+    Returns:
+      edited: model.DataSet
+        The samples which were kept, in their original order.
+        
+    Raises:
+      UnlabelledDataSetError if the dataset is not labelled.
+    """
+    matrix, codes = _get_matrix_and_label_codes(dataset)
+    num_samples = len(codes)
+    k = min(k, num_samples - 1)
+    if k < 1:
+        return dataset
+    
+    # Each sample is its own nearest neighbour, so find one extra and drop it.
+    _, neighbours = distance_utils.chunked_k_nearest(
+                        matrix, matrix, k + 1, metric=metric, 
+                        metric_params=metric_params)
+    is_self = neighbours == np.arange(num_samples)[:, np.newaxis]
+    # Exact duplicates may be returned instead of the sample itself.
+    is_self[~is_self.any(axis=1), -1] = True
+    neighbours = neighbours[~is_self].reshape(num_samples, k)
+    
+    num_labels = codes.max() + 1
+    rows = np.repeat(np.arange(num_samples), k)
+    votes = np.bincount(rows * num_labels + codes[neighbours].ravel(), 
+                        minlength=num_samples * num_labels)
+    votes = votes.reshape(num_samples, num_labels)
+    keep = votes[np.arange(num_samples), codes] == votes.max(axis=1)
+    
+    return _select(dataset, np.nonzero(keep)[0])
+
+def condensed_nearest_neighbours(dataset, metric="euclidean", 
+                                 metric_params=None, random_state=None):
+    """
+    Removes redundant samples using Hart's condensing algorithm.
+    
+    Samples are visited in a random order and added to the set of 
+    prototypes whenever the prototypes chosen so far misclassify them using 
+    their single nearest neighbour.  Passes are repeated until every sample 
+    is classified correctly, so a 1-nearest neighbour classifier using the 
+    prototypes classifies all of the original samples the same way as their 
+    labels.
+    
+    The nearest prototype of every sample is updated as each prototype is 
+    added, so each prototype costs one pass over the samples.
+    
+    Condensing keeps the samples near class boundaries, including noisy 
+    ones, so it works best after edited_nearest_neighbours.
+    
+    Args:
+      dataset: model.DataSet
+        The labelled samples to condense.
+      metric: string or callable
+        How to measure the distance between samples.  See 
+        distance_utils.pairwise_distances.  Defaults to "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric.  Defaults to None.
+      random_state: int
+        Seeds the order the samples are visited in.  Defaults to None.
+        
+    Returns:
+      condensed: model.DataSet
+        The prototypes, in their original order.
+        
+    Raises:
+      UnlabelledDataSetError if the dataset is not labelled.
+    """
+    matrix, codes = _get_matrix_and_label_codes(dataset)
+    num_samples = len(codes)
+    if num_samples == 0:
+        return dataset
+    order = np.random.RandomState(random_state).permutation(num_samples)
+    
+    is_prototype = np.zeros(num_samples, dtype=bool)
+    nearest_distance = np.empty(num_samples)
+    nearest_distance.fill(np.inf)
+    nearest_code = np.empty(num_samples, dtype=int)
+    nearest_code.fill(-1)
+    
+    def add_prototype(position):
+        is_prototype[position] = True
+        distances = distance_utils.pairwise_distances(
+                            matrix, matrix[position:position + 1], 
+                            metric=metric, metric_params=metric_params)[:, 0]
+        closer = distances < nearest_distance
+        nearest_distance[closer] = distances[closer]
+        nearest_code[closer] = codes[position]
+    
+    add_prototype(order[0])
+    changed = True
+    while changed:
+        changed = False
+        for position in order:
+            if (not is_prototype[position] and 
+                nearest_code[position] != codes[position]):
+                add_prototype(position)
+                changed = True
+    
+    return _select(dataset, np.nonzero(is_prototype)[0])
+
+def reduce_prototypes(dataset, edit=True, k=3, metric="euclidean", 
+                      metric_params=None, random_state=None):
+    """
+    Selects a small set of prototypes from a training set by editing out 
+    noisy samples (optional) and then condensing what remains.
+    
+    Args:
+      dataset: model.DataSet
+        The labelled samples to reduce.
+      edit: boolean
+        Set to True to apply edited_nearest_neighbours before condensing.  
+        Defaults to True.
+      k: int
+        The number of neighbours voting on each sample while editing.  
+        Defaults to 3.
+      metric: string or callable
+        How to measure the distance between samples.  Defaults to 
+        "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric.  Defaults to None.
+      random_state: int
+        Seeds the order samples are visited in while condensing.  Defaults 
+        to None.
+        
+    Returns:
+      prototypes: model.DataSet
+      
+    Raises:
+      UnlabelledDataSetError if the dataset is not labelled.
+    """
+    if edit:
+        dataset = edited_nearest_neighbours(dataset, k=k, metric=metric, 
+                                            metric_params=metric_params)
+    return condensed_nearest_neighbours(dataset, metric=metric, 
+                                        metric_params=metric_params, 
+                                        random_state=random_state)
+
+def _get_matrix_and_label_codes(dataset):
+    """
+    Returns the dataset's features as a matrix of floats and its labels as 
+    integer codes.
+    """
+    if not dataset.is_labelled():
+        raise UnlabelledDataSetError(custom_message=("Prototypes can only be "
+                                                     "selected from labelled "
+                                                     "data."))
+    matrix = np.asarray(dataset.get_data_frame().values, dtype=float)
+    codes, _ = pd.factorize(dataset.get_labels().values)
+    return matrix, codes
+
+def _select(dataset, positions):
+    """
+    Returns a new DataSet with the samples at the given positions.
+    """
+    return model.DataSet(dataset.get_data_frame().iloc[positions], 
+                         labels=dataset.get_labels().iloc[positions])
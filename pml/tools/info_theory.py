@@ -85,3 +85,28 @@ def entropy(dataset):
 
     return np.sum(map(entropy_val, label_proportions))
 
+def entropy_of_counts(counts):
+    """
+    Calculates entropies from the number of samples with each label.
+    
+    This allows the entropies of many subsets of a data set to be 
+    calculated at once from a table of counts, without creating the 
+    subsets.
+    
+    Args:
+      counts: array-like
+        The number of samples with each label, along the last dimension.  
+        For example, a 2d array with a row for each subset of the samples 
+        and a column for each label.
+        
+    Returns:
+      The entropy of each set of counts, as a float for 1d counts or a 
+      numpy array otherwise.  Sets with no samples have entropy 0.
+    """
+    counts = np.asarray(counts, dtype=float)
+    totals = counts.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportions = counts / totals[..., np.newaxis]
+        terms = np.where(proportions > 0, 
+                         proportions * np.log2(proportions), 0)
+    return -1 * terms.sum(axis=-1)
@@ -0,0 +1,709 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Spatial indexes which answer nearest neighbour queries without comparing 
+each query against every indexed point.
+
+@author: drusk
+"""
+
+import heapq
+from timeit import default_timer as timer
+
+import numpy as np
+
+from pml.utils import distance_utils
+
+# Above this many dimensions the bounding boxes of a KD-tree prune very 
+# little, so the "auto" index switches to a ball tree.
+KD_TREE_MAX_DIMENSIONS = 15
+
+# Metrics computed feature by feature, for which the distance to the 
+# nearest point of a bounding box is a lower bound on the distance to any 
+# point inside it.
+KD_TREE_METRICS = ("euclidean", "sqeuclidean", "manhattan", "chebyshev", 
+                   "minkowski")
+
+# Registered metrics which don't satisfy the triangle inequality, which 
+# ball trees rely on for pruning.
+NON_TRIANGLE_METRICS = ("sqeuclidean", "cosine")
+
+# The parameters specific to each index "auto" may choose.  Those meant for 
+# the indexes it didn't choose are dropped.
+AUTO_INDEX_PARAMS = {"brute": ("memory_budget", ), 
+                     "kd_tree": ("leaf_size", ), 
+                     "ball_tree": ("leaf_size", )}
+
+class SpatialIndex(object):
+    """
+    Base class for an index over a fixed set of points.
+    
+    The time spent building the index and answering queries is recorded so 
+    that different indexes can be compared on the same data.
+    """
+    
+    def __init__(self, data, metric="euclidean", metric_params=None):
+        """
+        Builds the index.
+        
+        Args:
+          data: 2d array-like
+            The points to index, one per row.
+          metric: string or callable
+            The metric to use, see distance_utils.pairwise_distances.  
+            Defaults to "euclidean".
+          metric_params: dict
+            Additional keyword arguments for the metric.  They are prepared 
+            once, see distance_utils.prepare_metric_params.  Defaults to 
+            None.
+        """
+        self.data = np.asarray(data, dtype=float)
+        self.metric = metric
+        self.metric_params = distance_utils.prepare_metric_params(
+                                                    metric, metric_params)
+        self.query_time = 0.0
+        self.num_queries = 0
+        
+        start = timer()
+        self._build()
+        self.build_time = timer() - start
+    
+    def query(self, queries, k):
+        """
+        Finds the k nearest indexed points to each query.
+        
+        Args:
+          queries: 2d array-like
+            The query points, one per row.
+          k: int
+            The number of neighbours to find.  If there are fewer than k 
+            indexed points, all of them are returned.
+        
+        Returns:
+          distances: numpy array
+            A 2d array with the distance to each neighbour, one row per 
+            query, ordered from nearest to furthest.
+          indices: numpy array
+            The rows of the indexed data corresponding to distances.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=float))
+        k = min(k, self.data.shape[0])
+        
+        start = timer()
+        distances, indices = self._query(queries, k)
+        self.query_time += timer() - start
+        self.num_queries += queries.shape[0]
+        
+        return distances, indices
+    
+    def query_radius(self, queries, radius):
+        """
+        Finds all indexed points within a given distance of each query.
+        
+        Args:
+          queries: 2d array-like
+            The query points, one per row.
+          radius: float
+            The maximum distance of a neighbour (inclusive).
+        
+        Returns:
+          distances: list
+            A 1d numpy array for each query with the distances to its 
+            neighbours, ordered from nearest to furthest.  Queries may have 
+            any number of neighbours, including none.
+          indices: list
+            The rows of the indexed data corresponding to distances.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=float))
+        
+        start = timer()
+        distances, indices = self._query_radius(queries, radius)
+        self.query_time += timer() - start
+        self.num_queries += queries.shape[0]
+        
+        return distances, indices
+    
+    def get_timings(self):
+        """
+        Reports how long the index took to build and to answer queries.
+        
+        Returns:
+          timings: dict
+            The build time and total query time in seconds, and the number 
+            of queries answered so far.
+        """
+        return {"build_time": self.build_time, 
+                "query_time": self.query_time, 
+                "num_queries": self.num_queries}
+    
+    def _point_distances(self, point, points):
+        """
+        Calculates the distance from a single point to each row of a matrix.
+        """
+        return distance_utils.pairwise_distances(point[np.newaxis, :], points, 
+                                                 self.metric, 
+                                                 self.metric_params)[0]
+    
+    def _build(self):
+        """
+        Indexes which subclass SpatialIndex must implement this method to 
+        build their data structures from self.data.
+        """
+        raise NotImplementedError("Indexes must implement the '_build' "
+                                  "method.")
+    
+    def _query(self, queries, k):
+        """
+        Indexes which subclass SpatialIndex must implement this method to 
+        answer k-nearest neighbour queries.
+        """
+        raise NotImplementedError("Indexes must implement the '_query' "
+                                  "method.")
+    
+    def _query_radius(self, queries, radius):
+        """
+        Indexes which subclass SpatialIndex must implement this method to 
+        answer radius queries.
+        """
+        raise NotImplementedError("Indexes must implement the "
+                                  "'_query_radius' method.")
+    
+
+class BruteForceIndex(SpatialIndex):
+    """
+    Compares every query against every indexed point.  There is nothing to 
+    build, but queries take linear time in the number of points.
+    """
+    
+    def __init__(self, data, metric="euclidean", metric_params=None, 
+                 memory_budget=distance_utils.DEFAULT_MEMORY_BUDGET):
+        """
+        Builds the index.
+        
+        Args:
+          data: 2d array-like
+            The points to index, one per row.
+          metric: string or callable
+            The metric to use, see distance_utils.pairwise_distances.  
+            Defaults to "euclidean".
+          metric_params: dict
+            Additional keyword arguments for the metric.  Defaults to None.
+          memory_budget: int
+            The approximate maximum number of bytes of distances to hold in 
+            memory at once while answering queries.  Defaults to 
+            distance_utils.DEFAULT_MEMORY_BUDGET.
+        """
+        self.memory_budget = memory_budget
+        super(BruteForceIndex, self).__init__(data, metric=metric, 
+                                              metric_params=metric_params)
+    
+    def _build(self):
+        pass
+    
+    def _query(self, queries, k):
+        return distance_utils.chunked_k_nearest(queries, self.data, k, 
+                                                self.memory_budget, 
+                                                self.metric, 
+                                                self.metric_params)
+    
+    def _query_radius(self, queries, radius):
+        return distance_utils.chunked_radius_neighbours(queries, self.data, 
+                                                        radius, 
+                                                        self.memory_budget, 
+                                                        self.metric, 
+                                                        self.metric_params)
+
+
+class _TreeIndex(SpatialIndex):
+    """
+    Common functionality for indexes which recursively partition the points 
+    into a binary tree of nodes.
+    
+    The tree is held in flat lists indexed by node id rather than as linked 
+    node objects.  Each node covers a contiguous range of self._order, which 
+    is a permutation of the indexed points.
+    """
+    
+    def __init__(self, data, metric="euclidean", metric_params=None, 
+                 leaf_size=20):
+        """
+        Builds the index.
+        
+        Args:
+          data: 2d array-like
+            The points to index, one per row.
+          metric: string or callable
+            The metric to use, see distance_utils.pairwise_distances.  
+            Defaults to "euclidean".
+          metric_params: dict
+            Additional keyword arguments for the metric.  Defaults to None.
+          leaf_size: int
+            Nodes with at most this many points are not split further.
+        """
+        self.leaf_size = max(1, leaf_size)
+        super(_TreeIndex, self).__init__(data, metric=metric, 
+                                         metric_params=metric_params)
+    
+    def _build(self):
+        self._order = np.arange(self.data.shape[0])
+        self._ranges = []
+        self._children = []
+        self._add_node(0, self.data.shape[0])
+        
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            start, end = self._ranges[node]
+            if end - start <= self.leaf_size:
+                continue
+            
+            middle = self._partition(start, end)
+            left = self._add_node(start, middle)
+            right = self._add_node(middle, end)
+            self._children[node] = (left, right)
+            stack.extend((left, right))
+    
+    def _add_node(self, start, end):
+        """
+        Creates a node covering self._order[start:end] and returns its id.
+        """
+        self._ranges.append((start, end))
+        self._children.append(None)
+        self._describe_node(self.data[self._order[start:end]])
+        return len(self._ranges) - 1
+    
+    def _partition(self, start, end):
+        """
+        Splits the points of a node at the median of the dimension with the 
+        greatest spread.  self._order[start:end] is rearranged in place.
+        
+        Returns:
+          middle: int
+            The points before this position go to the left child, the rest 
+            to the right child.
+        """
+        indices = self._order[start:end]
+        points = self.data[indices]
+        dimension = np.argmax(points.max(axis=0) - points.min(axis=0))
+        
+        half = (end - start) // 2
+        median_order = np.argpartition(points[:, dimension], half)
+        self._order[start:end] = indices[median_order]
+        return start + half
+    
+    def _query(self, queries, k):
+        distances = np.empty((queries.shape[0], k))
+        indices = np.empty((queries.shape[0], k), dtype=int)
+        for i, query in enumerate(queries):
+            distances[i], indices[i] = self._query_one(query, k)
+        return distances, indices
+    
+    def _query_one(self, query, k):
+        """
+        Depth first search which visits the nearer child first and skips any 
+        node that cannot contain a point closer than the current k-th 
+        nearest neighbour.
+        """
+        # Max-heap of the best candidates so far, as (-distance, index)
+        best = []
+        stack = [(self._min_distance(query, 0), 0)]
+        while stack:
+            bound, node = stack.pop()
+            if len(best) == k and bound >= -best[0][0]:
+                continue
+            
+            children = self._children[node]
+            if children is None:
+                start, end = self._ranges[node]
+                indices = self._order[start:end]
+                distances = self._point_distances(query, self.data[indices])
+                for distance, index in zip(distances, indices):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+            else:
+                # Push the further child first so the nearer is visited first
+                bounds = sorted(((self._min_distance(query, child), child) 
+                                 for child in children), reverse=True)
+                stack.extend(bounds)
+        
+        best.sort(reverse=True)
+        return ([-distance for distance, _ in best], 
+                [index for _, index in best])
+    
+    def _query_radius(self, queries, radius):
+        all_distances = []
+        all_indices = []
+        for query in queries:
+            distances, indices = self._query_radius_one(query, radius)
+            all_distances.append(distances)
+            all_indices.append(indices)
+        return distance_utils.sort_neighbours(all_distances, all_indices)
+    
+    def _query_radius_one(self, query, radius):
+        """
+        Collects the points within the radius from every leaf whose node 
+        could contain such a point.
+        """
+        distances = []
+        indices = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._min_distance(query, node) > radius:
+                continue
+            
+            children = self._children[node]
+            if children is None:
+                start, end = self._ranges[node]
+                leaf_indices = self._order[start:end]
+                leaf_distances = self._point_distances(
+                                        query, self.data[leaf_indices])
+                within = leaf_distances <= radius
+                distances.append(leaf_distances[within])
+                indices.append(leaf_indices[within])
+            else:
+                stack.extend(children)
+        return distances, indices
+    
+    def _describe_node(self, points):
+        """
+        Tree indexes which subclass _TreeIndex must implement this method to 
+        record the bounding information for a newly created node.
+        """
+        raise NotImplementedError("Tree indexes must implement the "
+                                  "'_describe_node' method.")
+    
+    def _min_distance(self, query, node):
+        """
+        Tree indexes which subclass _TreeIndex must implement this method to 
+        give a lower bound on the distance from the query to any point in 
+        the node.
+        """
+        raise NotImplementedError("Tree indexes must implement the "
+                                  "'_min_distance' method.")
+
+
+class KDTree(_TreeIndex):
+    """
+    Partitions the points with axis-aligned splits.  Each node keeps the 
+    bounding box of its points.
+    
+    Efficient in low dimensions.  Only supports the metrics in 
+    KD_TREE_METRICS, since the bounding box bound relies on the distance 
+    being computed feature by feature.
+    """
+    
+    def __init__(self, data, metric="euclidean", metric_params=None, 
+                 leaf_size=20):
+        if distance_utils.get_metric_name(metric) not in KD_TREE_METRICS:
+            raise ValueError("KDTree does not support metric '%s'.  "
+                             "Supported metrics are: %s" 
+                             % (metric, ", ".join(KD_TREE_METRICS)))
+        super(KDTree, self).__init__(data, metric=metric, 
+                                     metric_params=metric_params, 
+                                     leaf_size=leaf_size)
+    
+    def _build(self):
+        self._lower_bounds = []
+        self._upper_bounds = []
+        super(KDTree, self)._build()
+    
+    def _describe_node(self, points):
+        self._lower_bounds.append(points.min(axis=0))
+        self._upper_bounds.append(points.max(axis=0))
+    
+    def _min_distance(self, query, node):
+        nearest_in_box = np.clip(query, self._lower_bounds[node], 
+                                 self._upper_bounds[node])
+        return self._point_distances(query, 
+                                     nearest_in_box[np.newaxis, :])[0]
+
+
+class BallTree(_TreeIndex):
+    """
+    Partitions the points into nested hyperspheres.  Each node keeps the 
+    centroid of its points and the distance to the furthest of them.
+    
+    Copes with higher dimensions better than a KD-tree and works with any 
+    metric that satisfies the triangle inequality.
+    """
+    
+    def __init__(self, data, metric="euclidean", metric_params=None, 
+                 leaf_size=20):
+        if distance_utils.get_metric_name(metric) in NON_TRIANGLE_METRICS:
+            raise ValueError("BallTree requires a metric which satisfies the "
+                             "triangle inequality, not '%s'." % metric)
+        super(BallTree, self).__init__(data, metric=metric, 
+                                       metric_params=metric_params, 
+                                       leaf_size=leaf_size)
+    
+    def _build(self):
+        self._centroids = []
+        self._radii = []
+        super(BallTree, self)._build()
+    
+    def _describe_node(self, points):
+        centroid = points.mean(axis=0)
+        self._centroids.append(centroid)
+        self._radii.append(self._point_distances(centroid, points).max())
+    
+    def _min_distance(self, query, node):
+        distance = self._point_distances(query, 
+                                         self._centroids[node][np.newaxis, :])
+        return max(0.0, distance[0] - self._radii[node])
+
+
+class RandomProjectionForest(SpatialIndex):
+    """
+    Approximate nearest neighbour index made of several random projection 
+    trees.
+    
+    Each tree recursively splits the points at the median of their 
+    projection onto a random direction.  A query only looks at the points 
+    sharing a leaf with it in each tree, so some true neighbours may be 
+    missed.  More trees and larger leaves increase recall at the expense of 
+    query speed.
+    """
+    
+    def __init__(self, data, metric="euclidean", metric_params=None, 
+                 num_trees=10, leaf_size=30, random_state=None):
+        """
+        Builds the index.
+        
+        Args:
+          data: 2d array-like
+            The points to index, one per row.
+          metric: string or callable
+            The metric to use, see distance_utils.pairwise_distances.  
+            Defaults to "euclidean".
+          metric_params: dict
+            Additional keyword arguments for the metric.  Defaults to None.
+          num_trees: int
+            The number of random projection trees to build.  Default 
+            value is 10.
+          leaf_size: int
+            Nodes with at most this many points are not split further.  
+            Default value is 30.
+          random_state: int
+            Seed for the random projections, so that the index can be 
+            rebuilt identically.  Defaults to None (unseeded).
+        """
+        self.num_trees = max(1, num_trees)
+        self.leaf_size = max(1, leaf_size)
+        self._random = np.random.RandomState(random_state)
+        super(RandomProjectionForest, self).__init__(
+                            data, metric=metric, metric_params=metric_params)
+    
+    def _build(self):
+        self._trees = [self._build_tree() for _ in range(self.num_trees)]
+    
+    def _build_tree(self):
+        """
+        Builds a single random projection tree.
+        
+        Returns:
+          tree: dict
+            Flat arrays describing the tree's nodes: the projection 
+            direction and split offset of each node, its (left, right) 
+            children (-1 for leaves) and the range of "order" it covers.
+        """
+        num_points, num_dimensions = self.data.shape
+        order = np.arange(num_points)
+        normals = []
+        offsets = []
+        children = []
+        ranges = []
+        
+        def add_node(start, end):
+            normals.append(np.zeros(num_dimensions))
+            offsets.append(0.0)
+            children.append((-1, -1))
+            ranges.append((start, end))
+            return len(ranges) - 1
+        
+        stack = [add_node(0, num_points)]
+        while stack:
+            node = stack.pop()
+            start, end = ranges[node]
+            if end - start <= self.leaf_size:
+                continue
+            
+            indices = order[start:end]
+            normal = self._random.normal(size=num_dimensions)
+            projections = np.dot(self.data[indices], normal)
+            
+            half = (end - start) // 2
+            median_order = np.argpartition(projections, half)
+            order[start:end] = indices[median_order]
+            
+            normals[node] = normal
+            offsets[node] = projections[median_order[half]]
+            left = add_node(start, start + half)
+            right = add_node(start + half, end)
+            children[node] = (left, right)
+            stack.extend((left, right))
+        
+        return {"order": order, 
+                "normals": np.array(normals), 
+                "offsets": np.array(offsets), 
+                "children": np.array(children, dtype=int), 
+                "ranges": np.array(ranges, dtype=int)}
+    
+    def _find_leaves(self, tree, queries):
+        """
+        Routes every query down a tree at once, one level at a time.
+        
+        Returns:
+          leaves: numpy array
+            The id of the leaf node each query ends up in.
+        """
+        nodes = np.zeros(queries.shape[0], dtype=int)
+        while True:
+            active = np.nonzero(tree["children"][nodes, 0] >= 0)[0]
+            if len(active) == 0:
+                return nodes
+            
+            active_nodes = nodes[active]
+            projections = np.sum(queries[active] * 
+                                 tree["normals"][active_nodes], axis=1)
+            go_right = projections >= tree["offsets"][active_nodes]
+            nodes[active] = tree["children"][active_nodes, 
+                                             go_right.astype(int)]
+    
+    def _get_candidates(self, leaves, query_number):
+        """
+        Returns:
+          The indices of the points sharing a leaf with the query in any 
+          tree, without duplicates.
+        """
+        candidates = []
+        for tree, tree_leaves in zip(self._trees, leaves):
+            start, end = tree["ranges"][tree_leaves[query_number]]
+            candidates.append(tree["order"][start:end])
+        return np.unique(np.concatenate(candidates))
+    
+    def _query(self, queries, k):
+        leaves = [self._find_leaves(tree, queries) for tree in self._trees]
+        
+        distances = np.empty((queries.shape[0], k))
+        indices = np.empty((queries.shape[0], k), dtype=int)
+        for i, query in enumerate(queries):
+            candidates = self._get_candidates(leaves, i)
+            
+            if len(candidates) < k:
+                # Not enough candidates in the leaves, fall back to 
+                # considering every point.
+                candidates = np.arange(self.data.shape[0])
+                
+            candidate_distances = self._point_distances(query, 
+                                                        self.data[candidates])
+            nearest = distance_utils.nearest_indices(
+                                    candidate_distances[np.newaxis, :], k)[0]
+            distances[i] = candidate_distances[nearest]
+            indices[i] = candidates[nearest]
+            
+        return distances, indices
+    
+    def _query_radius(self, queries, radius):
+        leaves = [self._find_leaves(tree, queries) for tree in self._trees]
+        
+        all_distances = []
+        all_indices = []
+        for i, query in enumerate(queries):
+            candidates = self._get_candidates(leaves, i)
+            
+            candidate_distances = self._point_distances(query, 
+                                                        self.data[candidates])
+            within = candidate_distances <= radius
+            all_distances.append([candidate_distances[within]])
+            all_indices.append([candidates[within]])
+            
+        return distance_utils.sort_neighbours(all_distances, all_indices)
+
+
+def create_index(kind, data, metric="euclidean", metric_params=None, 
+                 triangle_inequality=False, **kwargs):
+    """
+    Builds a spatial index by name.
+    
+    Args:
+      kind: string
+        One of "brute", "kd_tree", "ball_tree", "auto" or "rp_forest".  
+        "auto" picks a KD-tree for low dimensional data if the metric 
+        allows, otherwise a ball tree, or brute force for metrics neither 
+        tree supports.  A function between two vectors only gets a ball 
+        tree if triangle_inequality is set.  "rp_forest" is an approximate 
+        index.
+      data: 2d array-like
+        The points to index, one per row.
+      metric: string or callable
+        The metric to use, see distance_utils.pairwise_distances.
+      metric_params: dict
+        Additional keyword arguments for the metric.
+      triangle_inequality: boolean
+        Set to True if a metric given as a function satisfies the triangle 
+        inequality, so that "auto" may index with a ball tree.  Nothing can 
+        be checked about an arbitrary function, so by default "auto" falls 
+        back to brute force rather than risk pruning true neighbours.  
+        Defaults to False.
+      kwargs:
+        Additional arguments for the index's constructor, e.g. leaf_size.  
+        With "auto", arguments which only apply to the indexes it didn't 
+        choose are ignored, e.g. leaf_size when it falls back to brute 
+        force.
+    
+    Returns:
+      index: SpatialIndex
+    
+    Raises:
+      ValueError if kind is not a known type of index.
+    """
+    if kind == "auto":
+        data = np.asarray(data, dtype=float)
+        metric_name = distance_utils.get_metric_name(metric)
+        if (metric_name in KD_TREE_METRICS and 
+            data.shape[1] <= KD_TREE_MAX_DIMENSIONS):
+            kind = "kd_tree"
+        elif metric_name is None and not triangle_inequality:
+            kind = "brute"
+        elif metric_name not in NON_TRIANGLE_METRICS:
+            kind = "ball_tree"
+        else:
+            kind = "brute"
+        
+        other_params = set(name for index_params in AUTO_INDEX_PARAMS.values() 
+                           for name in index_params)
+        other_params.difference_update(AUTO_INDEX_PARAMS[kind])
+        kwargs = dict((name, value) for name, value in kwargs.items() 
+                      if name not in other_params)
+    
+    if kind == "brute":
+        return BruteForceIndex(data, metric, metric_params, **kwargs)
+    elif kind == "kd_tree":
+        return KDTree(data, metric, metric_params, **kwargs)
+    elif kind == "ball_tree":
+        return BallTree(data, metric, metric_params, **kwargs)
+    elif kind == "rp_forest":
+        return RandomProjectionForest(data, metric, metric_params, **kwargs)
+    else:
+        raise ValueError("Unknown index type '%s'.  Supported types are: "
+                         "brute, kd_tree, ball_tree, auto, rp_forest" % kind)
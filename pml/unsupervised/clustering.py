@@ -26,11 +26,12 @@ Clustering algorithms for unsupervised learning tasks.
 import itertools
 import random
 
+import numpy as np
 import pandas as pd
 
 from pml.data import model
+from pml.utils import distance_utils
 from pml.utils.errors import UnlabelledDataSetError
-from pml.utils.distance_utils import euclidean
 from pml.utils.pandas_util import are_dataframes_equal
 
 class ClusteredDataSet(model.DataSet):
@@ -195,7 +196,8 @@ def create_random_centroids(dataset, k):
                       name=i) 
             for i in range(k)]
 
-def kmeans(dataset, k=2, distance=euclidean, centroids=None):
+def kmeans(dataset, k=2, distance="euclidean", centroids=None, 
+           metric_params=None):
     """
     K-means clustering algorithm.
     
@@ -207,9 +209,17 @@ def kmeans(dataset, k=2, distance=euclidean, centroids=None):
         The DataSet to perform the clustering on.
       k: int
         The number of clusters to partition the dataset into.
+      distance: string or callable
+        How to measure the distance from samples to centroids.  Either the 
+        name of a metric in distance_utils.METRICS or a function which takes 
+        two vectors and returns their distance.  Such functions are much 
+        slower.  Defaults to "euclidean".
       centroids: list of pandas Series
         The initial centroids for the clusters.  Defaults to None in which
         case they are selected randomly.
+      metric_params: dict
+        Additional keyword arguments for the distance metric.  Defaults to 
+        None.
         
     Returns:
       A ClusteredDataSet which contains the cluster assignments as well as the 
@@ -228,14 +238,16 @@ def kmeans(dataset, k=2, distance=euclidean, centroids=None):
     clusters_changed = True
     while clusters_changed:
         centroids, new_assignments = _compute_iteration(dataset, centroids,
-                                                        distance)
+                                                        distance, 
+                                                        metric_params)
         if are_dataframes_equal(new_assignments, assignments):
             clusters_changed = False
         assignments = new_assignments
     
     return ClusteredDataSet(dataset, assignments)
 
-def _get_distances_to_centroids(dataset, centroids, distance_measure):
+def _get_distances_to_centroids(dataset, centroids, distance_measure, 
+                                metric_params=None):
     """
     Calculates the calc_distance from each data point to each centroid.
     
@@ -244,22 +256,29 @@ def _get_distances_to_centroids(dataset, centroids, distance_measure):
         The DataSet whose samples are being 
       centroids: list of pandas Series
         The centroids to compare each data point with.
+      distance_measure: string or callable
+        The metric to use, see distance_utils.pairwise_distances.
+      metric_params: dict
+        Additional keyword arguments for the metric.
         
     Returns:
       A pandas DataFrame with a row for each sample in dataset and a column 
       for the distance to each centroid.
     """
-    distances = {}
-    for i, centroid in enumerate(centroids):
-        def calc_distance(sample):
-            return distance_measure(sample, centroid)
-    
-        distances[i] = dataset.reduce_rows(calc_distance)
-
-    # each dictionary entry is interpreted as a column
-    return pd.DataFrame(distances)
+    # Fill in the result a block at a time so the temporary memory used 
+    # doesn't grow with the size of the dataset.
+    distances = np.empty((dataset.num_samples(), len(centroids)))
+    blocks = distance_utils.iter_pairwise_blocks(
+                            _as_matrix(dataset), _as_matrix(centroids), 
+                            metric=distance_measure, 
+                            metric_params=metric_params)
+    for rows, columns, block in blocks:
+        distances[rows, columns] = block
+        
+    return pd.DataFrame(distances, index=dataset.get_data_frame().index)
 
-def _compute_iteration(dataset, centroids, distance_measure):
+def _compute_iteration(dataset, centroids, distance_measure, 
+                       metric_params=None):
     """
     Computes an iteration of the k-means algorithm.
     
@@ -268,6 +287,10 @@ def _compute_iteration(dataset, centroids, distance_measure):
         The dataset being clustered.
       centroids: list of pandas Series
         The current centroids at the start of the iteration.
+      distance_measure: string or callable
+        The metric to use, see distance_utils.pairwise_distances.
+      metric_params: dict
+        Additional keyword arguments for the metric.
         
     Returns:
       new_centroids: list of pandas Series
@@ -275,12 +298,13 @@ def _compute_iteration(dataset, centroids, distance_measure):
       cluster_assignments: pandas Series
         The current cluster assignments for each sample.
     """
-    # Calculate calc_distance from each data point to each centroid
-    distances = _get_distances_to_centroids(dataset, centroids,
-                                            distance_measure)
-
     # Find each datapoint's nearest centroid
-    cluster_assignments = distances.idxmin(axis=1)
+    nearest, _ = distance_utils.chunked_argmin(_as_matrix(dataset), 
+                                               _as_matrix(centroids), 
+                                               metric=distance_measure, 
+                                               metric_params=metric_params)
+    cluster_assignments = pd.Series(nearest, 
+                                    index=dataset.get_data_frame().index)
 
     def nearest_centroid(sample_index):
         return cluster_assignments[sample_index]
@@ -292,3 +316,13 @@ def _compute_iteration(dataset, centroids, distance_measure):
     list_of_series = [new_centroids.ix[ind] for ind in new_centroids.index]
     
     return list_of_series, cluster_assignments
+
+def _as_matrix(data):
+    """
+    Converts a DataSet, or a list of centroid Series, into a 2d float array 
+    with one row per sample or centroid.
+    """
+    if isinstance(data, model.DataSet):
+        return np.asarray(data.get_data_frame().values, dtype=float)
+    
+    return np.array([np.asarray(vector, dtype=float) for vector in data])
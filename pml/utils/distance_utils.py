@@ -25,6 +25,10 @@ Algorithms for calculating distances between vectors in feature (n) space.
 
 import numpy as np
 
+# Default limit, in bytes, on the size of the temporary distance blocks used 
+# by the chunked distance functions.
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
 def euclidean(vector1, vector2):
     """
     Calculates the Euclidean distance between two vectors in n-space.
@@ -89,3 +93,633 @@ def cosine_distance(vector1, vector2):
       Close to 0 for similar vectors and larger values for dissimilar vectors.
     """
     return 1 - cosine_similarity(vector1, vector2)
+
+def pairwise_euclidean(matrix1, matrix2):
+    """
+    Calculates the Euclidean distance between every row of one matrix and 
+    every row of another.
+    
+    The computation is expanded as |a|^2 - 2a.b + |b|^2 so that the bulk of 
+    the work is a single matrix product, rather than a Python-level loop 
+    over pairs of vectors.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+        
+    Returns:
+      An (m x p) numpy array where entry [i, j] is the distance between 
+      row i of matrix1 and row j of matrix2.
+    """
+    matrix1 = np.asarray(matrix1, dtype=float)
+    matrix2 = np.asarray(matrix2, dtype=float)
+
+    squared = np.dot(matrix1, matrix2.T)
+    squared *= -2
+    squared += np.sum(matrix1 * matrix1, axis=1)[:, np.newaxis]
+    squared += np.sum(matrix2 * matrix2, axis=1)[np.newaxis, :]
+
+    # Rounding errors can leave tiny negative values where the true 
+    # distance is 0.
+    np.maximum(squared, 0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+def pairwise_squared_euclidean(matrix1, matrix2):
+    """
+    Calculates the squared Euclidean distance between every row of one 
+    matrix and every row of another.  It orders neighbours the same way as 
+    Euclidean distance but skips the square root.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+        
+    Returns:
+      An (m x p) numpy array of squared distances.
+    """
+    return np.square(pairwise_euclidean(matrix1, matrix2))
+
+def pairwise_manhattan(matrix1, matrix2):
+    """
+    Calculates the Manhattan (city block) distance between every row of one 
+    matrix and every row of another, i.e. the sum of the absolute 
+    differences of each feature.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+        
+    Returns:
+      An (m x p) numpy array of distances.
+    """
+    return _accumulate_feature_differences(matrix1, matrix2, np.add)
+
+def pairwise_chebyshev(matrix1, matrix2):
+    """
+    Calculates the Chebyshev distance between every row of one matrix and 
+    every row of another, i.e. the largest absolute difference of any 
+    feature.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+        
+    Returns:
+      An (m x p) numpy array of distances.
+    """
+    return _accumulate_feature_differences(matrix1, matrix2, np.maximum)
+
+def pairwise_minkowski(matrix1, matrix2, p=2):
+    """
+    Calculates the Minkowski distance of order p between every row of one 
+    matrix and every row of another.  p=1 is Manhattan distance and p=2 is 
+    Euclidean distance.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+      p: float
+        The order of the distance.  Must be at least 1 for the result to 
+        be a true metric.  Default value is 2.
+        
+    Returns:
+      An (m x p) numpy array of distances.
+    """
+    if p == 2:
+        return pairwise_euclidean(matrix1, matrix2)
+    
+    powered = _accumulate_feature_differences(matrix1, matrix2, np.add, 
+                                              power=p)
+    return np.power(powered, 1.0 / p, out=powered)
+
+def pairwise_cosine(matrix1, matrix2):
+    """
+    Calculates the cosine distance (see cosine_distance) between every row 
+    of one matrix and every row of another.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+        
+    Returns:
+      An (m x p) numpy array of distances.
+    """
+    matrix1 = np.asarray(matrix1, dtype=float)
+    matrix2 = np.asarray(matrix2, dtype=float)
+    
+    # Same convention as cosine_similarity: a zero vector has similarity 0 
+    # with everything.  Its dot products are already 0, so dividing them by 
+    # 1 instead of its magnitude keeps them 0.
+    magnitudes1 = np.sqrt(np.sum(matrix1 * matrix1, axis=1))
+    magnitudes1[magnitudes1 == 0] = 1.0
+    magnitudes2 = np.sqrt(np.sum(matrix2 * matrix2, axis=1))
+    magnitudes2[magnitudes2 == 0] = 1.0
+    
+    # Only the result is the size of the distance matrix, everything else is 
+    # done to it in place, so blocks stay within their memory budget.
+    distances = np.dot(matrix1, matrix2.T)
+    distances /= magnitudes1[:, np.newaxis]
+    distances /= magnitudes2[np.newaxis, :]
+    return np.subtract(1, distances, out=distances)
+
+def pairwise_mahalanobis(matrix1, matrix2, VI=None, transform=None):
+    """
+    Calculates the Mahalanobis distance between every row of one matrix and 
+    every row of another.
+    
+    The vectors are transformed by a square root of VI, see 
+    mahalanobis_transform, after which the Mahalanobis distance is just the 
+    Euclidean distance.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+      VI: 2d array-like
+        The (n x n) inverse covariance matrix.  It must be symmetric and 
+        positive semi-definite.  See inverse_covariance.
+      transform: 2d array-like
+        The result of mahalanobis_transform(VI), which can be given instead 
+        of VI to avoid decomposing VI on every call.  See 
+        prepare_metric_params.
+        
+    Returns:
+      An (m x p) numpy array of distances.
+    """
+    if transform is None:
+        transform = mahalanobis_transform(VI)
+    return pairwise_euclidean(np.dot(matrix1, transform), 
+                              np.dot(matrix2, transform))
+
+def mahalanobis_transform(VI):
+    """
+    Calculates a square root of an inverse covariance matrix from its 
+    eigendecomposition, such that the Mahalanobis distance between two 
+    vectors is the Euclidean distance between them once multiplied by it.  
+    Unlike a Cholesky factor this exists for singular VI too, such as the 
+    pseudo-inverse of the covariance of data with a constant or collinear 
+    feature.
+    
+    Args:
+      VI: 2d array-like
+        The (n x n) inverse covariance matrix.  It must be symmetric and 
+        positive semi-definite.
+        
+    Returns:
+      An (n x n) numpy array.
+    """
+    VI = np.asarray(VI, dtype=float)
+    eigenvalues, eigenvectors = np.linalg.eigh((VI + VI.T) / 2.0)
+    
+    # Rounding can leave the zero eigenvalues of a singular VI slightly 
+    # negative.
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+def inverse_covariance(matrix):
+    """
+    Estimates the inverse covariance matrix of some data, for use with 
+    Mahalanobis distance.
+    
+    Args:
+      matrix: 2d array-like
+        The data, one vector per row.
+        
+    Returns:
+      An (n x n) numpy array.  The pseudo-inverse is used so that the result 
+      exists even when the covariance matrix is singular.
+    """
+    covariance = np.atleast_2d(np.cov(np.asarray(matrix, dtype=float), 
+                                      rowvar=0))
+    return np.linalg.pinv(covariance)
+
+# Metrics which can be computed on whole matrices at once, by name.  Each 
+# maps to a function f(matrix1, matrix2, **params) returning the matrix of 
+# distances between their rows.
+METRICS = {
+    "euclidean": pairwise_euclidean,
+    "sqeuclidean": pairwise_squared_euclidean,
+    "manhattan": pairwise_manhattan,
+    "chebyshev": pairwise_chebyshev,
+    "minkowski": pairwise_minkowski,
+    "cosine": pairwise_cosine,
+    "mahalanobis": pairwise_mahalanobis,
+}
+
+# Functions between two vectors which have an equivalent entry in METRICS.
+_VECTOR_FUNCTION_NAMES = {
+    euclidean: "euclidean",
+    cosine_distance: "cosine",
+}
+
+def register_metric(name, function):
+    """
+    Adds a new metric which can be referred to by name.
+    
+    Args:
+      name: string
+        The name of the metric.
+      function: callable
+        A function f(matrix1, matrix2, **params) which returns the matrix of 
+        distances between every row of matrix1 and every row of matrix2.
+        
+    Returns:
+      void
+    """
+    METRICS[name] = function
+
+def get_metric_name(metric):
+    """
+    Finds the registered name of a metric.
+    
+    Args:
+      metric: string or callable
+        A metric name or a function between two vectors.
+        
+    Returns:
+      name: string
+        The name of the metric, or None for a function between two vectors 
+        with no matrix equivalent.
+        
+    Raises:
+      ValueError if metric is a string which is not a registered metric.
+    """
+    if callable(metric):
+        return _VECTOR_FUNCTION_NAMES.get(metric)
+    
+    if metric not in METRICS:
+        raise ValueError("Unknown metric '%s'.  Supported metrics are: %s" 
+                         % (metric, ", ".join(sorted(METRICS.keys()))))
+    return metric
+
+def prepare_metric_params(metric, metric_params=None):
+    """
+    Precomputes whatever a metric derives from its parameters, so that it 
+    is done once rather than every time distances are calculated, e.g. for 
+    each block of iter_pairwise_blocks.  For "mahalanobis" VI is replaced 
+    by its mahalanobis_transform.
+    
+    Args:
+      metric: string or callable
+        The metric, see pairwise_distances.
+      metric_params: dict
+        Keyword arguments for the metric.  Defaults to None.
+        
+    Returns:
+      params: dict
+        Keyword arguments for the metric which give the same distances.  
+        Preparing them again returns them unchanged.
+    """
+    params = dict(metric_params or {})
+    if get_metric_name(metric) == "mahalanobis" and "VI" in params:
+        params["transform"] = mahalanobis_transform(params.pop("VI"))
+    return params
+
+def pairwise_distances(matrix1, matrix2, metric="euclidean", 
+                       metric_params=None):
+    """
+    Calculates the distance between every row of one matrix and every row 
+    of another.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+      metric: string or callable
+        The name of a metric in METRICS, or a function which calculates the 
+        distance between two vectors.  Such functions are called once for 
+        each pair of rows, which is much slower, unless they have a 
+        registered equivalent (e.g. euclidean).  Defaults to "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric, e.g. {"p": 3} for 
+        "minkowski" or {"VI": ...} for "mahalanobis".  Defaults to None.
+        
+    Returns:
+      An (m x p) numpy array where entry [i, j] is the distance between 
+      row i of matrix1 and row j of matrix2.
+      
+    Raises:
+      ValueError if metric is a string which is not a registered metric.
+    """
+    if metric_params is None:
+        metric_params = {}
+        
+    matrix1 = np.asarray(matrix1, dtype=float)
+    matrix2 = np.asarray(matrix2, dtype=float)
+    
+    name = get_metric_name(metric)
+    if name is not None:
+        return METRICS[name](matrix1, matrix2, **metric_params)
+    
+    distances = np.empty((matrix1.shape[0], matrix2.shape[0]))
+    for i, vector1 in enumerate(matrix1):
+        for j, vector2 in enumerate(matrix2):
+            distances[i, j] = metric(vector1, vector2, **metric_params)
+    return distances
+
+def _accumulate_feature_differences(matrix1, matrix2, combine, power=1):
+    """
+    Combines the absolute per-feature differences between every row of one 
+    matrix and every row of another.  One feature is processed at a time so 
+    that no (m x p x n) temporary array is needed.
+    
+    Args:
+      combine: numpy ufunc
+        How to combine the differences of each feature, e.g. np.add.
+      power: float
+        Each absolute difference is raised to this power first.
+    """
+    matrix1 = np.asarray(matrix1, dtype=float)
+    matrix2 = np.asarray(matrix2, dtype=float)
+    
+    result = np.zeros((matrix1.shape[0], matrix2.shape[0]))
+    for feature in range(matrix1.shape[1]):
+        difference = np.abs(matrix1[:, feature, np.newaxis] - 
+                            matrix2[np.newaxis, :, feature])
+        if power != 1:
+            np.power(difference, power, out=difference)
+        combine(result, difference, out=result)
+    return result
+
+def iter_pairwise_blocks(matrix1, matrix2, 
+                         memory_budget=DEFAULT_MEMORY_BUDGET, 
+                         metric="euclidean", metric_params=None):
+    """
+    Calculates the distances between the rows of two matrices one block at 
+    a time, so that the full distance matrix never has to be held in memory.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix, one vector per row.
+      matrix2: 2d array-like
+        A (p x n) matrix, one vector per row.
+      memory_budget: int
+        The approximate maximum number of bytes to use for each block of 
+        distances.  Defaults to DEFAULT_MEMORY_BUDGET.
+      metric: string or callable
+        The metric to use, see pairwise_distances.  Defaults to "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric.  Defaults to None.
+        
+    Returns:
+      A generator of (rows, columns, distances) tuples.  rows and columns 
+      are slice objects locating the block within the full (m x p) distance 
+      matrix.  All column blocks of a row block are generated before moving 
+      on to the next row block.
+    """
+    matrix1 = np.asarray(matrix1, dtype=float)
+    matrix2 = np.asarray(matrix2, dtype=float)
+    metric_params = prepare_metric_params(metric, metric_params)
+    num_rows, num_columns = _block_shape(matrix1.shape[0], matrix2.shape[0], 
+                                         memory_budget)
+    
+    for row_start in range(0, matrix1.shape[0], num_rows):
+        rows = slice(row_start, row_start + num_rows)
+        for column_start in range(0, matrix2.shape[0], num_columns):
+            columns = slice(column_start, column_start + num_columns)
+            yield rows, columns, pairwise_distances(matrix1[rows], 
+                                                    matrix2[columns], 
+                                                    metric, metric_params)
+
+def chunked_k_nearest(matrix1, matrix2, k, 
+                      memory_budget=DEFAULT_MEMORY_BUDGET, metric="euclidean", 
+                      metric_params=None):
+    """
+    Finds the k rows of matrix2 nearest to each row of matrix1, keeping 
+    peak memory bounded by computing the distances in blocks and merging 
+    each block into a running top-k.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix of query vectors, one per row.
+      matrix2: 2d array-like
+        A (p x n) matrix of reference vectors, one per row.
+      k: int
+        The number of nearest reference vectors to find for each query.  If 
+        it is larger than p, all reference vectors are returned.
+      memory_budget: int
+        The approximate maximum number of bytes to use for each block of 
+        distances.  Defaults to DEFAULT_MEMORY_BUDGET.
+      metric: string or callable
+        The metric to use, see pairwise_distances.  Defaults to "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric.  Defaults to None.
+        
+    Returns:
+      distances: numpy array
+        An (m x min(k, p)) array of distances, ordered from nearest to 
+        furthest in each row.
+      indices: numpy array
+        The rows of matrix2 corresponding to distances.
+    """
+    num_queries = np.shape(matrix1)[0]
+    k = min(k, np.shape(matrix2)[0])
+    best_distances = np.empty((num_queries, k))
+    best_indices = np.empty((num_queries, k), dtype=int)
+    
+    current_rows = None
+    blocks = iter_pairwise_blocks(matrix1, matrix2, memory_budget, metric, 
+                                  metric_params)
+    for rows, columns, distances in blocks:
+        block_indices = np.arange(columns.start, 
+                                  columns.start + distances.shape[1])
+        block_indices = np.tile(block_indices, (distances.shape[0], 1))
+        
+        if rows != current_rows:
+            # First block for these queries, nothing to merge with yet
+            current_rows = rows
+            candidate_distances = distances
+            candidate_indices = block_indices
+        else:
+            candidate_distances = np.hstack((best_distances[rows], distances))
+            candidate_indices = np.hstack((best_indices[rows], block_indices))
+        
+        nearest = nearest_indices(candidate_distances, k)
+        block_rows = np.arange(distances.shape[0])[:, np.newaxis]
+        best_distances[rows] = candidate_distances[block_rows, nearest]
+        best_indices[rows] = candidate_indices[block_rows, nearest]
+        
+    return best_distances, best_indices
+
+def chunked_radius_neighbours(matrix1, matrix2, radius, 
+                              memory_budget=DEFAULT_MEMORY_BUDGET, 
+                              metric="euclidean", metric_params=None):
+    """
+    Finds all rows of matrix2 within a given distance of each row of 
+    matrix1, computing the distances in blocks to keep peak memory bounded.
+    
+    Only the neighbours found are sorted, not every distance.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix of query vectors, one per row.
+      matrix2: 2d array-like
+        A (p x n) matrix of reference vectors, one per row.
+      radius: float
+        The maximum distance of a neighbour (inclusive).
+      memory_budget: int
+        The approximate maximum number of bytes to use for each block of 
+        distances.  Defaults to DEFAULT_MEMORY_BUDGET.
+      metric: string or callable
+        The metric to use, see pairwise_distances.  Defaults to "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric.  Defaults to None.
+        
+    Returns:
+      distances: list
+        A 1d numpy array of distances for each query, ordered from nearest 
+        to furthest.  Ties are ordered by index.
+      indices: list
+        The rows of matrix2 corresponding to distances.
+    """
+    num_queries = np.shape(matrix1)[0]
+    found_distances = [[] for _ in range(num_queries)]
+    found_indices = [[] for _ in range(num_queries)]
+    
+    blocks = iter_pairwise_blocks(matrix1, matrix2, memory_budget, metric, 
+                                  metric_params)
+    for rows, columns, distances in blocks:
+        block_rows, block_columns = np.nonzero(distances <= radius)
+        splits = np.searchsorted(block_rows, 
+                                 np.arange(1, distances.shape[0]))
+        row_distances = np.split(distances[block_rows, block_columns], splits)
+        row_indices = np.split(block_columns + columns.start, splits)
+        for row, (row_distance, row_index) in enumerate(
+                                        zip(row_distances, row_indices)):
+            found_distances[rows.start + row].append(row_distance)
+            found_indices[rows.start + row].append(row_index)
+    
+    return sort_neighbours(found_distances, found_indices)
+
+def sort_neighbours(distances, indices):
+    """
+    Combines and sorts the neighbours found for each query.
+    
+    Args:
+      distances: list
+        For each query, a list of 1d arrays of distances.
+      indices: list
+        For each query, a list of 1d arrays of the indices corresponding to 
+        distances.
+        
+    Returns:
+      distances: list
+        A 1d numpy array of distances for each query, ordered from nearest 
+        to furthest.  Ties are ordered by index.
+      indices: list
+        The indices corresponding to distances.
+    """
+    sorted_distances = []
+    sorted_indices = []
+    for query_distances, query_indices in zip(distances, indices):
+        query_distances = np.concatenate(query_distances or [np.empty(0)])
+        query_indices = np.concatenate(
+                            query_indices or [np.empty(0, dtype=int)])
+        order = np.lexsort((query_indices, query_distances))
+        sorted_distances.append(query_distances[order])
+        sorted_indices.append(query_indices[order])
+    return sorted_distances, sorted_indices
+
+def chunked_argmin(matrix1, matrix2, memory_budget=DEFAULT_MEMORY_BUDGET, 
+                   metric="euclidean", metric_params=None):
+    """
+    Finds the row of matrix2 nearest to each row of matrix1, computing the 
+    distances in blocks to keep peak memory bounded.
+    
+    Args:
+      matrix1: 2d array-like
+        An (m x n) matrix of query vectors, one per row.
+      matrix2: 2d array-like
+        A (p x n) matrix of reference vectors, one per row.
+      memory_budget: int
+        The approximate maximum number of bytes to use for each block of 
+        distances.  Defaults to DEFAULT_MEMORY_BUDGET.
+      metric: string or callable
+        The metric to use, see pairwise_distances.  Defaults to "euclidean".
+      metric_params: dict
+        Additional keyword arguments for the metric.  Defaults to None.
+        
+    Returns:
+      indices: numpy array
+        The position in matrix2 of the nearest vector for each query.  Ties 
+        go to the earliest position.
+      distances: numpy array
+        The distance to the nearest vector for each query.
+    """
+    num_queries = np.shape(matrix1)[0]
+    best_distances = np.empty(num_queries)
+    best_distances.fill(np.inf)
+    best_indices = np.zeros(num_queries, dtype=int)
+    
+    blocks = iter_pairwise_blocks(matrix1, matrix2, memory_budget, metric, 
+                                  metric_params)
+    for rows, columns, distances in blocks:
+        block_best = np.argmin(distances, axis=1)
+        block_distances = distances[np.arange(distances.shape[0]), block_best]
+        
+        improved = block_distances < best_distances[rows]
+        best_distances[rows] = np.where(improved, block_distances, 
+                                        best_distances[rows])
+        best_indices[rows] = np.where(improved, block_best + columns.start, 
+                                      best_indices[rows])
+        
+    return best_indices, best_distances
+
+def nearest_indices(distances, k):
+    """
+    Selects the positions of the k smallest distances in each row of a 
+    distance matrix.
+    
+    np.argpartition is used so that only the k nearest entries in each row 
+    need to be sorted, rather than the whole row.
+    
+    Args:
+      distances: numpy array
+        A 2d array of distances, one row per query.
+      k: int
+        The number of positions to select from each row.  If it is larger 
+        than the number of columns, every column is selected.
+        
+    Returns:
+      A 2d numpy array of column positions with min(k, num_columns) entries 
+      per row, ordered by increasing distance.
+    """
+    num_columns = distances.shape[1]
+    if k < num_columns:
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(num_columns), (distances.shape[0], 1))
+    
+    rows = np.arange(distances.shape[0])[:, np.newaxis]
+    order = np.argsort(distances[rows, candidates], axis=1, kind="mergesort")
+    return candidates[rows, order]
+
+def _block_shape(num_rows1, num_rows2, memory_budget):
+    """
+    Chooses how many rows of each matrix to put in a block of distances.  
+    Blocks are made as wide as possible so that as few partial results as 
+    possible need to be merged.
+    
+    Returns:
+      num_rows1, num_rows2: int
+    """
+    # Allow for a temporary array of the same size while computing a block 
+    # of 8 byte floats.  The metrics in METRICS need no more than that, 
+    # e.g. pairwise_cosine works on its result in place.
+    max_entries = max(1, int(memory_budget) // 16)
+    num_columns = max(1, min(num_rows2, max_entries))
+    num_rows = max(1, min(num_rows1, max_entries // num_columns))
+    return num_rows, num_columns
@@ -27,7 +27,7 @@ import unittest
 
 from hamcrest import assert_that
 
-from pml.data.loader import load
+from pml.data.loader import load, load_chunks
 
 from test import base_tests
 from test.matchers.pandas_matchers import equals_series
@@ -72,6 +72,16 @@ class LoaderTest(base_tests.BaseFileLoadingTest):
         self.assertEqual(dataset.num_features(), 3)
         self.assertTrue(dataset.get_labels() is None)
         
+    def test_load_chunks(self):
+        chunks = list(load_chunks(
+                        self.relative_to_base("datasets/3f_ids_header.csv"), 
+                        3))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0].num_samples(), 3)
+        self.assertEqual(chunks[1].num_samples(), 1)
+        self.assertEqual(chunks[1].num_features(), 3)
+        assert_that(chunks[1].get_labels(), equals_series({"V04": "a"}))
+        
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,132 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Unit tests for the gradient boosted trees module.
+
+@author: drusk
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from hamcrest import assert_that, contains_inanyorder
+
+from pml.data.model import DataSet
+from pml.supervised.decision_trees import GradientBoostedTrees
+from pml.supervised.decision_trees.boosting import _build_histograms
+
+class GradientBoostedTreesTest(unittest.TestCase):
+
+    def create_dataset(self, num_classes=2, num_samples=400):
+        random = np.random.RandomState(0)
+        data = random.rand(num_samples, 3)
+        codes = np.minimum((data[:, 0] + data[:, 1]) * num_classes / 2, 
+                           num_classes - 1).astype(int)
+        labels = np.array(["a", "b", "c"])[codes]
+        return DataSet(pd.DataFrame(data, columns=["x", "y", "z"]), 
+                       labels=pd.Series(labels))
+
+    def test_classify_two_classes(self):
+        dataset = self.create_dataset()
+        classifier = GradientBoostedTrees(dataset, num_iterations=30, 
+                                          min_samples_leaf=5)
+        results = classifier.classify_all(dataset)
+        self.assertTrue(results.compute_accuracy() > 0.95)
+        self.assertEqual(classifier.classify(
+                            pd.Series({"x": 0.9, "y": 0.9, "z": 0.5})), "b")
+
+    def test_classify_three_classes(self):
+        dataset = self.create_dataset(num_classes=3)
+        classifier = GradientBoostedTrees(dataset, num_iterations=30, 
+                                          min_samples_leaf=5)
+        self.assertTrue(classifier.classify_all(dataset).compute_accuracy() 
+                        > 0.9)
+
+    def test_get_classification_probabilities(self):
+        dataset = self.create_dataset(num_classes=3)
+        classifier = GradientBoostedTrees(dataset, num_iterations=5)
+        probabilities = classifier.get_classification_probabilities(dataset)
+        assert_that(probabilities.columns, contains_inanyorder("a", "b", "c"))
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1)
+
+    def test_missing_values(self):
+        dataset = self.create_dataset()
+        dataset.get_data_frame().iloc[::10, 0] = np.nan
+        classifier = GradientBoostedTrees(dataset, num_iterations=10)
+        sample = pd.Series({"x": np.nan, "y": 0.1, "z": 0.5})
+        self.assertEqual(classifier.classify(sample), "a")
+
+    def test_early_stopping(self):
+        dataset = self.create_dataset()
+        classifier = GradientBoostedTrees(dataset, num_iterations=500, 
+                                          learning_rate=0.5, 
+                                          early_stopping_rounds=3)
+        num_losses = len(classifier.validation_losses)
+        self.assertTrue(num_losses < 500)
+        self.assertEqual(classifier.num_iterations(), num_losses - 3)
+        self.assertEqual(np.argmin(classifier.validation_losses), 
+                         classifier.num_iterations() - 1)
+
+    def test_early_stopping_with_validation_set(self):
+        training, validation = self.create_dataset().split(0.5)
+        classifier = GradientBoostedTrees(training, num_iterations=500, 
+                                          learning_rate=0.5, 
+                                          early_stopping_rounds=3, 
+                                          validation_set=validation)
+        self.assertTrue(classifier.num_iterations() < 500)
+
+    def test_early_stopping_empty_validation_set(self):
+        dataset = self.create_dataset()
+        for fraction in [0.0, 1.0, -0.1]:
+            self.assertRaises(ValueError, GradientBoostedTrees, dataset, 
+                              num_iterations=20, early_stopping_rounds=3, 
+                              validation_fraction=fraction)
+        
+        empty = DataSet(dataset.get_data_frame().iloc[:0], 
+                        labels=dataset.get_labels().iloc[:0])
+        self.assertRaises(ValueError, GradientBoostedTrees, dataset, 
+                          num_iterations=20, early_stopping_rounds=3, 
+                          validation_set=empty)
+
+    def test_histogram_subtraction(self):
+        random = np.random.RandomState(1)
+        bins = random.randint(0, 256, size=(50, 4)).astype(np.uint8)
+        gradients = random.randn(50)
+        hessians = random.rand(50)
+        rows = np.arange(50)
+        parent = _build_histograms(bins, gradients, hessians, rows)
+        left = _build_histograms(bins, gradients, hessians, rows[:20])
+        right = _build_histograms(bins, gradients, hessians, rows[20:])
+        np.testing.assert_allclose(parent - left, right, atol=1e-12)
+        np.testing.assert_allclose(parent[2].sum(axis=1), 50)
+
+    def test_non_numeric_feature(self):
+        dataset = DataSet(pd.DataFrame({"x": ["a", "b"]}), labels=["y", "n"])
+        self.assertRaises(ValueError, GradientBoostedTrees, dataset)
+
+    def test_max_bins_out_of_range(self):
+        self.assertRaises(ValueError, GradientBoostedTrees, 
+                          self.create_dataset(), max_bins=256)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
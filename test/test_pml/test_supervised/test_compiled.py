@@ -0,0 +1,78 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Unit tests for the compiled decision tree module.
+
+@author: drusk
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from hamcrest import assert_that, contains
+
+from pml.supervised.decision_trees.compiled import CompiledTree
+from pml.supervised.decision_trees.trees import Node, ThresholdNode, Tree
+
+class CompiledTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        root = Node("colour")
+        size_node = ThresholdNode("size", 2.5)
+        big_node = Node("big")
+        size_node.add_child(size_node.get_left_branch(), Node("small"))
+        size_node.add_child(size_node.get_right_branch(), big_node)
+        root.add_child("red", size_node)
+        root.add_child("blue", Node("blue"))
+        self.tree = Tree(root)
+        self.compiled = CompiledTree(self.tree, "unknown")
+        self.stop_nodes = [big_node, root, size_node]
+
+    def test_num_nodes(self):
+        # 5 nodes plus the default leaf
+        self.assertEqual(self.compiled.num_nodes(), 6)
+
+    def test_classify_all(self):
+        samples = pd.DataFrame({"colour": ["red", "blue", "red", "red"], 
+                                "size": [1.0, 7.0, 2.5, 3.0]})
+        assert_that(self.compiled.classify_all(samples), 
+                    contains("small", "blue", "small", "big"))
+
+    def test_classify_all_untrained_and_missing_values(self):
+        samples = pd.DataFrame({"colour": ["green", None, "red"], 
+                                "size": [1.0, 1.0, np.nan]})
+        assert_that(self.compiled.classify_all(samples), 
+                    contains("unknown", "unknown", "unknown"))
+
+    def test_find_stops(self):
+        samples = pd.DataFrame({"colour": ["red", "green", "red"], 
+                                "size": [3.0, 1.0, np.nan]})
+        # Node numbers depend on the order of the branches, so compare the 
+        # nodes they refer to.
+        nodes = self.tree.get_nodes_breadth_first()
+        stops = self.compiled.find_stops(samples)
+        assert_that([nodes[stop] for stop in stops], 
+                    contains(*self.stop_nodes))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -32,15 +32,20 @@ weather on the rainy branch.
 @author: drusk
 """
 
+import sys
 import unittest
 
+import numpy as np
 import pandas as pd
 from hamcrest import assert_that, equal_to
 
-from pml.supervised.decision_trees import id3
+from pml.supervised.decision_trees import builder, cart, id3
 from pml.supervised.decision_trees import DecisionTree
+from pml.supervised.decision_trees.encoding import EncodedDataSet
+from pml.tools.info_theory import info_gain
 from pml.data.loader import load
 from pml.data.model import DataSet
+from pml.utils.errors import InconsistentFeaturesError
 
 from test import base_tests
 from test.matchers.pml_matchers import equals_tree
@@ -53,6 +58,20 @@ class DecisionTreesTest(base_tests.BaseFileLoadingTest):
         root = id3.choose_feature_to_split(data)
         self.assertEqual(root, "weather")
     
+    def test_id3_calc_info_gains(self):
+        data = load(self.relative_to_base("/datasets/weekends.data"))
+        encoded = EncodedDataSet(data)
+        gains = id3.calc_info_gains(encoded, np.arange(data.num_samples()), 
+                                    [0, 1, 2])
+        for feature, gain in zip(encoded.features, gains):
+            self.assertAlmostEqual(gain, info_gain(feature, data))
+    
+    def test_id3_build_tree_missing_values(self):
+        dataset = DataSet(pd.DataFrame({"a": ["x", "y", None, "y"]}), 
+                          labels=["yes", "no", "no", "no"])
+        tree = id3.build_tree(dataset)
+        assert_that(tree, equals_tree({"a": {"x": "yes", "y": "no"}}))
+    
     def test_id3_build_tree_marine_animals(self):
         dataset = load(self.relative_to_base("/datasets/marine_animal.data"))
         tree = id3.build_tree(dataset)
@@ -131,6 +150,62 @@ class DecisionTreesTest(base_tests.BaseFileLoadingTest):
             )
         )
         
+    def test_pool_scorer_sends_context_once_per_process(self):
+        class RecordingPool(object):
+            def __init__(self):
+                self.batches = []
+            
+            def map(self, function, batches):
+                self.batches.extend(batches)
+                return [[(context, job) for job in jobs] 
+                        for context, jobs in batches]
+        
+        pool = RecordingPool()
+        score_all = builder._pool_scorer(pool, 3)
+        rows = np.arange(100)
+        results = score_all(rows, list(range(7)))
+        
+        self.assertEqual(len(pool.batches), 3)
+        self.assertEqual([job for _, job in results], list(range(7)))
+        for context, _ in results:
+            self.assertTrue(context is rows)
+
+    def test_id3_build_tree_in_parallel(self):
+        dataset = load(self.relative_to_base("/datasets/weekends.data"))
+        serial_tree = id3.build_tree(dataset)
+        parallel_tree = id3.build_tree(dataset, n_jobs=3)
+        self.assertEqual(parallel_tree.get_num_leaves(), 
+                         serial_tree.get_num_leaves())
+        assert_that(parallel_tree,
+            equals_tree( 
+                {"weather": {
+                    "sunny": {
+                        "parents": {
+                            "yes": "cinema",
+                            "no": "tennis"
+                        }
+                    },
+                    "windy": {
+                        "parents": {
+                            "yes": "cinema",
+                            "no": {
+                                "money": {
+                                    "rich": "shopping",
+                                    "poor": "cinema"
+                                }
+                            }
+                        }
+                    },
+                    "rainy": {
+                        "money": {
+                            "poor": "cinema",
+                            "rich": "stay in"
+                        }
+                    }
+                }}
+            )
+        )
+        
     def test_classify_play_tennis(self):
         training = load(self.relative_to_base("/datasets/play_tennis.data"),
                         delimiter=" ")
@@ -158,6 +233,15 @@ class DecisionTreesTest(base_tests.BaseFileLoadingTest):
         assert_that(results.get_classifications(), 
                     equals_series({0: "shopping", 1: "cinema"}))
 
+    def test_classify_all_in_parallel(self):
+        training = load(self.relative_to_base("/datasets/weekends.data"))
+        classifier = DecisionTree(training)
+        results = classifier.classify_all(training, n_jobs=3)
+        expected = classifier.classify_all(training).get_classifications()
+        assert_that(results.get_classifications(), 
+                    equals_series(expected.to_dict()))
+        self.assertEqual(results.compute_accuracy(), 1.0)
+
     def test_data_has_value_not_in_training(self):
         training = load(self.relative_to_base("/datasets/play_tennis.data"), 
                         delimiter=" ")
@@ -169,6 +253,197 @@ class DecisionTreesTest(base_tests.BaseFileLoadingTest):
         
         assert_that(classifier.classify(sample), equal_to("Yes"))
 
+    def create_numeric_dataset(self):
+        data = pd.DataFrame({"x": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], 
+                             "c": ["a", "a", "b", "b", "a", "b"]}, 
+                            columns=["x", "c"])
+        return DataSet(data, labels=["n", "n", "y", "y", "n", "n"])
+
+    def test_cart_build_tree_reuses_numeric_feature(self):
+        dataset = self.create_numeric_dataset().slice_features(["x"])
+        tree = cart.build_tree(dataset)
+        
+        assert_that(tree,
+            equals_tree(
+                {"x": {
+                    "<= 2.5": "n",
+                    "> 2.5": {
+                        "x": {
+                            "<= 4.5": "y",
+                            "> 4.5": "n"
+                        }
+                    }
+                }}
+            )
+        )
+
+    def test_cart_build_tree_mixed_features(self):
+        tree = cart.build_tree(self.create_numeric_dataset())
+        
+        assert_that(tree,
+            equals_tree(
+                {"c": {
+                    "a": "n",
+                    "b": {
+                        "x": {
+                            "<= 5": "y",
+                            "> 5": "n"
+                        }
+                    }
+                }}
+            )
+        )
+
+    def test_cart_build_tree_binned(self):
+        tree = cart.build_tree(self.create_numeric_dataset(), max_bins=2)
+        
+        assert_that(tree,
+            equals_tree(
+                {"c": {
+                    "a": "n",
+                    "b": {
+                        "x": {
+                            "<= 3.5": "y",
+                            "> 3.5": "n"
+                        }
+                    }
+                }}
+            )
+        )
+
+    def test_cart_build_tree_in_parallel(self):
+        dataset = self.create_numeric_dataset().slice_features(["x"])
+        tree = cart.build_tree(dataset, n_jobs=2)
+        
+        assert_that(tree,
+            equals_tree(
+                {"x": {
+                    "<= 2.5": "n",
+                    "> 2.5": {
+                        "x": {
+                            "<= 4.5": "y",
+                            "> 4.5": "n"
+                        }
+                    }
+                }}
+            )
+        )
+
+    def test_cart_unknown_criterion(self):
+        self.assertRaises(ValueError, cart.build_tree, 
+                          self.create_numeric_dataset(), criterion="bad")
+
+    def test_cart_parameters_with_id3(self):
+        dataset = self.create_numeric_dataset()
+        self.assertRaises(ValueError, DecisionTree, dataset, 
+                          criterion="gini")
+        self.assertRaises(ValueError, DecisionTree, dataset, 
+                          algorithm="id3", max_bins=10)
+
+    def test_classify_cart(self):
+        classifier = DecisionTree(self.create_numeric_dataset(), 
+                                  algorithm="cart")
+        sample = pd.Series({"x": 3.2, "c": "b"})
+        self.assertEqual(classifier.classify(sample), "y")
+
+    def test_classify_cart_missing_value(self):
+        classifier = DecisionTree(self.create_numeric_dataset(), 
+                                  algorithm="cart")
+        sample = pd.Series({"x": np.nan, "c": "b"})
+        self.assertEqual(classifier.classify(sample), "n")
+
+    def test_classify_all_cart(self):
+        classifier = DecisionTree(self.create_numeric_dataset(), 
+                                  algorithm="cart")
+        samples = pd.DataFrame({"x": [3.2, 5.5, np.nan, 1.0], 
+                                "c": ["b", "b", "b", "z"]})
+        results = classifier.classify_all(DataSet(samples))
+        assert_that(results.get_classifications(), 
+                    equals_series({0: "y", 1: "n", 2: "n", 3: "n"}))
+
+    def test_classify_all_inconsistent_features(self):
+        classifier = DecisionTree(self.create_numeric_dataset(), 
+                                  algorithm="cart")
+        missing_feature = DataSet(pd.DataFrame({"x": [3.2, 5.5]}))
+        self.assertRaises(InconsistentFeaturesError, 
+                          classifier.classify_all, missing_feature)
+        extra_feature = DataSet(pd.DataFrame({"x": [3.2], "c": ["b"], 
+                                              "z": [1]}))
+        self.assertRaises(InconsistentFeaturesError, 
+                          classifier.classify_all, extra_feature)
+
+    def test_cart_build_tree_deeper_than_recursion_limit(self):
+        # Alternating labels take one threshold split per sample.
+        num_samples = sys.getrecursionlimit() + 100
+        dataset = DataSet(
+                pd.DataFrame({"x": np.arange(num_samples, dtype=float)}), 
+                labels=pd.Series(["n", "y"] * (num_samples // 2)))
+        
+        for n_jobs in [1, 2]:
+            tree = cart.build_tree(dataset, n_jobs=n_jobs)
+            self.assertEqual(tree.get_num_leaves(), num_samples)
+            self.assertEqual(tree.get_depth(), num_samples)
+
+    def test_cart_max_depth(self):
+        dataset = self.create_numeric_dataset().slice_features(["x"])
+        tree = cart.build_tree(dataset, max_depth=1)
+        self.assertEqual(tree.get_num_leaves(), 2)
+        self.assertEqual(tree.get_depth(), 2)
+
+    def test_cart_min_samples_split(self):
+        dataset = self.create_numeric_dataset().slice_features(["x"])
+        tree = cart.build_tree(dataset, min_samples_split=5)
+        self.assertEqual(tree.get_num_leaves(), 2)
+
+    def test_cart_min_gain(self):
+        dataset = self.create_numeric_dataset().slice_features(["x"])
+        self.assertEqual(
+                cart.build_tree(dataset, min_gain=0.1).get_num_leaves(), 3)
+        self.assertEqual(
+                cart.build_tree(dataset, min_gain=0.2).get_num_leaves(), 1)
+
+    def test_cart_max_leaf_nodes(self):
+        dataset = self.create_numeric_dataset().slice_features(["x"])
+        tree = cart.build_tree(dataset, max_leaf_nodes=2)
+        self.assertEqual(tree.get_num_leaves(), 2)
+
+    def test_cart_max_leaf_nodes_in_parallel(self):
+        dataset = self.create_numeric_dataset().slice_features(["x"])
+        tree = cart.build_tree(dataset, max_leaf_nodes=2, n_jobs=2)
+        self.assertEqual(tree.get_num_leaves(), 2)
+
+    def test_id3_max_depth(self):
+        dataset = load(self.relative_to_base("/datasets/play_tennis.data"),
+                       delimiter=" ")
+        tree = id3.build_tree(dataset, max_depth=1)
+        self.assertEqual(tree.get_depth(), 2)
+
+    def test_id3_max_leaf_nodes_with_missing_values(self):
+        # The 'x' node's best split is on 'a', which all its samples are 
+        # missing, so it becomes a leaf without adding any leaves.
+        nan = float("nan")
+        dataset = DataSet(pd.DataFrame({
+                "a": ["q", nan, nan, "q", "p", "p", "p", "q"], 
+                "b": ["y", "x", "x", "z", "y", "z", "z", "y"], 
+                "c": ["v", "u", "v", "u", "u", "u", "v", "v"]}), 
+                labels=[0, 1, 0, 1, 0, 0, 1, 0])
+        for max_leaf_nodes in [2, 3, 4]:
+            tree = id3.build_tree(dataset, max_leaf_nodes=max_leaf_nodes)
+            self.assertTrue(tree.get_num_leaves() <= max_leaf_nodes)
+
+    def test_classify_all_with_limits(self):
+        classifier = DecisionTree(
+                self.create_numeric_dataset().slice_features(["x"]), 
+                algorithm="cart", max_leaf_nodes=2)
+        samples = pd.DataFrame({"x": [1.0, 2.0]})
+        results = classifier.classify_all(DataSet(samples))
+        assert_that(results.get_classifications(), 
+                    equals_series({0: "n", 1: "n"}))
+
+    def test_unknown_algorithm(self):
+        self.assertRaises(ValueError, DecisionTree, 
+                          self.create_numeric_dataset(), algorithm="c4.5")
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,72 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Unit tests for the decision tree encoding module.
+
+@author: drusk
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from hamcrest import assert_that, contains
+
+from pml.data.model import DataSet
+from pml.supervised.decision_trees.encoding import EncodedDataSet
+
+class EncodedDataSetTest(unittest.TestCase):
+
+    def setUp(self):
+        data = pd.DataFrame({"colour": ["red", "blue", "red", None, "blue"], 
+                             "size": ["big", "big", "small", "small", "big"]}, 
+                            columns=["colour", "size"])
+        labels = ["a", "b", "a", "a", "a"]
+        self.encoded = EncodedDataSet(DataSet(data, labels=labels))
+
+    def test_encoding(self):
+        assert_that(self.encoded.features, contains("colour", "size"))
+        assert_that(self.encoded.labels, contains("a", "b"))
+        assert_that(self.encoded.feature_values[0], contains("red", "blue"))
+        np.testing.assert_array_equal(self.encoded.matrix[:, 0], 
+                                      [0, 1, 0, -1, 1])
+        np.testing.assert_array_equal(self.encoded.label_codes, 
+                                      [0, 1, 0, 0, 0])
+
+    def test_label_counts(self):
+        np.testing.assert_array_equal(
+                        self.encoded.label_counts(np.array([0, 1, 4])), [2, 1])
+
+    def test_value_label_counts_skips_missing(self):
+        counts = self.encoded.value_label_counts(np.arange(5), 0)
+        np.testing.assert_array_equal(counts, [[2, 0], [1, 1]])
+
+    def test_group_rows(self):
+        groups = self.encoded.group_rows(np.array([4, 3, 2, 1, 0]), 0)
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(groups[0][0], 0)
+        np.testing.assert_array_equal(groups[0][1], [2, 0])
+        self.assertEqual(groups[1][0], 1)
+        np.testing.assert_array_equal(groups[1][1], [4, 1])
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,120 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Unit tests for the random forest module.
+
+@author: drusk
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from hamcrest import assert_that, contains
+
+from pml.data.loader import load
+from pml.data.model import DataSet
+from pml.supervised.decision_trees import RandomForest
+from pml.supervised.decision_trees.forest import _resolve_max_features
+from pml.supervised.decision_trees.interface import create_builder
+
+from test import base_tests
+
+class RandomForestTest(base_tests.BaseFileLoadingTest):
+
+    def create_numeric_dataset(self):
+        random = np.random.RandomState(0)
+        data = random.rand(60, 4)
+        labels = np.where(data[:, 0] + data[:, 1] > 1, "a", "b")
+        return DataSet(pd.DataFrame(data, columns=["w", "x", "y", "z"]), 
+                       labels=pd.Series(labels))
+
+    def test_classify_play_tennis(self):
+        training = load(self.relative_to_base("/datasets/play_tennis.data"),
+                        delimiter=" ")
+        forest = RandomForest(training, num_trees=15, random_state=0)
+        self.assertEqual(forest.classify_all(training).compute_accuracy(), 
+                         1.0)
+        sample = pd.Series(["Overcast", "Cool", "High", "Strong"], 
+                           index=['Outlook', 'Temperature', 'Humidity', 
+                                  'Wind'])
+        self.assertEqual(forest.classify(sample), "Yes")
+
+    def test_reproducible_with_random_state(self):
+        dataset = self.create_numeric_dataset()
+        forest1 = RandomForest(dataset, algorithm="cart", random_state=3)
+        forest2 = RandomForest(dataset, algorithm="cart", random_state=3)
+        proportions1 = forest1.get_vote_proportions(dataset)
+        proportions2 = forest2.get_vote_proportions(dataset)
+        np.testing.assert_array_equal(proportions1.values, 
+                                      proportions2.values)
+
+    def test_same_forest_in_parallel(self):
+        dataset = self.create_numeric_dataset()
+        serial = RandomForest(dataset, num_trees=4, algorithm="cart", 
+                              random_state=3)
+        parallel = RandomForest(dataset, num_trees=4, algorithm="cart", 
+                                n_jobs=2, random_state=3)
+        np.testing.assert_array_equal(
+                        serial.get_vote_proportions(dataset).values, 
+                        parallel.get_vote_proportions(dataset).values)
+
+    def test_get_vote_proportions(self):
+        dataset = self.create_numeric_dataset()
+        forest = RandomForest(dataset, num_trees=5, algorithm="cart", 
+                              random_state=1)
+        proportions = forest.get_vote_proportions(dataset)
+        assert_that(proportions.columns, contains("a", "b"))
+        np.testing.assert_allclose(proportions.sum(axis=1), 1)
+        
+        # Each proportion is a whole number of votes out of 5
+        np.testing.assert_allclose(proportions.values * 5, 
+                                   np.round(proportions.values * 5))
+
+    def test_bootstrap_rows(self):
+        dataset = self.create_numeric_dataset()
+        builder = create_builder(dataset, algorithm="cart")
+        rows = np.array([0, 0, 0, 1, 1, 2])
+        tree = builder.build(rows=rows)
+        
+        # Only the rows in the sample are used, however often they appear
+        self.assertTrue(tree.get_num_leaves() <= 3)
+
+    def test_resolve_max_features(self):
+        self.assertEqual(_resolve_max_features("sqrt", 10), 3)
+        self.assertEqual(_resolve_max_features("log2", 10), 3)
+        self.assertEqual(_resolve_max_features(0.5, 10), 5)
+        self.assertEqual(_resolve_max_features(0.01, 10), 1)
+        self.assertEqual(_resolve_max_features(4, 10), 4)
+        self.assertIsNone(_resolve_max_features(None, 10))
+
+    def test_unknown_max_features(self):
+        self.assertRaises(ValueError, RandomForest, 
+                          self.create_numeric_dataset(), 
+                          max_features="all")
+
+    def test_cart_parameters_with_id3(self):
+        self.assertRaises(ValueError, RandomForest, 
+                          self.create_numeric_dataset(), criterion="entropy")
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -23,14 +23,25 @@ Unit tests for the KNN algorithm.
 @author: drusk
 """
 
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+import pandas as pd
 from hamcrest import assert_that, contains
 
 from pml.supervised.knn import Knn
 from pml.data.model import DataSet
 from pml.utils.errors import UnlabelledDataSetError, InconsistentFeaturesError
 
+from test.matchers.pandas_matchers import equals_series
+
+def labelled_dataset(data, labels, sample_ids):
+    return DataSet(pd.DataFrame(data, index=sample_ids), 
+                   labels=pd.Series(labels, index=sample_ids))
+
+
 class KnnTest(unittest.TestCase):
 
     def test_two_classes_no_tie(self):
@@ -71,6 +82,303 @@ class KnnTest(unittest.TestCase):
         classes = classifier.classify_all(dataset).get_classifications()
         assert_that(classes, contains("a", "b"))
         
+    def test_classify_all_matches_classify(self):
+        training_set = DataSet([[1, 0.5], [1, 2], [1, 3], [2, 0.5], [2, 2.5], 
+                                [2, 3], [2.5, 1.5], [3, 1]], 
+                               labels=["a", "a", "a", "a", "b", "a", "c", "a"])
+        classifier = Knn(training_set, k=3)
+        dataset = [[2, 1.5], [2.4, 2.6], [2.6, 1.4], [0, 0]]
+        classes = classifier.classify_all(dataset).get_classifications()
+        assert_that(classes, 
+                    contains(*[classifier.classify(sample) 
+                               for sample in dataset]))
+        
+    def test_classify_all_features_in_different_order(self):
+        training_set = DataSet(pd.DataFrame([[1, 10], [2, 20], [11, 110]], 
+                                            columns=["x", "y"]), 
+                               labels=["a", "a", "b"])
+        classifier = Knn(training_set, k=1)
+        dataset = DataSet(pd.DataFrame([[100, 10], [10, 1]], 
+                                       columns=["y", "x"]))
+        classes = classifier.classify_all(dataset).get_classifications()
+        assert_that(classes, contains("b", "a"))
+        
+    def test_classify_all_inconsistent_features(self):
+        training_set = DataSet([[1, 2, 3], [4, 5, 6]], labels=["a", "a"])
+        classifier = Knn(training_set)
+        self.assertRaises(InconsistentFeaturesError, 
+                          classifier.classify_all, [[1, 2]])
+        
+    def test_classify_all_in_parallel(self):
+        training_set = DataSet([[1, 0.5], [1, 2], [1, 3], [2, 0.5], [2, 2.5], 
+                                [2, 3], [2.5, 1.5], [3, 1]], 
+                               labels=["a", "a", "a", "a", "b", "a", "c", "a"])
+        classifier = Knn(training_set, k=3)
+        dataset = DataSet(pd.DataFrame([[2, 1.5], [2.4, 2.6], [2.6, 1.4], 
+                                        [0, 0], [2.1, 2.9]], 
+                                       index=["s1", "s2", "s3", "s4", "s5"]))
+        expected = classifier.classify_all(dataset).get_classifications()
+        results = classifier.classify_all(dataset, n_jobs=2)
+        assert_that(results.get_classifications(), 
+                    equals_series(expected.to_dict()))
+        self.assertEqual(results.get_classifications().index.tolist(), 
+                         ["s1", "s2", "s3", "s4", "s5"])
+        
+    def test_classify_all_with_index(self):
+        training_set = DataSet([[1, 0.5], [1, 2], [1, 3], [2, 0.5], [2, 2.5], 
+                                [2, 3], [2.5, 1.5], [3, 1]], 
+                               labels=["a", "a", "a", "a", "b", "a", "c", "a"])
+        dataset = [[2, 1.5], [2.4, 2.6], [2.6, 1.4], [0, 0]]
+        expected = Knn(training_set, k=3).classify_all(dataset)
+        for index in ["kd_tree", "ball_tree", "auto"]:
+            classifier = Knn(training_set, k=3, index=index)
+            classes = classifier.classify_all(dataset).get_classifications()
+            assert_that(classes, contains(*expected.get_classifications()))
+            self.assertEqual(
+                classifier.get_index_timings()["num_queries"], 4)
+        
+    def test_auto_index_params_with_brute_force(self):
+        training_set = DataSet([[1, 0.5], [1, 2], [2, 0.5], [2, 3]], 
+                               labels=["a", "a", "b", "b"])
+        classifier = Knn(training_set, k=1, metric="cosine", index="auto", 
+                         index_params={"leaf_size": 5})
+        self.assertEqual(classifier.classify([3, 0.8]), "b")
+        
+    def test_approximate_measure_recall(self):
+        training_set = DataSet([[i, i % 7] for i in range(50)], 
+                               labels=["a"] * 25 + ["b"] * 25)
+        classifier = Knn(training_set, k=3, approximate=True, 
+                         index_params={"num_trees": 1, "leaf_size": 50})
+        results = classifier.measure_recall([[10.2, 3], [40, 0]])
+        self.assertEqual(results["recall"], 1.0)
+        self.assertTrue(results["index_time"] >= 0)
+        self.assertTrue(results["exact_time"] >= 0)
+        
+    def test_metric(self):
+        training_set = DataSet([[2, 0], [1.5, 1.5], [0, 5]], 
+                               labels=["a", "b", "c"])
+        sample = [0, 0]
+        # Nearest is "b" by Chebyshev distance, "a" by Manhattan distance
+        self.assertEqual(Knn(training_set, k=1, metric="chebyshev").classify(
+                                                            sample), "b")
+        self.assertEqual(Knn(training_set, k=1, metric="manhattan").classify(
+                                                            sample), "a")
+        
+    def test_metric_callable(self):
+        def first_feature_only(vector1, vector2):
+            return abs(vector1[0] - vector2[0])
+        
+        training_set = DataSet([[0, 0], [3, 3], [0, 5]], 
+                               labels=["a", "b", "c"])
+        classifier = Knn(training_set, k=1, metric=first_feature_only)
+        self.assertEqual(classifier.classify([2.6, 0]), "b")
+        
+    def test_mahalanobis_estimates_inverse_covariance(self):
+        training_set = DataSet([[1, 2], [2, 1], [3, 5], [4, 3]], 
+                               labels=["a", "a", "b", "b"])
+        classifier = Knn(training_set, k=1, metric="mahalanobis", 
+                         index="ball_tree")
+        self.assertTrue("VI" in classifier.metric_params)
+        self.assertEqual(classifier.classify([4, 4]), "b")
+        
+    def test_mahalanobis_constant_feature(self):
+        training_set = DataSet([[1, 7, 2], [2, 7, 1], [3, 7, 5], [4, 7, 3]], 
+                               labels=["a", "a", "b", "b"])
+        for index in ["brute", "ball_tree"]:
+            classifier = Knn(training_set, k=1, metric="mahalanobis", 
+                             index=index)
+            self.assertEqual(classifier.classify([4, 7, 4]), "b")
+            self.assertEqual(classifier.classify([1, 7, 1]), "a")
+        
+    def test_save_and_load(self):
+        training_set = DataSet(pd.DataFrame([[1, 0.5], [1, 2], [1, 3], 
+                                             [2, 0.5], [2, 2.5], [2, 3], 
+                                             [2.5, 1.5], [3, 1]], 
+                                            columns=["x", "y"]), 
+                               labels=["a", "a", "a", "a", "b", "a", "c", "a"])
+        classifier = Knn(training_set, k=3, index="kd_tree")
+        dataset = DataSet(pd.DataFrame([[2, 1.5], [2.4, 2.6], [2.6, 1.4]], 
+                                       columns=["x", "y"]))
+        expected = classifier.classify_all(dataset).get_classifications()
+        
+        path = tempfile.mkdtemp()
+        try:
+            classifier.save(path)
+            for mmap in [True, False]:
+                loaded = Knn.load(path, mmap=mmap)
+                self.assertEqual(loaded.k, 3)
+                self.assertEqual(isinstance(loaded._buffer, 
+                                            np.memmap), mmap)
+                classes = loaded.classify_all(dataset).get_classifications()
+                assert_that(classes, contains(*expected))
+                self.assertEqual(loaded.training_set.feature_list(), 
+                                 ["x", "y"])
+        finally:
+            shutil.rmtree(path)
+        
+    def test_add_samples(self):
+        training_set = labelled_dataset([[1, 1], [1, 2], [5, 5]], 
+                                        ["a", "a", "b"], ["s1", "s2", "s3"])
+        classifier = Knn(training_set, k=1)
+        self.assertEqual(classifier.classify([6, 6]), "b")
+        
+        classifier.add_samples(labelled_dataset([[6, 7]], ["c"], ["s4"]))
+        self.assertEqual(classifier.classify([6, 6]), "c")
+        self.assertEqual(classifier.training_set.get_sample_ids(), 
+                         ["s1", "s2", "s3", "s4"])
+        
+    def test_add_samples_grows_geometrically(self):
+        training_set = DataSet([[0, 0]], labels=["a"])
+        classifier = Knn(training_set, k=1)
+        capacities = set()
+        for i in range(1, 100):
+            classifier.add_samples(labelled_dataset([[i, i]], [str(i)], [i]))
+            capacities.add(classifier._buffer.shape[0])
+        
+        self.assertTrue(len(capacities) <= 8)
+        self.assertEqual(classifier.classify([42.2, 42.2]), "42")
+        
+    def test_add_samples_unlabelled(self):
+        classifier = Knn(DataSet([[1, 2], [3, 4]], labels=["a", "b"]))
+        self.assertRaises(UnlabelledDataSetError, classifier.add_samples, 
+                          [[5, 6]])
+        
+    def test_add_samples_inconsistent_features(self):
+        classifier = Knn(DataSet([[1, 2], [3, 4]], labels=["a", "b"]))
+        self.assertRaises(InconsistentFeaturesError, classifier.add_samples, 
+                          DataSet([[5, 6, 7]], labels=["a"]))
+        
+    def test_remove_samples(self):
+        training_set = labelled_dataset([[1, 1], [1, 2], [5, 5], [6, 6]], 
+                                        ["a", "a", "b", "b"], 
+                                        ["s1", "s2", "s3", "s4"])
+        classifier = Knn(training_set, k=1)
+        classifier.remove_samples(["s3", "s4"])
+        
+        self.assertEqual(classifier.classify([6, 6]), "a")
+        self.assertEqual(classifier.training_set.get_sample_ids(), 
+                         ["s1", "s2"])
+        
+    def test_remove_unknown_samples(self):
+        classifier = Knn(DataSet([[1, 2], [3, 4]], labels=["a", "b"]))
+        self.assertRaises(KeyError, classifier.remove_samples, ["foo"])
+        
+    def test_remove_every_sample(self):
+        classifier = Knn(labelled_dataset([[1, 2], [3, 4]], ["a", "b"], 
+                                          ["s1", "s2"]))
+        self.assertRaises(ValueError, classifier.remove_samples, 
+                          ["s1", "s2"])
+        
+    def test_incremental_changes_match_rebuilt_classifier(self):
+        random = np.random.RandomState(0)
+        data = pd.DataFrame(random.rand(300, 3), columns=["x", "y", "z"])
+        labels = pd.Series(random.randint(0, 3, 300).astype(str))
+        queries = DataSet(pd.DataFrame(random.rand(50, 3), 
+                                       columns=["x", "y", "z"]))
+        
+        for index in ["brute", "kd_tree", "ball_tree"]:
+            classifier = Knn(DataSet(data[:200], labels=labels[:200]), k=3, 
+                             index=index)
+            # Few enough changes at a time that the index isn't rebuilt.
+            for start in range(200, 300, 20):
+                classifier.add_samples(
+                        DataSet(data[start:start + 20], 
+                                labels=labels[start:start + 20]))
+                classifier.remove_samples(list(range(start - 200, 
+                                                     start - 190)))
+            
+            expected = Knn(classifier.training_set, k=3).classify_all(
+                                            queries).get_classifications()
+            classes = classifier.classify_all(queries).get_classifications()
+            assert_that(classes, contains(*expected))
+        
+    def test_distance_weights(self):
+        training_set = DataSet([[0], [3], [3.5]], labels=["a", "b", "b"])
+        self.assertEqual(Knn(training_set, k=3).classify([1]), "b")
+        self.assertEqual(Knn(training_set, k=3, 
+                             weights="distance").classify([1]), "a")
+        
+    def test_distance_weights_exact_match(self):
+        training_set = DataSet([[0], [0.1], [0.2], [1]], 
+                               labels=["a", "b", "b", "a"])
+        classifier = Knn(training_set, k=3, weights="distance")
+        self.assertEqual(classifier.classify([1]), "a")
+        
+    def test_unknown_weights(self):
+        training_set = DataSet([[1, 2], [3, 4]], labels=["a", "b"])
+        self.assertRaises(ValueError, Knn, training_set, weights="foo")
+        
+    def test_radius_neighbours(self):
+        training_set = labelled_dataset([[0, 0], [1, 0], [0, 3], [5, 5]], 
+                                        ["a", "a", "b", "b"], 
+                                        ["s1", "s2", "s3", "s4"])
+        classifier = Knn(training_set, index="kd_tree")
+        neighbours = classifier.radius_neighbours([[0, 0.5], [10, 10]], 3)
+        
+        self.assertEqual(len(neighbours), 2)
+        assert_that(neighbours[0].index.tolist(), contains("s1", "s2", "s3"))
+        self.assertAlmostEqual(neighbours[0]["s3"], 2.5)
+        self.assertEqual(len(neighbours[1]), 0)
+        
+    def test_radius_neighbours_after_changes(self):
+        training_set = labelled_dataset([[0, 0], [1, 0], [0, 3]], 
+                                        ["a", "a", "b"], ["s1", "s2", "s3"])
+        classifier = Knn(training_set, index="ball_tree")
+        classifier.REBUILD_FRACTION = 10
+        classifier.add_samples(labelled_dataset([[0, 1]], ["b"], ["s4"]))
+        classifier.remove_samples(["s1"])
+        
+        neighbours = classifier.radius_neighbours([[0, 0]], 1.5)
+        assert_that(neighbours[0].index.tolist(), contains("s2", "s4"))
+        
+    def test_radius_neighbours_requires_radius(self):
+        classifier = Knn(DataSet([[1, 2], [3, 4]], labels=["a", "b"]))
+        self.assertRaises(ValueError, classifier.radius_neighbours, [[1, 2]])
+        
+    def test_classify_with_radius(self):
+        training_set = DataSet([[0], [1], [1.5], [2], [10]], 
+                               labels=["a", "b", "b", "b", "c"])
+        classifier = Knn(training_set, k=1, radius=2)
+        classes = classifier.classify_all(DataSet([[0.1], [8]]))
+        assert_that(classes.get_classifications(), contains("b", "c"))
+        
+    def test_accuracy_by_k_distance_weights(self):
+        training_set = DataSet([[1, 0.5], [1, 2], [1, 3], [2, 0.5], [2, 2.5], 
+                                [2, 3], [2.5, 1.5], [3, 1]], 
+                               labels=["a", "a", "a", "a", "b", "a", "c", "a"])
+        dataset = DataSet([[2, 1.5], [2.4, 2.6], [2.6, 1.4], [2, 3]], 
+                          labels=["a", "b", "c", "b"])
+        accuracies = Knn(training_set, weights="distance").accuracy_by_k(
+                                                                dataset, 8)
+        for k in range(1, 9):
+            expected = Knn(training_set, k=k, weights="distance").classify_all(
+                                            dataset).compute_accuracy()
+            self.assertAlmostEqual(accuracies[k], expected)
+        
+    def test_unknown_index(self):
+        training_set = DataSet([[1, 2], [3, 4]], labels=["a", "b"])
+        self.assertRaises(ValueError, Knn, training_set, index="foo")
+        
+    def test_accuracy_by_k(self):
+        training_set = DataSet([[1, 0.5], [1, 2], [1, 3], [2, 0.5], [2, 2.5], 
+                                [2, 3], [2.5, 1.5], [3, 1]], 
+                               labels=["a", "a", "a", "a", "b", "a", "c", "a"])
+        dataset = DataSet([[2, 1.5], [2.4, 2.6], [2.6, 1.4], [0, 0]], 
+                          labels=["a", "b", "c", "a"])
+        accuracies = Knn(training_set).accuracy_by_k(dataset, 10)
+        
+        self.assertEqual(accuracies.index.tolist(), list(range(1, 11)))
+        for k in range(1, 11):
+            expected = Knn(training_set, k=k).classify_all(
+                                            dataset).compute_accuracy()
+            self.assertAlmostEqual(accuracies[k], expected)
+        
+    def test_accuracy_by_k_unlabelled(self):
+        training_set = DataSet([[1, 2], [3, 4]], labels=["a", "b"])
+        classifier = Knn(training_set)
+        self.assertRaises(UnlabelledDataSetError, classifier.accuracy_by_k, 
+                          [[1, 2]], 3)
+        
     def test_create_knn_unlabelled_raises_exception(self):
         training_set = DataSet([[1, 2], [3, 4]])
         self.assertRaises(UnlabelledDataSetError, Knn, training_set)
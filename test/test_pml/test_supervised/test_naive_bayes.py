@@ -25,13 +25,17 @@ Unit tests for naive_bayes module.
 
 import unittest
 
+import numpy as np
 import pandas as pd
 from hamcrest import assert_that
 
 from pml.data import loader
 from pml.data.model import DataSet
 from pml.supervised.naive_bayes import NaiveBayes
+from pml.supervised.naive_bayes import GaussianNaiveBayes
+from pml.supervised.naive_bayes import MultinomialNaiveBayes
 from pml.utils.errors import InconsistentFeaturesError
+from pml.utils.errors import UnlabelledDataSetError
 
 from test import base_tests
 from test.matchers.pandas_matchers import equals_series
@@ -64,6 +68,15 @@ class NaiveBayesTest(base_tests.BaseFileLoadingTest):
                                                          sample["color"])
         self.assertAlmostEqual(prob, 0.57, places=2)
         
+    def test_count_examples_unseen_value(self):
+        training_set, __ = self.load_car_data()
+        classifier = NaiveBayes(training_set)
+        self.assertEqual(classifier._count_examples("yes", "color", "blue"), 
+                         0)
+        prob = classifier._calc_prob_feature_given_class("yes", "color", 
+                                                         "blue")
+        self.assertAlmostEqual(prob, 1.0 / 7, places=3)
+        
     def test_calc_prob_class(self):
         training_set = DataSet([[1, 2], [3, 4], [5, 6], [7, 8]],
                                     labels=["cat", "dog", "cat", "cat"])
@@ -93,6 +106,141 @@ class NaiveBayesTest(base_tests.BaseFileLoadingTest):
         assert_that(results.get_classifications(), equals_series({0: "no", 1: "no"}))
         self.assertEqual(results.compute_accuracy(), 0.5)
     
+    def test_get_log_posteriors(self):
+        training_set, sample = self.load_car_data()
+        classifier = NaiveBayes(training_set)
+        log_posteriors = classifier.get_log_posteriors(
+                                            DataSet(pd.DataFrame([sample])))
+        
+        self.assertEqual(log_posteriors.shape, (1, 2))
+        self.assertAlmostEqual(np.exp(log_posteriors["yes"][0]), 
+                               0.035 / (0.035 + 0.070), places=2)
+        self.assertAlmostEqual(np.exp(log_posteriors.values).sum(), 1)
+        
+    def test_get_log_posteriors_many_features(self):
+        num_features = 2000
+        training_set = DataSet([[0] * num_features, [1] * num_features], 
+                               labels=["a", "b"])
+        classifier = NaiveBayes(training_set)
+        
+        log_posteriors = classifier.get_log_posteriors(
+                                            [[0] * num_features, 
+                                             [0] * 1000 + [1] * 1000])
+        self.assertTrue(np.isfinite(log_posteriors.values).all())
+        self.assertAlmostEqual(np.exp(log_posteriors["a"][0]), 1)
+        self.assertAlmostEqual(log_posteriors["a"][1], 
+                               log_posteriors["b"][1])
+        
+    def test_classify_all_with_log_posteriors(self):
+        training_set, sample_0 = self.load_car_data()
+        sample_1 = {"color": "yellow", "type": "sports", "origin": "domestic"}
+        dataset = DataSet(pd.DataFrame([sample_0, sample_1]), 
+                          labels=["no", "yes"])
+        classifier = NaiveBayes(training_set)
+        results, log_posteriors = \
+                classifier.classify_all_with_log_posteriors(dataset)
+        
+        assert_that(results.get_classifications(), 
+                    equals_series({0: "no", 1: "no"}))
+        self.assertEqual(log_posteriors.shape, (2, 2))
+    
+    def test_partial_fit_matches_training_at_once(self):
+        training_set, sample = self.load_car_data()
+        first_half, second_half = training_set.split(0.5)
+        
+        classifier = NaiveBayes(first_half)
+        classifier.partial_fit(second_half)
+        probabilities = classifier.get_classification_probabilities(sample)
+        self.assertAlmostEqual(probabilities["yes"], 0.035, places=3)
+        self.assertAlmostEqual(probabilities["no"], 0.070, places=3)
+        
+    def test_partial_fit_new_values_and_classes(self):
+        classifier = NaiveBayes(DataSet([["red"], ["blue"]], 
+                                        labels=["a", "b"]))
+        classifier.partial_fit(DataSet([["green"], ["green"]], 
+                                       labels=["c", "a"]))
+        
+        self.assertEqual(classifier._count_examples("c", 0, "green"), 1)
+        # m = 3 values seen, so p = 1/3
+        prob = classifier._calc_prob_feature_given_class("a", 0, "red")
+        self.assertAlmostEqual(prob, (1 + 1.0) / (2 + 3))
+        prob = classifier._calc_prob_feature_given_class("b", 0, "green")
+        self.assertAlmostEqual(prob, (0 + 1.0) / (1 + 3))
+        self.assertEqual(classifier.classify({0: "blue"}), "b")
+        
+    def test_feature_with_no_training_values(self):
+        nan = float("nan")
+        dataset = DataSet([["red", nan], ["blue", nan], ["red", nan]], 
+                          labels=["a", "b", "a"])
+        classifier = NaiveBayes(dataset)
+        
+        prob = classifier._calc_prob_feature_given_class("a", 1, "x")
+        self.assertEqual(prob, 1.0)
+        self.assertEqual(classifier.classify({0: "red", 1: "x"}), "a")
+        results = classifier.classify_all(
+                                DataSet([["red", "x"], ["blue", "y"]]))
+        assert_that(results.get_classifications(), 
+                    equals_series({0: "a", 1: "b"}))
+        
+    def test_partial_fit_unlabelled(self):
+        training_set, __ = self.load_car_data()
+        classifier = NaiveBayes(training_set)
+        self.assertRaises(UnlabelledDataSetError, classifier.partial_fit, 
+                          DataSet(training_set.get_data_frame()))
+        
+    def test_fit_stream(self):
+        path = self.relative_to_base("datasets/car_thefts.data")
+        classifier = NaiveBayes.fit_stream(loader.load_chunks(path, 3))
+        
+        __, sample = self.load_car_data()
+        probabilities = classifier.get_classification_probabilities(sample)
+        self.assertAlmostEqual(probabilities["yes"], 0.035, places=3)
+        self.assertAlmostEqual(probabilities["no"], 0.070, places=3)
+        
+    def test_fit_stream_empty(self):
+        self.assertRaises(ValueError, NaiveBayes.fit_stream, [])
+        
+    def test_hashed_features_without_collisions(self):
+        training_set, sample = self.load_car_data()
+        classifier = NaiveBayes(training_set, num_buckets=1000)
+        self.assertEqual(classifier._counts["color"].shape, (1001, 2))
+        self.assertEqual(classifier._count_feature_values("color"), 2)
+        
+        probabilities = classifier.get_classification_probabilities(sample)
+        self.assertAlmostEqual(probabilities["yes"], 0.035, places=3)
+        self.assertAlmostEqual(probabilities["no"], 0.070, places=3)
+        
+    def test_hashed_features_bounded_size(self):
+        values = [["value%d" % i] for i in range(500)]
+        labels = ["a", "b"] * 250
+        classifier = NaiveBayes(DataSet(values, labels=labels), 
+                                num_buckets=16)
+        self.assertEqual(classifier._counts[0].shape, (17, 2))
+        self.assertEqual(classifier._count_feature_values(0), 16)
+        self.assertEqual(classifier._counts[0].sum(), 500)
+        
+        results = classifier.classify_all(DataSet(values + [[None]]))
+        self.assertEqual(len(results.get_classifications()), 501)
+        
+    def test_hashed_features_int_and_float_values(self):
+        training_set = DataSet([[1, 2], [1, 3], [2, 3], [2, 3]], 
+                               labels=["a", "a", "b", "b"])
+        hashed = NaiveBayes(training_set, num_buckets=64)
+        unhashed = NaiveBayes(training_set)
+        
+        # A missing value makes the query columns floats.
+        queries = DataSet(pd.DataFrame([[1.0, 2.0], [2.0, np.nan]]))
+        for classifier in [hashed, unhashed]:
+            results = classifier.classify_all(queries)
+            assert_that(results.get_classifications(), 
+                        equals_series({0: "a", 1: "b"}))
+        
+        for query in [[1, 2], [1.0, 2.0], [2, 3], [2.0, 3.0]]:
+            expected = unhashed.get_classification_probabilities(query)
+            probabilities = hashed.get_classification_probabilities(query)
+            self.assertAlmostEqual(probabilities["a"], expected["a"])
+            self.assertAlmostEqual(probabilities["b"], expected["b"])
+        
     def test_classify_inconsistent_features(self):
         training_set, __ = self.load_car_data()
         sample = {"color": "yellow", "type": "sports", "year": 2012}
@@ -100,6 +248,110 @@ class NaiveBayesTest(base_tests.BaseFileLoadingTest):
         self.assertRaises(InconsistentFeaturesError, classifier.classify, sample)
     
 
+class GaussianNaiveBayesTest(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.data = np.vstack((random_state.normal(0, 1, size=(50, 3)), 
+                               random_state.normal(3, 2, size=(50, 3))))
+        self.labels = ["a"] * 50 + ["b"] * 50
+        self.training_set = DataSet(pd.DataFrame(self.data), 
+                                    labels=self.labels)
+
+    def test_means_and_variances(self):
+        classifier = GaussianNaiveBayes(self.training_set)
+        np.testing.assert_allclose(classifier.get_means().values, 
+                                   [self.data[:50].mean(axis=0), 
+                                    self.data[50:].mean(axis=0)])
+        np.testing.assert_allclose(classifier.get_variances().values, 
+                                   [self.data[:50].var(axis=0), 
+                                    self.data[50:].var(axis=0)])
+
+    def test_classify(self):
+        classifier = GaussianNaiveBayes(self.training_set)
+        self.assertEqual(classifier.classify([0.1, -0.2, 0.3]), "a")
+        self.assertEqual(classifier.classify([3.5, 2, 4]), "b")
+        results = classifier.classify_all(self.training_set)
+        self.assertTrue(results.compute_accuracy() > 0.9)
+
+    def test_fit_stream_matches_training_at_once(self):
+        classifier = GaussianNaiveBayes(self.training_set)
+        # Chunks which start with only one class present
+        chunks = []
+        for start, end in [(0, 30), (30, 70), (70, 100)]:
+            rows = list(range(start, end))
+            chunks.append(DataSet(pd.DataFrame(self.data[start:end], 
+                                               index=rows), 
+                                  labels=pd.Series(self.labels[start:end], 
+                                                   index=rows)))
+        streamed = GaussianNaiveBayes.fit_stream(chunks)
+        
+        np.testing.assert_allclose(streamed.get_means().values, 
+                                   classifier.get_means().values)
+        np.testing.assert_allclose(streamed.get_variances().values, 
+                                   classifier.get_variances().values)
+
+    def test_constant_feature(self):
+        training_set = DataSet([[1, 0], [1, 1], [1, 5], [1, 6]], 
+                               labels=["a", "a", "b", "b"])
+        classifier = GaussianNaiveBayes(training_set)
+        self.assertEqual(classifier.classify([1, 5.5]), "b")
+
+    def test_non_finite_values(self):
+        training_set = DataSet([[1, 0], [1, 1], [1, 5], [1, 6]], 
+                               labels=["a", "a", "b", "b"])
+        classifier = GaussianNaiveBayes(training_set)
+        means = classifier.get_means().values
+        for value in [np.nan, np.inf]:
+            self.assertRaises(ValueError, classifier.partial_fit, 
+                              DataSet([[value, 2]], labels=["a"]))
+        np.testing.assert_array_equal(classifier.get_means().values, means)
+        self.assertRaises(ValueError, GaussianNaiveBayes, 
+                          DataSet([[np.nan, 1]], labels=["a"]))
+
+
+class MultinomialNaiveBayesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.training_set = DataSet([[5, 1, 0], [4, 0, 1], [0, 1, 6], 
+                                     [1, 0, 4]], 
+                                    labels=["x", "x", "z", "z"])
+
+    def test_classify(self):
+        classifier = MultinomialNaiveBayes(self.training_set)
+        self.assertEqual(classifier.classify([3, 0, 1]), "x")
+        self.assertEqual(classifier.classify([0, 2, 2]), "z")
+
+    def test_log_posteriors(self):
+        classifier = MultinomialNaiveBayes(self.training_set)
+        # Feature totals with alpha = 1: x = [10, 2, 2], z = [2, 2, 11]
+        log_posteriors = classifier.get_log_posteriors([[1, 0, 0]])
+        expected = (10.0 / 14) / (10.0 / 14 + 2.0 / 15)
+        self.assertAlmostEqual(np.exp(log_posteriors["x"][0]), expected)
+
+    def test_partial_fit(self):
+        classifier = MultinomialNaiveBayes(self.training_set)
+        classifier.partial_fit(DataSet([[0, 9, 0]], labels=["y"]))
+        self.assertEqual(classifier.classify([0, 3, 0]), "y")
+
+    def test_negative_values(self):
+        training_set = DataSet([[1, -1]], labels=["x"])
+        self.assertRaises(ValueError, MultinomialNaiveBayes, training_set)
+
+    def test_rejected_partial_fit_leaves_classifier_unchanged(self):
+        classifier = MultinomialNaiveBayes(self.training_set)
+        samples = [[3, 0, 1], [0, 2, 2], [1, 1, 1]]
+        before = classifier.get_log_posteriors(samples)
+        self.assertRaises(ValueError, classifier.partial_fit, 
+                          DataSet([[0, -1, 0]], labels=["c"]))
+        
+        after = classifier.get_log_posteriors(samples)
+        self.assertEqual(list(after.columns), list(before.columns))
+        np.testing.assert_array_equal(after.values, before.values)
+        self.assertEqual(classifier.classify([3, 0, 1]), "x")
+        self.assertEqual(classifier.classify([0, 2, 2]), "z")
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Unit tests for the prototype_reduction module.
+
+@author: drusk
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from hamcrest import assert_that, contains
+
+from pml.data.model import DataSet
+from pml.supervised import prototype_reduction
+from pml.supervised.knn import Knn
+from pml.utils.errors import UnlabelledDataSetError
+
+class PrototypeReductionTest(unittest.TestCase):
+
+    def setUp(self):
+        # Two well separated classes on a grid, plus one "b" sample in the 
+        # middle of the "a" samples.
+        points = [[x, y] for x in range(5) for y in range(5)]
+        labels = ["a"] * 25
+        points += [[x + 10, y] for x in range(5) for y in range(5)]
+        labels += ["b"] * 25
+        points.append([2.1, 2.1])
+        labels.append("b")
+        self.dataset = DataSet(points, labels=labels)
+        
+    def test_edited_nearest_neighbours_removes_noise(self):
+        edited = prototype_reduction.edited_nearest_neighbours(self.dataset, 
+                                                               k=3)
+        self.assertEqual(edited.num_samples(), 50)
+        self.assertFalse(50 in edited.get_sample_ids())
+        
+    def test_edited_nearest_neighbours_keeps_ties(self):
+        dataset = DataSet([[0], [1], [2], [3]], labels=["a", "b", "a", "b"])
+        edited = prototype_reduction.edited_nearest_neighbours(dataset, k=2)
+        assert_that(edited.get_sample_ids(), contains(0, 3))
+        
+    def test_condensed_nearest_neighbours_is_consistent(self):
+        condensed = prototype_reduction.condensed_nearest_neighbours(
+                                            self.dataset, random_state=0)
+        self.assertTrue(condensed.num_samples() < 10)
+        
+        classifier = Knn(condensed, k=1)
+        classes = classifier.classify_all(self.dataset)
+        self.assertEqual(classes.compute_accuracy(), 1.0)
+        
+    def test_reduce_prototypes(self):
+        prototypes = prototype_reduction.reduce_prototypes(self.dataset, 
+                                                           random_state=0)
+        assert_that(sorted(set(prototypes.get_labels())), contains("a", "b"))
+        self.assertFalse(50 in prototypes.get_sample_ids())
+        self.assertTrue(prototypes.num_samples() <= 4)
+        
+    def test_unlabelled(self):
+        self.assertRaises(UnlabelledDataSetError, 
+                          prototype_reduction.condensed_nearest_neighbours, 
+                          DataSet([[1, 2], [3, 4]]))
+        
+    def test_knn_condense(self):
+        classifier = Knn(self.dataset, k=3)
+        condensed, report = classifier.condense(random_state=0)
+        
+        self.assertEqual(report["num_samples"], 51)
+        self.assertEqual(report["num_prototypes"], 
+                         condensed.training_set.num_samples())
+        self.assertEqual(condensed.k, 1)
+        
+        dataset = DataSet(pd.DataFrame([[1, 1], [12, 3]]), 
+                          labels=["a", "b"])
+        _, report = classifier.condense(validation_set=dataset, 
+                                        random_state=0)
+        self.assertEqual(report["accuracy"], 1.0)
+        self.assertEqual(report["condensed_accuracy"], 1.0)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,101 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Unit tests for the decision tree pruning module.
+
+@author: drusk
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from hamcrest import assert_that
+
+from pml.data.loader import load
+from pml.data.model import DataSet
+from pml.supervised.decision_trees import DecisionTree, pruning
+from pml.supervised.decision_trees import cart
+
+from test import base_tests
+from test.matchers.pandas_matchers import equals_series
+
+class PruningTest(base_tests.BaseFileLoadingTest):
+
+    def setUp(self):
+        # Fully grown: x <= 2.5 is "n", then x <= 5.5 is "y", otherwise "n".
+        self.training_set = DataSet(
+                pd.DataFrame({"x": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]}), 
+                labels=["n", "n", "y", "y", "y", "n"])
+        self.validation_set = DataSet(
+                pd.DataFrame({"x": [1.0, 2.0, 3.0, 6.0]}), 
+                labels=["n", "n", "y", "y"])
+
+    def assert_pruned(self, classifier):
+        self.assertEqual(classifier._tree.get_num_leaves(), 2)
+        samples = DataSet(pd.DataFrame({"x": [1.5, 4.0, 6.0]}))
+        assert_that(classifier.classify_all(samples).get_classifications(), 
+                    equals_series({0: "n", 1: "y", 2: "y"}))
+
+    def test_reduced_error_prune(self):
+        classifier = DecisionTree(self.training_set, algorithm="cart")
+        self.assertEqual(classifier._tree.get_num_leaves(), 3)
+        classifier.prune(self.validation_set)
+        self.assert_pruned(classifier)
+
+    def test_cost_complexity_prune(self):
+        classifier = DecisionTree(self.training_set, algorithm="cart")
+        classifier.prune(self.validation_set, method="cost_complexity")
+        self.assert_pruned(classifier)
+
+    def test_prune_copies_tree(self):
+        tree = cart.build_tree(self.training_set)
+        pruned = pruning.reduced_error_prune(tree, self.training_set, 
+                                             self.validation_set, "n")
+        self.assertEqual(pruned.get_num_leaves(), 2)
+        self.assertEqual(tree.get_num_leaves(), 3)
+
+    def test_prune_missing_values(self):
+        # The sample missing x stops at the root and gets the default label.
+        validation_set = DataSet(
+                pd.DataFrame({"x": [1.0, 3.0, 6.0, np.nan]}), 
+                labels=["n", "y", "y", "n"])
+        tree = cart.build_tree(self.training_set)
+        pruned = pruning.cost_complexity_prune(tree, self.training_set, 
+                                               validation_set, "n")
+        self.assertEqual(pruned.get_num_leaves(), 2)
+
+    def test_prune_with_training_set_keeps_tree(self):
+        dataset = load(self.relative_to_base("/datasets/play_tennis.data"),
+                       delimiter=" ")
+        classifier = DecisionTree(dataset)
+        num_leaves = classifier._tree.get_num_leaves()
+        classifier.prune(dataset)
+        self.assertEqual(classifier._tree.get_num_leaves(), num_leaves)
+
+    def test_unknown_method(self):
+        classifier = DecisionTree(self.training_set, algorithm="cart")
+        self.assertRaises(ValueError, classifier.prune, self.validation_set, 
+                          method="pessimistic")
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
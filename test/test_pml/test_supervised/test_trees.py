@@ -23,11 +23,53 @@ Unit tests for trees module.
 @author: drusk
 """
 
+import pickle
+import sys
 import unittest
 
 from hamcrest import assert_that, contains_inanyorder
 
-from pml.supervised.decision_trees.trees import Tree, Node
+from pml.supervised.decision_trees.trees import Tree, Node, ThresholdNode
+
+class DictNode(object):
+    """
+    A node laid out the way Node was before it used __slots__ and coded 
+    branches, for comparing their memory usage.
+    """
+    
+    def __init__(self, value, threshold=None):
+        self._value = value
+        self._children = {}
+        if threshold is not None:
+            self._threshold = float(threshold)
+            self._left_branch = "<= %g" % threshold
+            self._right_branch = "> %g" % threshold
+    
+    def add_child(self, branch, child):
+        self._children[branch] = child
+
+
+def measure_dict_nodes(root):
+    """
+    Returns:
+      The number of bytes used by a tree of DictNodes, counting objects 
+      shared by several nodes once.
+    """
+    seen = set()
+    num_bytes = 0
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node._children.values())
+        for obj in ([node, node.__dict__, node._children] + 
+                    list(node._children.keys()) + 
+                    [value for value in node.__dict__.values() 
+                     if value is not node._children]):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                num_bytes += sys.getsizeof(obj)
+    return num_bytes
+
 
 class TreesTest(unittest.TestCase):
 
@@ -104,6 +146,167 @@ class TreesTest(unittest.TestCase):
         tree, _ = self.create_tree()
         self.assertEqual(tree.get_depth(), 3)
 
+    def test_get_num_nodes(self):
+        tree, _ = self.create_tree()
+        self.assertEqual(tree.get_num_nodes(), 8)
+
+    def create_deep_tree(self, depth):
+        """
+        Creates a tree of threshold nodes with the given number of levels, 
+        where every right branch leads one level further down.
+        """
+        root_node = node = ThresholdNode("x", 1)
+        for i in range(2, depth):
+            node.add_child(node.get_left_branch(), Node("small"))
+            child_node = ThresholdNode("x", i)
+            node.add_child(node.get_right_branch(), child_node)
+            node = child_node
+        node.add_child(node.get_left_branch(), Node("small"))
+        node.add_child(node.get_right_branch(), Node("big"))
+        return Tree(root_node)
+
+    def test_deeper_than_recursion_limit(self):
+        depth = sys.getrecursionlimit() + 100
+        tree = self.create_deep_tree(depth)
+        root_node = tree.get_root_node()
+        
+        self.assertEqual(tree.get_depth(), depth)
+        self.assertEqual(tree.get_num_leaves(), depth)
+        self.assertEqual(tree.get_num_nodes(), 2 * depth - 1)
+        self.assertEqual(root_node.get_height(), depth - 1)
+        self.assertEqual(len(root_node.get_all_descendants()), 2 * depth - 2)
+        text = repr(tree)
+        self.assertEqual(text.count("'small'"), depth - 1)
+        self.assertEqual(text.count("'big'"), 1)
+
+    def test_pickle_deeper_than_recursion_limit(self):
+        depth = sys.getrecursionlimit() + 100
+        tree = self.create_deep_tree(depth)
+        unpickled = pickle.loads(pickle.dumps(tree))
+        
+        self.assertEqual(unpickled.get_depth(), depth)
+        self.assertEqual(unpickled.get_root_node().get_threshold(), 1)
+        self.assert_same_tree(unpickled, tree)
+
+    def assert_same_tree(self, tree, expected):
+        """
+        Compares two trees node by node, regardless of the order of each 
+        node's branches.
+        """
+        pairs = [(tree.get_root_node(), expected.get_root_node())]
+        while pairs:
+            node, expected_node = pairs.pop()
+            self.assertEqual(type(node), type(expected_node))
+            self.assertEqual(node.get_value(), expected_node.get_value())
+            branches = sorted(node.get_branches())
+            self.assertListEqual(branches, 
+                                 sorted(expected_node.get_branches()))
+            pairs.extend((node.get_child(branch), 
+                          expected_node.get_child(branch)) 
+                         for branch in branches)
+
+    def test_repr(self):
+        node = ThresholdNode("x", 2.5)
+        node.add_child(node.get_left_branch(), Node("small"))
+        node.add_child(node.get_right_branch(), Node("big"))
+        self.assertIn(repr(Tree(node)), 
+                      ["{ 'x': {'<= 2.5': 'small', '> 2.5': 'big'} }", 
+                       "{ 'x': {'> 2.5': 'big', '<= 2.5': 'small'} }"])
+
+    def test_nodes_have_slots(self):
+        self.assertFalse(hasattr(Node("a"), "__dict__"))
+        self.assertFalse(hasattr(ThresholdNode("x", 1.0), "__dict__"))
+
+    def test_codebook_shared(self):
+        tree, _ = self.create_tree()
+        
+        # Each distinct branch is coded once, even though the subtrees were 
+        # built before being attached to the root.
+        self.assertEqual(len(tree.get_codebook()), 7)
+        humidity_node = tree.get_root_node().get_child("Sunny")
+        self.assertEqual(humidity_node.get_child("High").get_value(), "No")
+
+    def test_get_child_unknown_branch(self):
+        tree, _ = self.create_tree()
+        self.assertRaises(KeyError, tree.get_root_node().get_child, "Snow")
+        self.assertRaises(KeyError, Node("a").get_child, "b")
+
+    def test_add_child_replaces_branch(self):
+        node = Node("a")
+        node.add_child("b", Node("c"))
+        node.add_child("b", Node("d"))
+        self.assertListEqual(node.get_branches(), ["b"])
+        self.assertEqual(node.get_child("b").get_value(), "d")
+
+    def test_threshold_branches_not_in_codebook(self):
+        tree = self.create_deep_tree(10)
+        self.assertEqual(len(tree.get_codebook()), 0)
+        self.assertListEqual(tree.get_root_node().get_branches(), 
+                             ["<= 1", "> 1"])
+
+    def test_threshold_node_add_child_unknown_branch(self):
+        node = ThresholdNode("x", 2.5)
+        self.assertRaises(ValueError, node.add_child, "<= 3", Node("a"))
+
+    def test_get_memory_usage(self):
+        tree = self.create_deep_tree(100)
+        bytes_per_node = tree.get_memory_usage() / float(tree.get_num_nodes())
+        self.assertTrue(0 < bytes_per_node < 200)
+
+    def test_memory_usage_before_and_after(self):
+        # The same trees stored the way nodes were before being compacted.
+        depth = 200
+        dict_root = dict_node = DictNode("x", threshold=1)
+        for i in range(2, depth):
+            dict_node.add_child("<= %g" % (i - 1), DictNode("small"))
+            child_node = DictNode("x", threshold=i)
+            dict_node.add_child("> %g" % (i - 1), child_node)
+            dict_node = child_node
+        dict_node.add_child("<= %g" % (depth - 1), DictNode("small"))
+        dict_node.add_child("> %g" % (depth - 1), DictNode("big"))
+        tree = self.create_deep_tree(depth)
+        
+        before = measure_dict_nodes(dict_root) / float(2 * depth - 1)
+        after = tree.get_memory_usage() / float(tree.get_num_nodes())
+        self.assertTrue(after < before / 2, 
+                        "%.1f bytes per node before, %.1f after" % (before, 
+                                                                    after))
+        
+        dict_root = DictNode("feature")
+        root_node = Node("feature")
+        for i in range(1000):
+            dict_root.add_child("value %d" % i, DictNode("label"))
+            root_node.add_child("value %d" % i, Node("label"))
+        tree = Tree(root_node)
+        
+        before = measure_dict_nodes(dict_root) / 1001.0
+        after = tree.get_memory_usage() / float(tree.get_num_nodes())
+        self.assertTrue(after < before, 
+                        "%.1f bytes per node before, %.1f after" % (before, 
+                                                                    after))
+
+    def test_many_branches(self):
+        root_node = Node("feature")
+        for i in range(4000):
+            root_node.add_child("value %d" % i, Node("label %d" % i))
+        tree = Tree(root_node)
+        
+        self.assertEqual(tree.get_num_nodes(), 4001)
+        self.assertEqual(root_node.get_child("value 1234").get_value(), 
+                         "label 1234")
+        self.assertRaises(KeyError, root_node.get_child, "value 4000")
+        
+        # Each branch value is stored once in the codebook, and only one 
+        # tuple of codes is kept for the root.
+        bytes_per_node = tree.get_memory_usage() / float(tree.get_num_nodes())
+        self.assertTrue(bytes_per_node < 400)
+
+    def test_threshold_node_get_branch(self):
+        node = ThresholdNode("x", 2.5)
+        self.assertEqual(node.get_branch(2.5), "<= 2.5")
+        self.assertEqual(node.get_branch(3), "> 2.5")
+        self.assertIsNone(node.get_branch(float("nan")))
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -25,9 +25,10 @@ Unit tests for info_theory module.
 
 import unittest
 
+import numpy as np
 import pandas as pd
 
-from pml.tools.info_theory import entropy, info_gain
+from pml.tools.info_theory import entropy, info_gain, entropy_of_counts
 from pml.data.model import DataSet
 
 class InfoTheoryTest(unittest.TestCase):
@@ -57,6 +58,13 @@ class InfoTheoryTest(unittest.TestCase):
     def test_info_gain(self):
         dataset = self.create_example_dataset()
         self.assertAlmostEqual(info_gain("A", dataset), 0.311, places=3)
+
+    def test_entropy_of_counts(self):
+        self.assertAlmostEqual(entropy_of_counts([1, 3]), 0.811, places=3)
+        
+    def test_entropy_of_counts_table(self):
+        entropies = entropy_of_counts([[2, 2], [0, 5], [0, 0]])
+        np.testing.assert_allclose(entropies, [1, 0, 0])
     
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+# Copyright (C) 2013 David Rusk
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to 
+# deal in the Software without restriction, including without limitation the 
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or 
+# sell copies of the Software, and to permit persons to whom the Software is 
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in 
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR 
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, 
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE 
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER 
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING 
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS 
+# IN THE SOFTWARE.
+"""
+Unit tests for the spatial_index module.
+
+@author: drusk
+"""
+
+import unittest
+
+import numpy as np
+
+from pml.tools import spatial_index
+from pml.utils.distance_utils import euclidean
+
+class SpatialIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.data = random_state.uniform(0, 10, size=(200, 3))
+        self.queries = random_state.uniform(0, 10, size=(20, 3))
+        self.brute = spatial_index.BruteForceIndex(self.data)
+
+    def assert_same_neighbours(self, index, k, brute=None):
+        if brute is None:
+            brute = self.brute
+        expected_distances, expected_indices = brute.query(self.queries, k)
+        distances, indices = index.query(self.queries, k)
+        np.testing.assert_allclose(distances, expected_distances)
+        np.testing.assert_array_equal(indices, expected_indices)
+
+    def assert_same_radius_neighbours(self, index, radius):
+        expected_distances, expected_indices = self.brute.query_radius(
+                                                        self.queries, radius)
+        distances, indices = index.query_radius(self.queries, radius)
+        for row in range(len(self.queries)):
+            np.testing.assert_allclose(distances[row], 
+                                       expected_distances[row])
+            np.testing.assert_array_equal(indices[row], expected_indices[row])
+
+    def test_brute_force_query(self):
+        distances, indices = self.brute.query([[0, 0, 0]], 2)
+        self.assertEqual(indices.shape, (1, 2))
+        all_distances = [euclidean(point, [0, 0, 0]) for point in self.data]
+        self.assertEqual(indices[0, 0], np.argmin(all_distances))
+        self.assertAlmostEqual(distances[0, 0], min(all_distances))
+
+    def test_kd_tree_matches_brute_force(self):
+        index = spatial_index.KDTree(self.data, leaf_size=5)
+        self.assert_same_neighbours(index, 7)
+
+    def test_ball_tree_matches_brute_force(self):
+        index = spatial_index.BallTree(self.data, leaf_size=5)
+        self.assert_same_neighbours(index, 7)
+
+    def test_brute_force_query_radius(self):
+        distances, indices = self.brute.query_radius([[5, 5, 5], [50, 0, 0]], 
+                                                     2)
+        all_distances = np.array([euclidean(point, [5, 5, 5]) 
+                                  for point in self.data])
+        self.assertEqual(len(indices[0]), np.sum(all_distances <= 2))
+        self.assertTrue((np.diff(distances[0]) >= 0).all())
+        self.assertTrue((distances[0] <= 2).all())
+        self.assertEqual(len(indices[1]), 0)
+
+    def test_kd_tree_query_radius_matches_brute_force(self):
+        index = spatial_index.KDTree(self.data, leaf_size=5)
+        self.assert_same_radius_neighbours(index, 2.5)
+
+    def test_ball_tree_query_radius_matches_brute_force(self):
+        index = spatial_index.BallTree(self.data, leaf_size=5)
+        self.assert_same_radius_neighbours(index, 2.5)
+
+    def test_random_projection_forest_query_radius(self):
+        index = spatial_index.RandomProjectionForest(self.data, num_trees=1, 
+                                                     leaf_size=200)
+        self.assert_same_radius_neighbours(index, 2.5)
+
+    def test_kd_tree_other_metrics(self):
+        for metric in spatial_index.KD_TREE_METRICS:
+            brute = spatial_index.BruteForceIndex(self.data, metric)
+            index = spatial_index.KDTree(self.data, metric, leaf_size=5)
+            self.assert_same_neighbours(index, 4, brute)
+
+    def test_ball_tree_other_metrics(self):
+        VI = np.diag([1.0, 4.0, 0.5])
+        for metric, metric_params in [("manhattan", None), 
+                                      ("chebyshev", None), 
+                                      ("mahalanobis", {"VI": VI})]:
+            brute = spatial_index.BruteForceIndex(self.data, metric, 
+                                                  metric_params)
+            index = spatial_index.BallTree(self.data, metric, metric_params, 
+                                           leaf_size=5)
+            self.assert_same_neighbours(index, 4, brute)
+
+    def test_ball_tree_rejects_non_triangle_metrics(self):
+        self.assertRaises(ValueError, spatial_index.BallTree, self.data, 
+                          "cosine")
+
+    def test_create_index_auto_cosine(self):
+        index = spatial_index.create_index("auto", self.data, "cosine")
+        self.assertTrue(isinstance(index, spatial_index.BruteForceIndex))
+
+    def test_create_index_auto_drops_other_index_params(self):
+        index = spatial_index.create_index("auto", self.data, "cosine", 
+                                           leaf_size=5)
+        self.assertTrue(isinstance(index, spatial_index.BruteForceIndex))
+        
+        index = spatial_index.create_index("auto", self.data, leaf_size=5, 
+                                           memory_budget=1000)
+        self.assertTrue(isinstance(index, spatial_index.KDTree))
+        self.assertEqual(index.leaf_size, 5)
+        
+        self.assertRaises(TypeError, spatial_index.create_index, "auto", 
+                          self.data, "cosine", foo=5)
+
+    def test_create_index_auto_callable(self):
+        def distance(x, y):
+            return np.abs(x - y).sum()
+        
+        index = spatial_index.create_index("auto", self.data, distance)
+        self.assertTrue(isinstance(index, spatial_index.BruteForceIndex))
+        
+        index = spatial_index.create_index("auto", self.data, distance, 
+                                           triangle_inequality=True)
+        self.assertTrue(isinstance(index, spatial_index.BallTree))
+
+    def test_random_projection_forest_single_leaf_is_exact(self):
+        index = spatial_index.RandomProjectionForest(self.data, num_trees=1, 
+                                                     leaf_size=200)
+        self.assert_same_neighbours(index, 7)
+
+    def test_random_projection_forest_recall(self):
+        index = spatial_index.RandomProjectionForest(self.data, num_trees=20, 
+                                                     leaf_size=20, 
+                                                     random_state=1)
+        _, expected_indices = self.brute.query(self.queries, 5)
+        _, indices = index.query(self.queries, 5)
+        found = sum(len(np.intersect1d(row, expected_row)) 
+                    for row, expected_row in zip(indices, expected_indices))
+        self.assertTrue(float(found) / expected_indices.size > 0.8)
+
+    def test_random_projection_forest_too_few_candidates(self):
+        index = spatial_index.RandomProjectionForest(self.data, num_trees=1, 
+                                                     leaf_size=2)
+        distances, indices = index.query(self.queries[:1], 10)
+        self.assertEqual(indices.shape, (1, 10))
+        self.assertTrue((np.diff(distances[0]) >= 0).all())
+
+    def test_k_greater_than_num_points(self):
+        index = spatial_index.KDTree([[1, 1], [2, 2], [3, 3]])
+        distances, indices = index.query([[0, 0]], 5)
+        np.testing.assert_array_equal(indices, [[0, 1, 2]])
+
+    def test_timings_recorded(self):
+        index = spatial_index.BallTree(self.data)
+        index.query(self.queries, 3)
+        timings = index.get_timings()
+        self.assertEqual(timings["num_queries"], 20)
+        self.assertTrue(timings["build_time"] >= 0)
+        self.assertTrue(timings["query_time"] >= 0)
+
+    def test_create_index_auto(self):
+        index = spatial_index.create_index("auto", self.data)
+        self.assertTrue(isinstance(index, spatial_index.KDTree))
+
+    def test_create_index_auto_high_dimensions(self):
+        data = np.zeros((5, spatial_index.KD_TREE_MAX_DIMENSIONS + 1))
+        index = spatial_index.create_index("auto", data)
+        self.assertTrue(isinstance(index, spatial_index.BallTree))
+
+    def test_create_unknown_index(self):
+        self.assertRaises(ValueError, spatial_index.create_index, "foo", 
+                          self.data)
+
+    def test_kd_tree_rejects_other_metrics(self):
+        self.assertRaises(ValueError, spatial_index.KDTree, self.data, 
+                          metric=lambda x, y: 0)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -126,6 +126,28 @@ class ClusteringTest(unittest.TestCase):
                                             6: 1, 7: 1, 8: 1, 9: 2, 10: 2, 
                                             11: 2, 12: 2}))
     
+    def test_get_distances_to_centroids_by_name(self):
+        dataset = DataSet([[1, 5], [2, 1], [6, 5]])
+        centroids = [pd.Series([4, 5]), pd.Series([6, 2])]
+        
+        results = clustering._get_distances_to_centroids(dataset, centroids,
+                                                         "manhattan")
+        assert_that(results, 
+                    equals_dataframe([[3, 8], [6, 5], [2, 3]]))
+    
+    def test_kmeans_callable_distance(self):
+        def manhattan(vector1, vector2):
+            return sum(abs(vector1 - vector2))
+        
+        dataset = DataSet([[3, 13], [5, 13], [2, 11], [8, 5], [5, 3], 
+                           [6, 2]])
+        preset_centroids = [pd.Series([4, 9]), pd.Series([10, 6])]
+        
+        clustered = clustering.kmeans(dataset, k=2, distance=manhattan, 
+                                      centroids=preset_centroids)
+        assert_that(clustered.get_cluster_assignments(), 
+                    equals_series({0: 0, 1: 0, 2: 0, 3: 1, 4: 1, 5: 1}))
+    
     def test_calculate_purity(self):
         # use example from http://nlp.stanford.edu/IR-book/html/htmledition/
         # evaluation-of-clustering-1.html
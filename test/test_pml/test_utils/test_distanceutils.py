@@ -25,9 +25,21 @@ Unit tests for the distance_utils module.
 
 import unittest
 
+import numpy as np
+
 from pml.utils.distance_utils import euclidean
 from pml.utils.distance_utils import cosine_similarity
 from pml.utils.distance_utils import cosine_distance
+from pml.utils.distance_utils import pairwise_euclidean
+from pml.utils.distance_utils import iter_pairwise_blocks
+from pml.utils.distance_utils import chunked_k_nearest
+from pml.utils.distance_utils import chunked_radius_neighbours
+from pml.utils.distance_utils import chunked_argmin
+from pml.utils.distance_utils import nearest_indices
+from pml.utils.distance_utils import pairwise_distances
+from pml.utils.distance_utils import inverse_covariance
+from pml.utils.distance_utils import prepare_metric_params
+from pml.utils import distance_utils
 
 class DistutilsTest(unittest.TestCase):
 
@@ -106,6 +118,200 @@ class DistutilsTest(unittest.TestCase):
         distance = cosine_distance(vector1, vector2)
         self.assertAlmostEqual(distance, 0.0, delta=self.delta)
 
+    def test_pairwise_euclidean(self):
+        matrix1 = [[9, 6], [-12, 2]]
+        matrix2 = [[5, 3], [6, -5], [9, 6]]
+        distances = pairwise_euclidean(matrix1, matrix2)
+        self.assertEqual(distances.shape, (2, 3))
+        for i, vector1 in enumerate(matrix1):
+            for j, vector2 in enumerate(matrix2):
+                self.assertAlmostEqual(distances[i, j], 
+                                       euclidean(vector1, vector2), 
+                                       delta=self.delta)
+
+
+    def assert_matches_vector_function(self, metric, function, 
+                                       metric_params=None):
+        random_state = np.random.RandomState(2)
+        matrix1 = random_state.normal(size=(6, 3))
+        matrix2 = random_state.normal(size=(5, 3))
+        distances = pairwise_distances(matrix1, matrix2, metric, 
+                                       metric_params)
+        for i, vector1 in enumerate(matrix1):
+            for j, vector2 in enumerate(matrix2):
+                self.assertAlmostEqual(distances[i, j], 
+                                       function(vector1, vector2), 
+                                       delta=self.delta)
+
+    def test_pairwise_metrics(self):
+        def manhattan(vector1, vector2):
+            return np.sum(np.abs(vector1 - vector2))
+        
+        def chebyshev(vector1, vector2):
+            return np.max(np.abs(vector1 - vector2))
+        
+        def minkowski_3(vector1, vector2):
+            return np.sum(np.abs(vector1 - vector2) ** 3) ** (1.0 / 3)
+        
+        def squared_euclidean(vector1, vector2):
+            return euclidean(vector1, vector2) ** 2
+        
+        self.assert_matches_vector_function("euclidean", euclidean)
+        self.assert_matches_vector_function("sqeuclidean", squared_euclidean)
+        self.assert_matches_vector_function("manhattan", manhattan)
+        self.assert_matches_vector_function("chebyshev", chebyshev)
+        self.assert_matches_vector_function("minkowski", minkowski_3, 
+                                            {"p": 3})
+        self.assert_matches_vector_function("cosine", cosine_distance)
+
+    def test_pairwise_mahalanobis(self):
+        VI = np.array([[2.0, 0.5, 0], [0.5, 1.0, 0], [0, 0, 3.0]])
+        
+        def mahalanobis(vector1, vector2):
+            difference = vector1 - vector2
+            return np.sqrt(np.dot(np.dot(difference, VI), difference))
+        
+        self.assert_matches_vector_function("mahalanobis", mahalanobis, 
+                                            {"VI": VI})
+
+    def test_pairwise_mahalanobis_singular(self):
+        # The covariance is singular because the second feature is constant.
+        VI = inverse_covariance([[1, 5, 2], [2, 5, 0], [4, 5, 1], [3, 5, 3]])
+        
+        def mahalanobis(vector1, vector2):
+            difference = vector1 - vector2
+            return np.sqrt(max(np.dot(np.dot(difference, VI), difference), 
+                               0))
+        
+        self.assert_matches_vector_function("mahalanobis", mahalanobis, 
+                                            {"VI": VI})
+
+    def test_prepare_mahalanobis_params(self):
+        VI = np.array([[2.0, 0.5], [0.5, 1.0]])
+        params = prepare_metric_params("mahalanobis", {"VI": VI})
+        self.assertEqual(list(params.keys()), ["transform"])
+        self.assertEqual(prepare_metric_params("mahalanobis", params), params)
+        self.assertEqual(prepare_metric_params("minkowski", {"p": 3}), 
+                         {"p": 3})
+        
+        matrix1 = [[1, 2], [3, 1]]
+        matrix2 = [[0, 0], [2, 5], [1, 1]]
+        np.testing.assert_allclose(
+                pairwise_distances(matrix1, matrix2, "mahalanobis", params), 
+                pairwise_distances(matrix1, matrix2, "mahalanobis", 
+                                   {"VI": VI}))
+
+    def test_iter_pairwise_blocks_prepares_params_once(self):
+        calls = []
+        original = distance_utils.mahalanobis_transform
+        def counting_transform(VI):
+            calls.append(VI)
+            return original(VI)
+        
+        distance_utils.mahalanobis_transform = counting_transform
+        try:
+            blocks = list(iter_pairwise_blocks(
+                                np.arange(20.0).reshape(10, 2), 
+                                np.arange(14.0).reshape(7, 2), 
+                                memory_budget=64, metric="mahalanobis", 
+                                metric_params={"VI": np.eye(2)}))
+        finally:
+            distance_utils.mahalanobis_transform = original
+        
+        self.assertTrue(len(blocks) > 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_pairwise_cosine_zero_vector(self):
+        distances = pairwise_distances([[0, 0]], [[1, 2]], "cosine")
+        self.assertAlmostEqual(distances[0, 0], 1.0)
+        distances = pairwise_distances([[0, 0], [2, 4]], 
+                                       [[1, 2], [0, 0], [-2, 1]], "cosine")
+        np.testing.assert_allclose(distances, [[1, 1, 1], [0, 1, 1]], 
+                                   atol=1e-12)
+
+    def test_pairwise_callable_fallback(self):
+        def first_feature(vector1, vector2):
+            return abs(vector1[0] - vector2[0])
+        
+        self.assert_matches_vector_function(first_feature, first_feature)
+
+    def test_pairwise_unknown_metric(self):
+        self.assertRaises(ValueError, pairwise_distances, [[1]], [[2]], 
+                          "foo")
+
+    def test_inverse_covariance(self):
+        matrix = [[1, 2], [2, 1], [3, 5], [4, 3]]
+        expected = np.linalg.inv(np.cov(np.array(matrix).T))
+        np.testing.assert_allclose(inverse_covariance(matrix), expected)
+
+    def test_iter_pairwise_blocks_within_budget(self):
+        matrix1 = np.arange(20.0).reshape(10, 2)
+        matrix2 = np.arange(14.0).reshape(7, 2)
+        expected = pairwise_euclidean(matrix1, matrix2)
+        
+        combined = np.zeros(expected.shape)
+        for rows, columns, block in iter_pairwise_blocks(matrix1, matrix2, 
+                                                         memory_budget=64):
+            self.assertTrue(block.size <= 4)
+            combined[rows, columns] = block
+            
+        np.testing.assert_allclose(combined, expected)
+
+    def test_chunked_k_nearest(self):
+        random_state = np.random.RandomState(0)
+        matrix1 = random_state.rand(15, 3)
+        matrix2 = random_state.rand(40, 3)
+        distances, indices = chunked_k_nearest(matrix1, matrix2, 4, 
+                                               memory_budget=16 * 30)
+        
+        expected = pairwise_euclidean(matrix1, matrix2)
+        expected_indices = np.argsort(expected, axis=1)[:, :4]
+        np.testing.assert_array_equal(indices, expected_indices)
+        np.testing.assert_allclose(distances, np.sort(expected, axis=1)[:, :4])
+
+    def test_chunked_k_nearest_other_metric(self):
+        random_state = np.random.RandomState(0)
+        matrix1 = random_state.rand(15, 3)
+        matrix2 = random_state.rand(40, 3)
+        _, indices = chunked_k_nearest(matrix1, matrix2, 4, 
+                                       memory_budget=16 * 30, 
+                                       metric="manhattan")
+        
+        expected = pairwise_distances(matrix1, matrix2, "manhattan")
+        np.testing.assert_array_equal(indices, 
+                                      np.argsort(expected, axis=1)[:, :4])
+
+    def test_chunked_radius_neighbours(self):
+        random_state = np.random.RandomState(0)
+        matrix1 = random_state.rand(15, 3)
+        matrix2 = random_state.rand(40, 3)
+        distances, indices = chunked_radius_neighbours(matrix1, matrix2, 0.4, 
+                                                       memory_budget=16 * 30)
+        
+        expected = pairwise_euclidean(matrix1, matrix2)
+        for row in range(15):
+            within = np.nonzero(expected[row] <= 0.4)[0]
+            expected_indices = within[np.argsort(expected[row, within])]
+            np.testing.assert_array_equal(indices[row], expected_indices)
+            np.testing.assert_allclose(distances[row], 
+                                       expected[row, expected_indices])
+
+    def test_chunked_argmin(self):
+        random_state = np.random.RandomState(1)
+        matrix1 = random_state.rand(25, 2)
+        matrix2 = random_state.rand(9, 2)
+        indices, distances = chunked_argmin(matrix1, matrix2, 
+                                            memory_budget=16 * 4)
+        
+        expected = pairwise_euclidean(matrix1, matrix2)
+        np.testing.assert_array_equal(indices, np.argmin(expected, axis=1))
+        np.testing.assert_allclose(distances, np.min(expected, axis=1))
+
+    def test_nearest_indices(self):
+        distances = np.array([[5, 1, 3, 2], [0, 9, 8, 7]])
+        np.testing.assert_array_equal(nearest_indices(distances, 2), 
+                                      [[1, 3], [0, 3]])
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']